@@ -0,0 +1,55 @@
+"""Gunicorn configuration, loaded by ``gunicorn`` from the project root.
+
+SERVER_INTERFACE picks WSGI (sync views, preforked workers with optional
+threads) or ASGI (uvicorn workers, one event loop per worker). Workers
+default to ``2 * CPUs + 1`` for WSGI, where they block on I/O, and to
+one per CPU for ASGI. WEB_CONCURRENCY overrides the count.
+"""
+import multiprocessing
+import os
+import glob
+import tempfile
+
+interface = os.environ.get("SERVER_INTERFACE", "wsgi")
+cpus = multiprocessing.cpu_count()
+
+if interface == "asgi":
+    wsgi_app = "social_media_api.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.environ.get("WEB_CONCURRENCY") or cpus)
+elif interface == "wsgi":
+    wsgi_app = "social_media_api.wsgi:application"
+    # More than one thread switches to the gthread worker; every thread
+    # keeps its own persistent database connection
+    threads = int(os.environ.get("GUNICORN_THREADS") or 1)
+    workers = int(os.environ.get("WEB_CONCURRENCY") or 2 * cpus + 1)
+else:
+    raise ValueError(f"Unknown SERVER_INTERFACE {interface!r}")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+# Import the project once in the master, workers fork with it loaded.
+# No database connection is opened at import time, none is shared.
+preload_app = True
+# Recycle workers now and then to bound slow memory growth, the jitter
+# keeps them from restarting all at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10_000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+# Workers write their request metrics there for /metrics to sum, see
+# social_media_api/metrics.py. Exported before the app is loaded.
+metrics_dir = os.environ.setdefault(
+    "METRICS_MULTIPROCESS_DIR",
+    os.path.join(tempfile.gettempdir(), "social-media-api-metrics"),
+)
+
+
+def on_starting(server):
+    """Drops the metrics of the previous run of the server"""
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+        os.remove(path)
@@ -0,0 +1,77 @@
+"""Reference counting of content-addressed media files.
+
+Every name stored in a registered image field or its renditions holds
+one reference to its ``Blob``. Fields acquire references when they get
+a new file and release them when the file is replaced or the row is
+deleted. Unreferenced blobs are only deleted after a grace period, as a
+new upload of the same content may be about to reference them again.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from media.models import Blob
+
+DEFAULTS = {
+    "GRACE_PERIOD": 60 * 60,
+    "INTERVAL": 10 * 60,
+}
+
+
+def gc_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "MEDIA_GC", {})}
+
+
+def references(name, renditions) -> list[str]:
+    """Names of the files used by an image field and its renditions"""
+    names = [name] if name else []
+    for by_width in (renditions or {}).values():
+        names.extend(by_width.values())
+    return names
+
+
+def change_refcounts(names, delta: int) -> None:
+    by_count = {}
+    for name, count in Counter(names).items():
+        by_count.setdefault(count, []).append(name)
+    for count, group in by_count.items():
+        Blob.objects.filter(name__in=group).update(
+            refcount=F("refcount") + count * delta,
+            updated_at=timezone.now(),
+        )
+
+
+def acquire(names) -> None:
+    change_refcounts(names, 1)
+
+
+def release(names) -> None:
+    change_refcounts(names, -1)
+
+
+def collect_garbage(grace_period: int = None) -> int:
+    """Deletes blobs nothing referenced for ``grace_period`` seconds and
+    returns how many were deleted"""
+    if grace_period is None:
+        grace_period = gc_settings()["GRACE_PERIOD"]
+    cutoff = timezone.now() - timedelta(seconds=grace_period)
+
+    deleted = 0
+    candidates = Blob.objects.filter(refcount__lte=0, updated_at__lte=cutoff)
+    for blob_id in candidates.values_list("id", flat=True).iterator():
+        with transaction.atomic():
+            blob = (
+                candidates.select_for_update().filter(id=blob_id).first()
+            )
+            if blob is None:
+                continue
+            default_storage.delete(blob.name)
+            blob.delete()
+            deleted += 1
+
+    return deleted
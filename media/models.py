@@ -0,0 +1,100 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+IMAGE_NONE = "none"
+IMAGE_PENDING = "pending"
+IMAGE_READY = "ready"
+IMAGE_FAILED = "failed"
+IMAGE_STATUS_CHOICES = (
+    (IMAGE_NONE, "No image"),
+    (IMAGE_PENDING, "Pending"),
+    (IMAGE_READY, "Ready"),
+    (IMAGE_FAILED, "Failed"),
+)
+
+
+class ImageJob(models.Model):
+    """An uploaded image waiting to be validated and rendered.
+
+    ``source`` is the file name the field had when the job was queued:
+    if the field holds another file by the time the job runs, the job
+    is outdated and its results are thrown away.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    field = models.CharField(max_length=50)
+    source = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="image_job_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} {self.field}: {self.status}"
+
+
+class Upload(models.Model):
+    """A resumable upload, streamed chunk by chunk into a staging file
+    under ``MEDIA_ROOT`` until it is attached to a post or avatar"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="uploads",
+        on_delete=models.CASCADE,
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.id}: {self.received}/{self.size} bytes"
+
+
+class Blob(models.Model):
+    """A file of the content-addressed media storage.
+
+    ``refcount`` counts the image fields and renditions using the file.
+    Blobs without references are deleted by ``collect_garbage`` once
+    they were left alone for ``MEDIA_GC["GRACE_PERIOD"]`` seconds.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["refcount", "updated_at"], name="blob_refcount_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
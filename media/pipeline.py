@@ -0,0 +1,315 @@
+"""Off-request processing of uploaded images.
+
+Saving a registered image field with a new file marks it ``pending`` and
+queues an ``ImageJob``. ``manage.py process_images`` claims the jobs and
+hands the bytes to a process pool, where Pillow validates the upload,
+strips its metadata and renders it at every width of ``IMAGES["WIDTHS"]``
+in every format of ``IMAGES["FORMATS"]``. The rendition names are then
+stored on the owner row in ``<field>_renditions``.
+"""
+import io
+import os
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from media.blobs import acquire, references, release
+from media.models import (
+    IMAGE_FAILED,
+    IMAGE_NONE,
+    IMAGE_PENDING,
+    IMAGE_READY,
+    ImageJob,
+)
+
+DEFAULTS = {
+    "WIDTHS": [320, 640, 1280],
+    "FORMATS": ["webp", "jpeg"],
+    "QUALITY": 80,
+    "MAX_PIXELS": 40_000_000,
+    "WORKERS": 2,
+    "BATCH_SIZE": 10,
+    "POLL_INTERVAL": 1,
+    "MAX_ATTEMPTS": 3,
+    "STALE_AFTER": 600,
+}
+
+# Formats Pillow reads but cannot write back as they are
+SAVE_FORMATS = {"MPO": "JPEG"}
+
+# Sent once the renditions of ``sender.<field>`` of row ``object_id``
+# are stored, or the upload was rejected. The row is updated in place,
+# so no ``post_save`` is sent.
+image_processed = Signal()
+
+
+# ``(model, field)`` of every registered image field
+IMAGE_FIELDS = []
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def image_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "IMAGES", {})}
+
+
+def register_image_field(model, field: str) -> None:
+    """Processes new files of ``model.<field>`` in the background and
+    counts the references to its files. The model needs
+    ``<field>_status`` and ``<field>_renditions`` columns."""
+    IMAGE_FIELDS.append((model, field))
+    status_field = f"{field}_status"
+    renditions_field = f"{field}_renditions"
+
+    def mark_pending(sender, instance, **kwargs):
+        file = getattr(instance, field)
+        uploaded = bool(file) and not file._committed
+        cleared = not file and getattr(instance, status_field) != IMAGE_NONE
+        if not (uploaded or cleared):
+            return
+
+        # Only now the previous files are looked up, to release them
+        if instance.pk is not None:
+            previous = (
+                model._base_manager.filter(pk=instance.pk)
+                .values_list(field, renditions_field)
+                .first()
+            )
+            if previous:
+                changes = instance.__dict__.setdefault("_image_changes", {})
+                changes[field] = references(*previous)
+
+        setattr(instance, renditions_field, {})
+        if uploaded:
+            setattr(instance, status_field, IMAGE_PENDING)
+            instance.__dict__.setdefault("_queued_images", set()).add(field)
+        else:
+            setattr(instance, status_field, IMAGE_NONE)
+
+    def queue_job(sender, instance, **kwargs):
+        released = instance.__dict__.get("_image_changes", {}).pop(field, [])
+        queued = instance.__dict__.get("_queued_images", set())
+        if field in queued:
+            queued.discard(field)
+            name = getattr(instance, field).name
+            acquire([name])
+            ImageJob.objects.create(
+                model=model._meta.label_lower,
+                object_id=instance.pk,
+                field=field,
+                source=name,
+            )
+        release(released)
+
+    def release_files(sender, instance, **kwargs):
+        release(
+            references(
+                getattr(instance, field).name,
+                getattr(instance, renditions_field),
+            )
+        )
+
+    uid = f"media.{model._meta.label_lower}.{field}"
+    pre_save.connect(
+        mark_pending, sender=model, weak=False, dispatch_uid=uid
+    )
+    post_save.connect(queue_job, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(
+        release_files, sender=model, weak=False, dispatch_uid=uid
+    )
+
+
+def encode(image, image_format: str, quality: int) -> bytes:
+    image_format = SAVE_FORMATS.get(image_format.upper(), image_format)
+    if image_format.upper() == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def render(data: bytes, config: dict):
+    """Validates an uploaded image and returns ``(original, renditions)``:
+    the original re-encoded without EXIF and other metadata, and
+    ``{(format, width): bytes}``. Runs in worker
+    processes, so it only deals with bytes."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > config["MAX_PIXELS"]:
+            raise InvalidImage(
+                f"Image has more than {config['MAX_PIXELS']} pixels."
+            )
+        image.load()
+    except InvalidImage:
+        raise
+    except (
+        OSError, SyntaxError, ValueError, Image.DecompressionBombError
+    ) as error:
+        raise InvalidImage(f"Invalid image: {error}") from error
+
+    source_format = image.format
+    # Apply the EXIF orientation before the EXIF data is dropped
+    image = ImageOps.exif_transpose(image)
+    original = encode(image, source_format, quality=95)
+
+    renditions = {}
+    widths = {min(width, image.width) for width in config["WIDTHS"]}
+    for width in sorted(widths):
+        resized = image
+        if width != image.width:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.LANCZOS)
+        for image_format in config["FORMATS"]:
+            renditions[(image_format, width)] = encode(
+                resized, image_format, config["QUALITY"]
+            )
+
+    return original, renditions
+
+
+def rendition_name(source: str, image_format: str, width: int) -> str:
+    directory, filename = os.path.split(source)
+    stem, _ = os.path.splitext(filename)
+    extension = "jpg" if image_format.lower() == "jpeg" else image_format
+    return os.path.join(
+        directory, "renditions", f"{stem}-{width}.{extension.lower()}"
+    )
+
+
+def claim_jobs(limit: int) -> list[ImageJob]:
+    """Marks up to ``limit`` pending jobs as processing and returns them.
+    Jobs of a worker that died while processing are retried."""
+    config = image_settings()
+    stale = timezone.now() - timedelta(seconds=config["STALE_AFTER"])
+    with transaction.atomic():
+        job_ids = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ImageJob.STATUS_PENDING)
+                | Q(status=ImageJob.STATUS_PROCESSING, updated_at__lt=stale)
+            )
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+        ImageJob.objects.filter(id__in=job_ids).update(
+            status=ImageJob.STATUS_PROCESSING,
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+    return list(ImageJob.objects.filter(id__in=job_ids).order_by("id"))
+
+
+def owner_rows(job):
+    """The owner row, as long as it still holds the job's file"""
+    model = apps.get_model(job.model)
+    return model, model.objects.filter(
+        pk=job.object_id, **{job.field: job.source}
+    )
+
+
+def finish_job(job, status, error=""):
+    job.status = status
+    job.error = error
+    job.save(update_fields=["status", "error", "updated_at"])
+
+
+def store_renditions(job, result) -> None:
+    original, renditions = result
+    model, owner = owner_rows(job)
+
+    names = {}
+    for (image_format, width), content in renditions.items():
+        name = default_storage.save(
+            rendition_name(job.source, image_format, width),
+            ContentFile(content),
+        )
+        names.setdefault(image_format, {})[str(width)] = name
+
+    # Replace the upload with its copy without metadata. Files of an
+    # outdated job stay unreferenced and are garbage-collected.
+    source = default_storage.save(job.source, ContentFile(original))
+    with transaction.atomic():
+        updated = owner.update(
+            **{
+                job.field: source,
+                f"{job.field}_status": IMAGE_READY,
+                f"{job.field}_renditions": names,
+            }
+        )
+        if updated:
+            acquire(references(source, names))
+            release([job.source])
+
+    if updated:
+        image_processed.send(
+            sender=model, object_id=job.object_id, field=job.field
+        )
+
+
+def reject_image(job, error: str) -> None:
+    model, owner = owner_rows(job)
+    with transaction.atomic():
+        updated = owner.update(
+            **{job.field: "", f"{job.field}_status": IMAGE_FAILED}
+        )
+        if updated:
+            release([job.source])
+    if updated:
+        image_processed.send(
+            sender=model, object_id=job.object_id, field=job.field
+        )
+    finish_job(job, ImageJob.STATUS_FAILED, error)
+
+
+def process_pending(executor=None) -> int:
+    """Processes one batch of jobs, rendering in ``executor`` when given.
+    Returns the number of jobs claimed."""
+    config = image_settings()
+    jobs = claim_jobs(config["BATCH_SIZE"])
+
+    work = []
+    for job in jobs:
+        if not owner_rows(job)[1].exists():
+            finish_job(job, ImageJob.STATUS_DONE, "Outdated upload.")
+            continue
+        try:
+            with default_storage.open(job.source, "rb") as file:
+                data = file.read()
+        except OSError as error:
+            reject_image(job, f"Cannot read upload: {error}")
+            continue
+        if executor is None:
+            work.append((job, None, data))
+        else:
+            work.append((job, executor.submit(render, data, config), data))
+
+    for job, future, data in work:
+        try:
+            result = future.result() if future else render(data, config)
+            store_renditions(job, result)
+        except InvalidImage as error:
+            reject_image(job, str(error))
+        except Exception as error:
+            if job.attempts >= config["MAX_ATTEMPTS"]:
+                reject_image(job, repr(error))
+            else:
+                job.status = ImageJob.STATUS_PENDING
+                job.error = repr(error)
+                job.save(update_fields=["status", "error", "updated_at"])
+        else:
+            finish_job(job, ImageJob.STATUS_DONE)
+
+    return len(jobs)
@@ -0,0 +1,51 @@
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from media.models import Upload
+
+
+class SrcsetField(serializers.Field):
+    """``{format: {width: url}}`` of the renditions of an image, read
+    from its ``<field>_renditions`` column"""
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, renditions):
+        request = self.context.get("request")
+        srcset = {}
+        for image_format, names in renditions.items():
+            srcset[image_format] = {}
+            for width, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                srcset[image_format][width] = url
+        return srcset
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source="received", read_only=True)
+
+    class Meta:
+        model = Upload
+        fields = ("id", "filename", "size", "offset", "created_at")
+        read_only_fields = ("id", "created_at")
+        extra_kwargs = {"size": {"min_value": 1}}
+
+
+class CompleteUploadSerializer(serializers.Serializer):
+    TARGET_POST = "post"
+    TARGET_AVATAR = "avatar"
+
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$")
+    target = serializers.ChoiceField(choices=(TARGET_POST, TARGET_AVATAR))
+    post = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        if attrs["target"] == self.TARGET_POST and "post" not in attrs:
+            raise serializers.ValidationError(
+                {"post": "The post to attach the image to is required."}
+            )
+        return attrs
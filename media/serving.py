@@ -0,0 +1,205 @@
+"""Serving of uploaded media.
+
+Django decides whether a file may be served; sending it is offloaded to
+the web server when ``MEDIA_SERVING["MODE"]`` is ``x-accel-redirect``
+(nginx) or ``x-sendfile`` (Apache, lighttpd). In the default ``django``
+mode a ``FileResponse`` streams the file, which WSGI servers send with
+``sendfile``, and single byte ranges are answered with 206.
+
+Content-addressed blobs never change, so they are cached as immutable.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import (
+    ImproperlyConfigured,
+    SuspiciousFileOperation,
+)
+from django.http import FileResponse, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.module_loading import import_string
+
+from media.models import Blob, ImageJob
+from media.storage import BLOB_DIR
+from media.uploads import upload_settings
+
+DEFAULTS = {
+    "MODE": "django",
+    "INTERNAL_URL": "/protected-media/",
+    "PERMISSION": "media.serving.is_servable",
+    "MAX_AGE": 365 * 24 * 60 * 60,
+    "LEGACY_MAX_AGE": 60 * 60,
+}
+
+MODES = ("django", "x-accel-redirect", "x-sendfile")
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def serving_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "MEDIA_SERVING", {})}
+
+
+def is_processing(name: str) -> bool:
+    """Whether ``name`` is an uploaded image the pipeline has not
+    stripped of its metadata (EXIF, GPS position) yet"""
+    return ImageJob.objects.filter(
+        status__in=(ImageJob.STATUS_PENDING, ImageJob.STATUS_PROCESSING),
+        source=name,
+    ).exists()
+
+
+def is_servable(request, name: str) -> bool:
+    """Files being uploaded are private, blobs are only served while a
+    post or user references them, and images only once processed"""
+    private = (
+        f"{upload_settings()['STAGING_DIR']}/",
+        f"{BLOB_DIR}/incoming/",
+    )
+    if name.startswith(private) or is_processing(name):
+        return False
+    if name.startswith(f"{BLOB_DIR}/"):
+        return Blob.objects.filter(name=name, refcount__gt=0).exists()
+    return True
+
+
+def media_path(name: str) -> str | None:
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """``(start, end)`` of a single ``bytes=`` range, end exclusive, or
+    ``None`` to send the whole file"""
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+class FileRange:
+    """``length`` bytes of an open file from its current position. It
+    keeps ``fileno``, so WSGI servers still use ``sendfile`` and stop
+    at the ``Content-Length``."""
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def validators(name: str, stat) -> tuple[str, str]:
+    """``(ETag, Cache-Control)`` of a media file. Blob names are content
+    hashes, legacy files are revalidated after ``LEGACY_MAX_AGE``."""
+    config = serving_settings()
+    if name.startswith(f"{BLOB_DIR}/"):
+        digest, _ = os.path.splitext(os.path.basename(name))
+        return (
+            quote_etag(digest),
+            f"public, max-age={config['MAX_AGE']}, immutable",
+        )
+    return (
+        quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}"),
+        f"public, max-age={config['LEGACY_MAX_AGE']}",
+    )
+
+
+def offload_response(name: str, path: str, mode: str) -> HttpResponse:
+    content_type, _ = mimetypes.guess_type(name)
+    response = HttpResponse(content_type=content_type)
+    if mode == "x-accel-redirect":
+        internal_url = serving_settings()["INTERNAL_URL"].rstrip("/")
+        response["X-Accel-Redirect"] = f"{internal_url}/{name}"
+    else:
+        response["X-Sendfile"] = path
+    return response
+
+
+def file_response(request, path: str, etag: str) -> HttpResponse:
+    size = os.path.getsize(path)
+    range_header = request.headers.get("Range")
+    if request.headers.get("If-Range", etag) != etag:
+        # The client's partial copy is outdated, it needs the whole file
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    file = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start), status=206)
+        response["Content-Length"] = str(end - start)
+        response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    content_type, _ = mimetypes.guess_type(path)
+    response["Content-Type"] = content_type or "application/octet-stream"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve(request, name: str) -> HttpResponse | None:
+    """Response sending the media file ``name``, ``None`` if there is no
+    such file or it may not be served"""
+    config = serving_settings()
+    if config["MODE"] not in MODES:
+        raise ImproperlyConfigured(
+            f"MEDIA_SERVING['MODE'] must be one of {', '.join(MODES)}."
+        )
+    path = media_path(name)
+    permission = import_string(config["PERMISSION"])
+    if path is None or not permission(request, name):
+        return None
+
+    stat = os.stat(path)
+    etag, cache_control = validators(name, stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        if config["MODE"] == "django":
+            response = file_response(request, path, etag)
+        else:
+            response = offload_response(name, path, config["MODE"])
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from media.models import Blob
+
+BLOB_DIR = "blobs"
+
+
+def blob_name(digest: str, name: str) -> str:
+    _, extension = os.path.splitext(name)
+    return os.path.join(
+        BLOB_DIR, digest[:2], digest[2:4], f"{digest}{extension.lower()}"
+    )
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores every file once, named after the SHA-256 of its content.
+
+    The requested name only contributes its extension. Saving content
+    that is already stored returns the existing name, and every stored
+    file gets a ``Blob`` row for reference counting.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        incoming = self.path(os.path.join(BLOB_DIR, "incoming"))
+        os.makedirs(incoming, exist_ok=True)
+
+        # Hash while copying to a temporary file: one pass, in chunks
+        digest = hashlib.sha256()
+        size = 0
+        fd, temporary_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+
+            name = blob_name(digest.hexdigest(), name)
+            # Claim the blob first, so that garbage collection leaves it
+            # alone from here on
+            if not Blob.objects.filter(name=name).update(
+                updated_at=timezone.now()
+            ):
+                Blob.objects.get_or_create(name=name, defaults={"size": size})
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temporary_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+                os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        return name
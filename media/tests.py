@@ -0,0 +1,574 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from media.blobs import collect_garbage
+from media.models import Blob, ImageJob, Upload
+from media.pipeline import process_pending
+from media.uploads import append_chunk
+from post.models import Post
+
+POST_URL = reverse("post:post-list")
+UPLOAD_URL = reverse("media:upload-create")
+
+IMAGES = {"WIDTHS": [32, 64, 128], "FORMATS": ["webp", "jpeg"]}
+
+
+def detail_url(post_id):
+    return reverse("post:post-detail", args=[post_id])
+
+
+def upload_url(upload_id):
+    return reverse("media:upload", args=[upload_id])
+
+
+def complete_url(upload_id):
+    return reverse("media:upload-complete", args=[upload_id])
+
+
+def sample_user(email, **params):
+    return get_user_model().objects.create_user(
+        email, "password123", username=email.split("@")[0], **params
+    )
+
+
+def sample_image(size=(100, 50), image_format="JPEG", exif=None):
+    buffer = io.BytesIO()
+    image = Image.new("RGB", size, color=(200, 30, 30))
+    params = {"exif": exif} if exif is not None else {}
+    image.save(buffer, format=image_format, **params)
+    return SimpleUploadedFile(
+        f"photo.{image_format.lower()}",
+        buffer.getvalue(),
+        content_type=f"image/{image_format.lower()}",
+    )
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGES=IMAGES
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.user = sample_user("author@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_post(self, image):
+        return self.client.post(
+            POST_URL,
+            {"title": "Photo", "content": "content", "image": image},
+            format="multipart",
+        )
+
+    def test_upload_returns_pending_and_queues_job(self):
+        res = self.create_post(sample_image())
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data["image_status"], "pending")
+        self.assertEqual(res.data["image_srcset"], {})
+        job = ImageJob.objects.get()
+        self.assertEqual(job.object_id, res.data["id"])
+        self.assertEqual(job.field, "image")
+
+    def test_worker_renders_renditions_without_upscaling(self):
+        post_id = self.create_post(sample_image(size=(100, 50))).data["id"]
+        self.client.get(detail_url(post_id))
+
+        self.assertEqual(process_pending(), 1)
+
+        res = self.client.get(detail_url(post_id))
+        self.assertEqual(res.data["image_status"], "ready")
+        srcset = res.data["image_srcset"]
+        self.assertEqual(set(srcset), {"webp", "jpeg"})
+        self.assertEqual(set(srcset["webp"]), {"32", "64", "100"})
+        self.assertTrue(srcset["jpeg"]["64"].startswith("http://testserver"))
+
+        post = Post.objects.get(id=post_id)
+        with default_storage.open(post.image_renditions["webp"]["64"]) as f:
+            rendition = Image.open(f)
+            self.assertEqual(rendition.format, "WEBP")
+            self.assertEqual(rendition.size, (64, 32))
+        self.assertEqual(
+            ImageJob.objects.get().status, ImageJob.STATUS_DONE
+        )
+
+    def test_worker_strips_exif(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        post_id = self.create_post(sample_image(exif=exif)).data["id"]
+
+        process_pending()
+
+        post = Post.objects.get(id=post_id)
+        with post.image.open() as f:
+            self.assertFalse(Image.open(f).getexif())
+
+    def test_invalid_upload_is_rejected(self):
+        post = Post.objects.create(
+            title="Broken", content="content", author=self.user
+        )
+        post.image = SimpleUploadedFile("broken.jpg", b"not an image")
+        post.save()
+        name = post.image.name
+
+        process_pending()
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_status, "failed")
+        self.assertFalse(post.image)
+        self.assertEqual(collect_garbage(grace_period=0), 1)
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(
+            ImageJob.objects.get().status, ImageJob.STATUS_FAILED
+        )
+
+    def test_replaced_upload_only_keeps_latest_renditions(self):
+        post_id = self.create_post(sample_image()).data["id"]
+        post = Post.objects.get(id=post_id)
+        post.image = sample_image(size=(40, 40))
+        post.save()
+
+        process_pending()
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_status, "ready")
+        self.assertEqual(set(post.image_renditions["jpeg"]), {"32", "40"})
+        self.assertEqual(
+            list(
+                ImageJob.objects.order_by("id").values_list(
+                    "error", flat=True
+                )
+            ),
+            ["Outdated upload.", ""],
+        )
+
+    def test_avatar_upload_is_processed(self):
+        res = self.client.patch(
+            reverse("user:manage", args=[self.user.id]),
+            {"avatar": sample_image()},
+            format="multipart",
+        )
+        self.assertEqual(res.data["avatar_status"], "pending")
+
+        process_pending()
+
+        res = self.client.get(reverse("user:manage", args=[self.user.id]))
+        self.assertEqual(res.data["avatar_status"], "ready")
+        self.assertIn("webp", res.data["avatar_srcset"])
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            IMAGES=IMAGES,
+            UPLOADS={"MAX_SIZE": 100_000, "MAX_DIMENSION": 500},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.user = sample_user("author@test.com")
+        self.post = Post.objects.create(
+            title="Photo", content="content", author=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, data):
+        res = self.client.post(
+            UPLOAD_URL, {"filename": "photo.png", "size": len(data)}
+        )
+        self.assertEqual(res.status_code, 201)
+        return res.data["id"]
+
+    def send(self, upload_id, data, start):
+        return self.client.put(
+            upload_url(upload_id),
+            data[start:start + 1000],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=(
+                f"bytes {start}-{min(start + 1000, len(data)) - 1}"
+                f"/{len(data)}"
+            ),
+        )
+
+    def complete(self, upload_id, data, **params):
+        return self.client.post(
+            complete_url(upload_id),
+            {
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "target": "post",
+                "post": self.post.id,
+                **params,
+            },
+        )
+
+    def test_upload_in_chunks_and_attach_to_post(self):
+        data = sample_image(size=(300, 200), image_format="PNG").read()
+        upload_id = self.start(data)
+
+        for start in range(0, len(data), 1000):
+            res = self.send(upload_id, data, start)
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["offset"], len(data))
+
+        res = self.complete(upload_id, data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["status"], "pending")
+        self.post.refresh_from_db()
+        with self.post.image.open() as f:
+            self.assertEqual(f.read(), data)
+        self.assertTrue(ImageJob.objects.filter(object_id=self.post.id))
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(
+            os.listdir(os.path.join(self.media_root, "staging")), []
+        )
+
+    def test_resume_after_interrupted_chunk(self):
+        data = os.urandom(2500)
+        upload_id = self.start(data)
+        self.send(upload_id, data, 0)
+
+        res = self.send(upload_id, data, 2000)
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.data["offset"], 1000)
+
+        res = self.client.get(upload_url(upload_id))
+        self.assertEqual(res.data["offset"], 1000)
+
+    def test_chunk_shorter_than_its_range_is_dropped(self):
+        data = os.urandom(2500)
+        upload_id = self.start(data)
+
+        res = self.client.put(
+            upload_url(upload_id),
+            data[:500],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 0-999/{len(data)}",
+        )
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(Upload.objects.get().received, 0)
+
+    def test_chunk_is_received_before_the_row_is_locked(self):
+        data = os.urandom(2500)
+        upload_id = self.start(data)
+        events = []
+
+        class Stream(io.BytesIO):
+            def read(self, size=-1):
+                events.append("read")
+                return super().read(size)
+
+        atomic = transaction.atomic
+
+        def locking_atomic(*args, **kwargs):
+            events.append("lock")
+            return atomic(*args, **kwargs)
+
+        with mock.patch("media.uploads.transaction.atomic", locking_atomic):
+            upload = append_chunk(
+                upload_id, self.user, Stream(data[:1000]), "bytes 0-999/2500"
+            )
+
+        self.assertEqual(upload.received, 1000)
+        self.assertEqual(events[-1], "lock")
+        self.assertNotIn("lock", events[:-1])
+        staging = os.path.join(self.media_root, "staging")
+        self.assertEqual(os.listdir(staging), [f"{upload_id}.part"])
+        with open(os.path.join(staging, f"{upload_id}.part"), "rb") as f:
+            self.assertEqual(f.read(), data[:1000])
+
+    def test_checksum_mismatch_discards_upload(self):
+        data = sample_image(image_format="PNG").read()
+        upload_id = self.start(data)
+        for start in range(0, len(data), 1000):
+            self.send(upload_id, data, start)
+
+        res = self.complete(upload_id, data, sha256="0" * 64)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(Upload.objects.exists())
+        self.post.refresh_from_db()
+        self.assertFalse(self.post.image)
+
+    def test_limits_are_checked_from_the_header(self):
+        res = self.client.post(
+            UPLOAD_URL, {"filename": "huge.png", "size": 200_000}
+        )
+        self.assertEqual(res.status_code, 400)
+
+        data = sample_image(size=(600, 10), image_format="PNG").read()
+        upload_id = self.start(data)
+        for start in range(0, len(data), 1000):
+            self.send(upload_id, data, start)
+
+        res = self.complete(upload_id, data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("500 pixels", res.data["error"])
+
+    def test_uploads_of_other_users_are_hidden(self):
+        upload_id = self.start(b"x" * 10)
+        self.client.force_authenticate(sample_user("other@test.com"))
+
+        res = self.client.get(upload_url(upload_id))
+        self.assertEqual(res.status_code, 404)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGES=IMAGES
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.user = sample_user("author@test.com")
+
+    def create_post(self, image):
+        return Post.objects.create(
+            title="Meme", content="content", author=self.user, image=image
+        )
+
+    def refcounts(self, post):
+        names = [post.image.name, *post.image_renditions["webp"].values()]
+        return list(
+            Blob.objects.filter(name__in=names)
+            .order_by("name")
+            .values_list("refcount", flat=True)
+        )
+
+    def media_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+    def test_identical_uploads_are_stored_once(self):
+        data = sample_image().read()
+        first = self.create_post(SimpleUploadedFile("a.jpg", data))
+        second = self.create_post(SimpleUploadedFile("b.jpg", data))
+        self.assertEqual(first.image.name, second.image.name)
+
+        process_pending()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_renditions, second.image_renditions)
+        self.assertEqual(self.refcounts(first), [2] * 4)
+
+        collect_garbage(grace_period=0)
+        # Stripped original and 3 widths in 2 formats
+        self.assertEqual(len(self.media_files()), 7)
+
+    def test_blobs_are_collected_after_the_last_reference(self):
+        data = sample_image().read()
+        first = self.create_post(SimpleUploadedFile("a.jpg", data))
+        second = self.create_post(SimpleUploadedFile("b.jpg", data))
+        process_pending()
+        first.refresh_from_db()
+        second.refresh_from_db()
+
+        first.delete()
+        self.assertEqual(collect_garbage(grace_period=0), 1)
+        self.assertEqual(self.refcounts(second), [1] * 4)
+
+        second.delete()
+        self.assertEqual(collect_garbage(grace_period=0), 7)
+        self.assertEqual(self.media_files(), [])
+
+    def test_grace_period_protects_fresh_blobs(self):
+        post = self.create_post(sample_image())
+        post.delete()
+
+        self.assertEqual(collect_garbage(), 0)
+        self.assertTrue(Blob.objects.exists())
+
+    def test_replacing_an_image_releases_the_old_files(self):
+        post = self.create_post(sample_image(size=(80, 80)))
+        process_pending()
+        post.refresh_from_db()
+        old_names = [post.image.name, *post.image_renditions["jpeg"].values()]
+
+        post.image = sample_image(size=(60, 60))
+        post.save()
+
+        self.assertEqual(
+            set(
+                Blob.objects.filter(name__in=old_names).values_list(
+                    "refcount", flat=True
+                )
+            ),
+            {0},
+        )
+
+    def test_dedupe_command_moves_legacy_files_in_place(self):
+        legacy = FileSystemStorage()
+        data = sample_image().read()
+        names = [
+            legacy.save(f"uploads/posts/meme-{i}.jpg", ContentFile(data))
+            for i in range(3)
+        ]
+        posts = [self.create_post(None) for _ in names]
+        for post, name in zip(posts, names):
+            Post.objects.filter(pk=post.pk).update(image=name)
+
+        call_command("dedupe_media", stdout=io.StringIO())
+
+        blob_names = set(
+            Post.objects.values_list("image", flat=True).distinct()
+        )
+        self.assertEqual(len(blob_names), 1)
+        blob = Blob.objects.get(name=blob_names.pop())
+        self.assertEqual(blob.refcount, 3)
+        self.assertEqual(self.media_files(), [blob.name])
+        with default_storage.open(blob.name) as f:
+            self.assertEqual(f.read(), data)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.user = sample_user("author@test.com")
+        self.post = Post.objects.create(
+            title="Meme",
+            content="content",
+            author=self.user,
+            image=SimpleUploadedFile("meme.jpg", sample_image().read()),
+        )
+        process_pending()
+        self.post.refresh_from_db()
+        with default_storage.open(self.post.image.name, "rb") as file:
+            self.data = file.read()
+        self.url = f"/media/{self.post.image.name}"
+
+    def content(self, res):
+        return b"".join(res.streaming_content)
+
+    def test_blob_is_served_as_immutable(self):
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.content(res), self.data)
+        self.assertEqual(res["Content-Type"], "image/jpeg")
+        self.assertEqual(res["Accept-Ranges"], "bytes")
+        self.assertIn("immutable", res["Cache-Control"])
+        self.assertIn("max-age=31536000", res["Cache-Control"])
+
+    def test_byte_ranges(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res["Content-Length"], "10")
+        self.assertEqual(
+            res["Content-Range"], f"bytes 10-19/{len(self.data)}"
+        )
+        self.assertEqual(self.content(res), self.data[10:20])
+
+        res = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(self.content(res), self.data[-5:])
+
+        res = self.client.get(
+            self.url, HTTP_RANGE=f"bytes={len(self.data)}-"
+        )
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res["Content-Range"], f"bytes */{len(self.data)}")
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(MEDIA_SERVING={"MODE": "x-accel-redirect"})
+    def test_x_accel_redirect(self):
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res["X-Accel-Redirect"],
+            f"/protected-media/{self.post.image.name}",
+        )
+        self.assertEqual(res.content, b"")
+        self.assertIn("immutable", res["Cache-Control"])
+
+    @override_settings(MEDIA_SERVING={"MODE": "x-sendfile"})
+    def test_x_sendfile(self):
+        res = self.client.get(self.url)
+
+        self.assertEqual(
+            res["X-Sendfile"],
+            os.path.join(self.media_root, self.post.image.name),
+        )
+
+    def test_images_are_served_once_processed(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        post = Post.objects.create(
+            title="Holiday",
+            content="content",
+            author=self.user,
+            image=sample_image(size=(80, 40), exif=exif),
+        )
+        original = post.image.name
+        self.assertEqual(
+            self.client.get(f"/media/{original}").status_code, 404
+        )
+
+        process_pending()
+        post.refresh_from_db()
+
+        self.assertEqual(
+            self.client.get(f"/media/{post.image.name}").status_code, 200
+        )
+        self.assertEqual(
+            self.client.get(f"/media/{original}").status_code, 404
+        )
+
+    def test_unreferenced_and_private_files_are_not_served(self):
+        name = self.post.image.name
+        self.post.delete()
+        self.assertEqual(self.client.get(f"/media/{name}").status_code, 404)
+
+        staged = os.path.join(self.media_root, "staging", "x.part")
+        os.makedirs(os.path.dirname(staged))
+        open(staged, "wb").close()
+        self.assertEqual(
+            self.client.get("/media/staging/x.part").status_code, 404
+        )
+        self.assertEqual(
+            self.client.get("/media/../etc/passwd").status_code, 404
+        )
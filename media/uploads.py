@@ -0,0 +1,218 @@
+"""Resumable chunked uploads.
+
+A client declares the file size, then sends the bytes in any number of
+``PUT`` requests with a ``Content-Range`` header. Every chunk is copied
+from the request stream to a chunk file, then appended to a staging
+file, in ``UPLOADS["BUFFER_SIZE"]`` pieces, so memory use does not
+depend on the file or chunk size. After
+an interrupted request the client asks for the offset and resumes from
+there. Completing the upload verifies its SHA-256 checksum, checks the
+image format and dimensions from its header only and attaches the file,
+which queues it for the image pipeline.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from media.models import Upload
+
+DEFAULTS = {
+    "STAGING_DIR": "staging",
+    "MAX_SIZE": 50 * 1024 * 1024,
+    "BUFFER_SIZE": 64 * 1024,
+    "MAX_DIMENSION": 10_000,
+    "MAX_PIXELS": 40_000_000,
+    "FORMATS": ["JPEG", "PNG", "WEBP", "GIF", "MPO"],
+    "EXPIRE_AFTER": 24 * 60 * 60,
+}
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, offset):
+        super().__init__("Chunk does not start at the current offset.")
+        self.offset = offset
+
+
+def upload_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "UPLOADS", {})}
+
+
+def staging_path(upload) -> str:
+    return os.path.join(
+        settings.MEDIA_ROOT,
+        upload_settings()["STAGING_DIR"],
+        f"{upload.pk}.part",
+    )
+
+
+def parse_content_range(header: str) -> tuple[int, int, int]:
+    """``(start, end, total)`` of a ``bytes start-end/total`` range,
+    where ``end`` is exclusive"""
+    match = CONTENT_RANGE.match(header or "")
+    if not match:
+        raise UploadError(
+            "Content-Range must look like 'bytes start-end/total'."
+        )
+    start, last, total = map(int, match.groups())
+    if last < start:
+        raise UploadError("Content-Range end is before its start.")
+    return start, last + 1, total
+
+
+def start_upload(owner, filename: str, size: int) -> Upload:
+    if size > upload_settings()["MAX_SIZE"]:
+        raise UploadError(
+            f"Files may be at most {upload_settings()['MAX_SIZE']} bytes."
+        )
+    upload = Upload.objects.create(
+        owner=owner, filename=os.path.basename(filename), size=size
+    )
+    path = staging_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+    return upload
+
+
+def append_chunk(upload_id, owner, stream, content_range: str) -> Upload:
+    """Copies a chunk from ``stream`` to the staging file.
+
+    The chunk is read from the client into a file of its own first,
+    without any lock, as slow clients may take long to send it. Only then
+    is the row locked, to check that the chunk still starts at the offset
+    and to append it, a local copy, so concurrent chunks of one upload
+    cannot interleave."""
+    start, end, total = parse_content_range(content_range)
+    config = upload_settings()
+
+    upload = Upload.objects.get(pk=upload_id, owner=owner)
+    check_chunk(upload, start, end, total)
+
+    path = staging_path(upload)
+    descriptor, chunk_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f"{upload.pk}.", suffix=".chunk"
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as chunk_file:
+            written = 0
+            while written < end - start:
+                chunk = stream.read(
+                    min(config["BUFFER_SIZE"], end - start - written)
+                )
+                if not chunk:
+                    break
+                chunk_file.write(chunk)
+                written += len(chunk)
+        if written != end - start or stream.read(1):
+            raise UploadError("Chunk length does not match its range.")
+
+        with transaction.atomic():
+            upload = Upload.objects.select_for_update().get(
+                pk=upload_id, owner=owner
+            )
+            check_chunk(upload, start, end, total)
+            with open(path, "r+b") as file, open(chunk_path, "rb") as chunk:
+                file.seek(start)
+                try:
+                    shutil.copyfileobj(chunk, file, config["BUFFER_SIZE"])
+                except OSError:
+                    # Keep only the bytes of complete chunks
+                    file.truncate(start)
+                    raise
+            upload.received = end
+            upload.save(update_fields=["received", "updated_at"])
+    finally:
+        os.remove(chunk_path)
+
+    return upload
+
+
+def check_chunk(upload, start: int, end: int, total: int) -> None:
+    if total != upload.size or end > upload.size:
+        raise UploadError("Content-Range does not match the file size.")
+    if start != upload.received:
+        raise OffsetMismatch(upload.received)
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    buffer_size = upload_settings()["BUFFER_SIZE"]
+    with open(path, "rb") as file:
+        while chunk := file.read(buffer_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_image_header(path: str) -> None:
+    """Enforces format and dimension limits. ``Image.open`` only parses
+    the header, the pixel data is never decoded here."""
+    config = upload_settings()
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise UploadError(f"Invalid image: {error}") from error
+
+    if image_format not in config["FORMATS"]:
+        raise UploadError(f"Unsupported image format {image_format}.")
+    if max(width, height) > config["MAX_DIMENSION"]:
+        raise UploadError(
+            f"Images may be at most {config['MAX_DIMENSION']} pixels wide "
+            "and high."
+        )
+    if width * height > config["MAX_PIXELS"]:
+        raise UploadError(
+            f"Images may have at most {config['MAX_PIXELS']} pixels."
+        )
+
+
+def complete_upload(upload, checksum: str, instance, field: str) -> None:
+    """Verifies the upload and stores it as ``instance.<field>``"""
+    if upload.received != upload.size:
+        raise UploadError("Upload is not complete yet.")
+
+    path = staging_path(upload)
+    if file_checksum(path) != checksum.lower():
+        discard_upload(upload)
+        raise UploadError("Checksum does not match, upload discarded.")
+    try:
+        check_image_header(path)
+    except UploadError:
+        discard_upload(upload)
+        raise
+
+    # FileField.pre_save copies the file to storage in chunks
+    with open(path, "rb") as file:
+        setattr(instance, field, File(file, name=upload.filename))
+        instance.save()
+    discard_upload(upload)
+
+
+def discard_upload(upload) -> None:
+    try:
+        os.remove(staging_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def expired_uploads():
+    cutoff = timezone.now() - timedelta(
+        seconds=upload_settings()["EXPIRE_AFTER"]
+    )
+    return Upload.objects.filter(updated_at__lte=cutoff)
@@ -0,0 +1,15 @@
+from django.urls import path
+
+from media.views import UploadCreateView, UploadView, UploadCompleteView
+
+urlpatterns = [
+    path("uploads/", UploadCreateView.as_view(), name="upload-create"),
+    path("uploads/<uuid:pk>/", UploadView.as_view(), name="upload"),
+    path(
+        "uploads/<uuid:pk>/complete/",
+        UploadCompleteView.as_view(),
+        name="upload-complete",
+    ),
+]
+
+app_name = "media"
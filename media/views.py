@@ -0,0 +1,157 @@
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from media.models import Upload
+from media.serializers import UploadSerializer, CompleteUploadSerializer
+from media.serving import serve
+from media.uploads import (
+    OffsetMismatch,
+    UploadError,
+    append_chunk,
+    complete_upload,
+    discard_upload,
+    start_upload,
+)
+from post.models import Post
+
+
+class UploadCreateView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(
+        request=UploadSerializer, responses={201: UploadSerializer}
+    )
+    def post(self, request):
+        """Starts a resumable upload of ``size`` bytes"""
+        serializer = UploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = start_upload(
+                request.user,
+                serializer.validated_data["filename"],
+                serializer.validated_data["size"],
+            )
+        except UploadError as error:
+            return Response(
+                {"error": str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            UploadSerializer(upload).data, status=status.HTTP_201_CREATED
+        )
+
+
+class UploadView(APIView):
+    """Chunks are sent as raw request bodies, so no parser ever buffers
+    them: the view reads ``request.stream`` itself"""
+
+    permission_classes = (IsAuthenticated,)
+    parser_classes = ()
+
+    @extend_schema(responses=UploadSerializer)
+    def get(self, request, pk=None):
+        """Offset to resume the upload from"""
+        upload = get_object_or_404(Upload, pk=pk, owner=request.user)
+        return Response(UploadSerializer(upload).data)
+
+    @extend_schema(
+        request={"application/octet-stream": {"type": "string"}},
+        parameters=[
+            OpenApiParameter(
+                name="Content-Range",
+                location=OpenApiParameter.HEADER,
+                description="Bytes of the chunk (ex. bytes 0-1048575/5000000)",
+                required=True,
+                type=str,
+            ),
+        ],
+        responses=UploadSerializer,
+    )
+    def put(self, request, pk=None):
+        """Appends the chunk at the current offset. A chunk that does not
+        start at the offset gets 409 with the offset to resume from."""
+        get_object_or_404(Upload, pk=pk, owner=request.user)
+        if request.stream is None:
+            return Response(
+                {"error": "Chunk is empty."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            upload = append_chunk(
+                pk,
+                request.user,
+                request.stream,
+                request.headers.get("Content-Range"),
+            )
+        except OffsetMismatch as error:
+            return Response(
+                {"error": str(error), "offset": error.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except UploadError as error:
+            return Response(
+                {"error": str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(UploadSerializer(upload).data)
+
+    def delete(self, request, pk=None):
+        """Aborts the upload"""
+        upload = get_object_or_404(Upload, pk=pk, owner=request.user)
+        discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadCompleteView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(request=CompleteUploadSerializer, responses=None)
+    def post(self, request, pk=None):
+        """Verifies the checksum and attaches the image to one of the
+        user's posts or to his/her avatar. The image is then processed
+        in the background."""
+        upload = get_object_or_404(Upload, pk=pk, owner=request.user)
+        serializer = CompleteUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if data["target"] == CompleteUploadSerializer.TARGET_POST:
+            instance = get_object_or_404(
+                Post, pk=data["post"], author=request.user
+            )
+            field = "image"
+        else:
+            instance = get_user_model().objects.get(pk=request.user.pk)
+            field = "avatar"
+
+        try:
+            complete_upload(upload, data["sha256"], instance, field)
+        except UploadError as error:
+            return Response(
+                {"error": str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            {
+                "target": data["target"],
+                "id": instance.pk,
+                "status": getattr(instance, f"{field}_status"),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@require_safe
+def media_file(request, path):
+    """Serves a media file once Django allowed it, see media.serving"""
+    response = serve(request, path)
+    if response is None:
+        raise Http404("No such media file.")
+    return response
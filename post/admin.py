@@ -22,6 +22,13 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ("title", "author", "created_at", "changed_at")
+    list_display = (
+        "title",
+        "author",
+        "likes_count",
+        "comments_count",
+        "created_at",
+        "changed_at",
+    )
     list_filter = ("created_at", "tags")
     search_fields = ("title", "author__username")
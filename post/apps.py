@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PostConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "post"
+
+    def ready(self):
+        import post.signals  # noqa: F401
+        from post.indexes import POSTGRES_INDEXES
+        from social_media_api.indexes import register_postgres_indexes
+
+        register_postgres_indexes(self, POSTGRES_INDEXES)
@@ -0,0 +1,221 @@
+"""Async versions of the hot post endpoints, for ASGI deployments.
+
+They answer like their ``PostViewSet`` counterparts. Independent queries
+of a request run concurrently through ``social_media_api.aio.gather``,
+and writes go through the same model methods as the sync views.
+"""
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from post.models import Comment, Post, PostTag
+from post.serializers import (
+    CommentListSerializer,
+    CommentSerializer,
+    PostRetrieveSerializer,
+    PostSerializer,
+)
+from post.views import (
+    DefaultPagination,
+    FeedPagination,
+    LikePagination,
+    PostPagination,
+    PostViewSet,
+)
+from social_media_api.aio import (
+    AsyncAPIView,
+    aget_or_404,
+    cached_response,
+    gather,
+    set_prefetched,
+)
+from social_media_api.metrics import serializer_data
+from user.relations import personalize_post, wants_relations
+
+
+def post_tags(post_ids):
+    return PostTag.objects.filter(post_id__in=post_ids).select_related(
+        "tag"
+    )
+
+
+def set_tags(posts, post_tags) -> None:
+    tags = defaultdict(list)
+    for post_tag in post_tags:
+        tags[post_tag.post_id].append(post_tag.tag)
+    for post in posts:
+        set_prefetched(post, "tags", tags[post.pk])
+
+
+class AsyncPostListView(AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(responses=PostSerializer(many=True))
+    async def get(self, request):
+        """List posts with filter by title or tags"""
+        paginator = PostPagination()
+        queryset = PostViewSet.filter_posts(
+            Post.objects.all(), request.query_params
+        )
+        posts = await paginator.apaginate_queryset(queryset, request, self)
+        [post_tag_rows] = await gather(
+            post_tags([post.pk for post in posts])
+        )
+        set_tags(posts, post_tag_rows)
+        serializer = PostSerializer(
+            posts, many=True, context={"request": request}
+        )
+
+        return paginator.get_paginated_response(serializer_data(serializer))
+
+
+class AsyncFeedView(AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+    throttle_scope = "followings"
+
+    @extend_schema(responses=PostSerializer(many=True))
+    async def get(self, request):
+        """Posts of the users the user follows, newest first"""
+        paginator = FeedPagination()
+        post_ids = await sync_to_async(paginator.read_page)(request)
+        posts, post_tag_rows = await gather(
+            Post.objects.filter(pk__in=post_ids), post_tags(post_ids)
+        )
+        by_id = {post.pk: post for post in posts}
+        posts = [by_id[post_id] for post_id in post_ids if post_id in by_id]
+        set_tags(posts, post_tag_rows)
+        serializer = PostSerializer(
+            posts, many=True, context={"request": request}
+        )
+
+        return paginator.get_paginated_response(serializer_data(serializer))
+
+
+class AsyncPostDetailView(AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(responses=PostRetrieveSerializer)
+    async def get(self, request, pk=None):
+        """Post with its first likes and comments: the post and each
+        relation are fetched concurrently"""
+
+        async def build():
+            posts, tags, likes, comments = await gather(
+                Post.objects.filter(pk=pk),
+                post_tags([pk]),
+                get_user_model()
+                .objects.filter(liked_posts=pk)
+                .only("id", "username")
+                .order_by(*LikePagination.ordering)[
+                    : LikePagination.preview_size
+                ],
+                Comment.objects.filter(post_id=pk).order_by(
+                    *DefaultPagination.ordering
+                )[: DefaultPagination.preview_size],
+            )
+            if not posts:
+                raise NotFound()
+            [post] = posts
+            set_tags([post], tags)
+            post.preview_likes = likes
+            post.preview_comments = comments
+            data = serializer_data(
+                PostRetrieveSerializer(post, context={"request": request})
+            )
+            return data, post.changed_at
+
+        personalize = None
+        if wants_relations(request):
+            personalize = personalize_post(request.user)
+
+        return await cached_response(
+            request, "post-detail", [f"post:{pk}", "tags"], build, personalize
+        )
+
+
+class AsyncCommentsView(AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(responses=CommentListSerializer(many=True))
+    async def get(self, request, pk=None):
+        """Get the comments of the specified post, a page at a time"""
+
+        async def build():
+            if not await Post.objects.filter(pk=pk).aexists():
+                raise NotFound()
+            paginator = DefaultPagination()
+            comments = await paginator.apaginate_queryset(
+                Comment.objects.filter(post_id=pk), request, self
+            )
+            serializer = CommentListSerializer(
+                comments, many=True, context={"request": request}
+            )
+            data = serializer_data(serializer)
+            return paginator.get_paginated_response(data).data, None
+
+        return await cached_response(
+            request, "post-comments", [f"comments:{pk}"], build
+        )
+
+    @extend_schema(
+        request=CommentSerializer,
+        responses={status.HTTP_201_CREATED: CommentSerializer},
+    )
+    async def post(self, request, pk=None):
+        """Comment on the post"""
+        post = await aget_or_404(Post.objects.all(), pk=pk)
+        serializer = CommentSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.instance = await sync_to_async(post.add_comment)(
+            request.user, serializer.validated_data["content"]
+        )
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncLikeView(AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(
+        request=None,
+        responses={
+            status.HTTP_200_OK: {
+                "type": "object",
+                "properties": {
+                    "liked": {"type": "boolean"},
+                    "likes_count": {"type": "integer"},
+                },
+            }
+        },
+    )
+    async def put(self, request, pk=None):
+        """Likes the post, repeating it has no effect"""
+        post = await aget_or_404(Post.objects.all(), pk=pk)
+        await sync_to_async(post.add_like)(request.user)
+        return await self.like_response(post, liked=True)
+
+    @extend_schema(request=None)
+    async def delete(self, request, pk=None):
+        """Unlikes the post, repeating it has no effect"""
+        post = await aget_or_404(Post.objects.all(), pk=pk)
+        await sync_to_async(post.remove_like)(request.user)
+        return await self.like_response(post, liked=False)
+
+    async def like_response(self, post, liked) -> Response:
+        likes_count = await (
+            Post.objects.filter(pk=post.pk)
+            .values_list("likes_count", flat=True)
+            .aget()
+        )
+        return Response(
+            {"liked": liked, "likes_count": likes_count},
+            status=status.HTTP_200_OK,
+        )
@@ -0,0 +1,113 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+
+from post.models import Post, Comment, Tag
+from social_media_api.bulk import (
+    CREATED,
+    NOT_FOUND,
+    apply_relations,
+    relation_status,
+)
+from social_media_api.counters import change_many_counters
+from social_media_api.signals import bulk_created
+
+LIKE = "like"
+UNLIKE = "unlike"
+
+
+def send_likes_changed(user, action, post_ids):
+    if post_ids:
+        m2m_changed.send(
+            sender=Post.likes.through,
+            instance=user,
+            action=action,
+            reverse=True,
+            model=Post,
+            pk_set=set(post_ids),
+            using=user._state.db,
+        )
+
+
+def bulk_like(user, operations) -> list[dict]:
+    """Applies ``{"post": id, "action": "like" | "unlike"}`` operations
+    of ``user``"""
+    found = set(
+        Post.objects.filter(
+            pk__in=[operation["post"] for operation in operations]
+        ).values_list("id", flat=True)
+    )
+    like, unlike = set(), set()
+    for operation in operations:
+        if operation["post"] in found:
+            (like if operation["action"] == LIKE else unlike).add(
+                operation["post"]
+            )
+
+    with transaction.atomic():
+        liked, unliked = apply_relations(
+            Post.likes.through, ("user_id", user.pk), like, unlike
+        )
+        change_many_counters(Post, liked, likes_count=1)
+        change_many_counters(Post, unliked, likes_count=-1)
+        send_likes_changed(user, "post_add", liked)
+        send_likes_changed(user, "post_remove", unliked)
+
+    return [
+        {
+            **operation,
+            "status": relation_status(
+                operation["post"], found, liked, unliked
+            ),
+        }
+        for operation in operations
+    ]
+
+
+def bulk_comment(user, items) -> list[dict]:
+    """Creates ``{"post": id, "content": str}`` comments of ``user``"""
+    found = set(
+        Post.objects.filter(
+            pk__in=[item["post"] for item in items]
+        ).values_list("id", flat=True)
+    )
+    comments = [
+        Comment(post_id=item["post"], author=user, content=item["content"])
+        for item in items
+        if item["post"] in found
+    ]
+
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments)
+        posts_by_delta = defaultdict(list)
+        for post_id, delta in Counter(
+            comment.post_id for comment in comments
+        ).items():
+            posts_by_delta[delta].append(post_id)
+        for delta, post_ids in posts_by_delta.items():
+            change_many_counters(Post, post_ids, comments_count=delta)
+        if comments:
+            bulk_created.send(sender=Comment, instances=comments)
+
+    created = iter(comments)
+    return [
+        {"post": item["post"], "status": CREATED, "id": next(created).id}
+        if item["post"] in found
+        else {"post": item["post"], "status": NOT_FOUND}
+        for item in items
+    ]
+
+
+def upsert_tags(names) -> list[Tag]:
+    """Tags with the given names in the same order, inserting the
+    missing ones in one statement"""
+    names = list(dict.fromkeys(names))
+    with transaction.atomic():
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in names], ignore_conflicts=True
+        )
+        tags = Tag.objects.in_bulk(names, field_name="name")
+        bulk_created.send(sender=Tag, instances=list(tags.values()))
+
+    return [tags[name] for name in names]
@@ -0,0 +1,9 @@
+"""PostgreSQL-only indexes of the post app, created after ``migrate``
+(see ``social_media_api.indexes``)."""
+
+POSTGRES_INDEXES = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Matches the UPPER(title) LIKE UPPER(%s) that title__icontains emits
+    "CREATE INDEX IF NOT EXISTS post_title_trgm_idx "
+    "ON post_post USING gin (UPPER(title) gin_trgm_ops)",
+)
@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """Gives ``Post.tags`` the explicit ``PostTag`` through model.
+
+    Django cannot alter an auto-created many-to-many into one with
+    ``through=``, so the model only changes in the migration state:
+    ``PostTag`` keeps the ``post_post_tags`` table, its rows and its
+    ``(post_id, tag_id)`` unique constraint, and the database only gains
+    the ``(tag, post)`` index.
+    """
+
+    dependencies = [
+        ("post", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="PostTag",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "post",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="post.post",
+                            ),
+                        ),
+                        (
+                            "tag",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="post.tag",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "post_post_tags",
+                    },
+                ),
+                migrations.AddConstraint(
+                    model_name="posttag",
+                    constraint=models.UniqueConstraint(
+                        fields=("post", "tag"), name="unique_post_tag"
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="post",
+                    name="tags",
+                    field=models.ManyToManyField(
+                        related_name="post_hashtags",
+                        through="post.PostTag",
+                        to="post.tag",
+                    ),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddIndex(
+            model_name="posttag",
+            index=models.Index(
+                fields=["tag", "post"], name="post_tag_tag_post_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Keeps the oldest tag of every name, moves the posts of the others
+    to it and deletes them, so ``Tag.name`` can become unique"""
+    Tag = apps.get_model("post", "Tag")
+    PostTag = apps.get_model("post", "PostTag")
+
+    duplicated = (
+        Tag.objects.values("name")
+        .annotate(keep=Min("id"), tags=Count("id"))
+        .filter(tags__gt=1)
+    )
+    for row in duplicated.iterator():
+        duplicates = Tag.objects.filter(name=row["name"]).exclude(
+            pk=row["keep"]
+        )
+        # Posts having both tags already link to the one kept
+        PostTag.objects.filter(
+            tag__in=duplicates,
+            post__in=PostTag.objects.filter(tag_id=row["keep"]).values(
+                "post"
+            ),
+        ).delete()
+        PostTag.objects.filter(tag__in=duplicates).update(tag_id=row["keep"])
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("post", "0003_posttag"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+    ]
@@ -2,10 +2,14 @@ import os
 import uuid
 
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
 from django.utils.text import slugify
 from django.utils.translation import gettext as _
 
+from media.models import IMAGE_NONE, IMAGE_STATUS_CHOICES
+from social_media_api.counters import CounterFieldsMixin, change_counters
+
 
 def post_image_file_path(instance, filename):
     _, extension = os.path.splitext(filename)
@@ -15,13 +19,13 @@ def post_image_file_path(instance, filename):
 
 
 class Tag(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
     def __str__(self):
         return self.name
 
 
-class Post(models.Model):
+class Post(CounterFieldsMixin, models.Model):
     title = models.CharField(max_length=100)
     content = models.TextField()
     image = models.ImageField(
@@ -30,20 +34,95 @@ class Post(models.Model):
         upload_to=post_image_file_path,
         blank=True,
     )
+    image_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_NONE,
+        editable=False,
+    )
+    image_renditions = models.JSONField(default=dict, editable=False)
     author = models.ForeignKey(
         get_user_model(), related_name="autor_posts", on_delete=models.CASCADE
     )
-    tags = models.ManyToManyField(Tag, related_name="post_hashtags")
+    tags = models.ManyToManyField(
+        Tag, related_name="post_hashtags", through="PostTag"
+    )
     likes = models.ManyToManyField(
         get_user_model(), related_name="liked_posts", blank=True
     )
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     changed_at = models.DateTimeField(auto_now=True)
 
+    counter_fields = ("likes_count", "comments_count")
+
     class Meta:
         ordering = (
             "created_at",
             "title",
+            "id",
+        )
+        indexes = [
+            models.Index(
+                fields=["created_at", "title", "id"],
+                name="post_created_title_id_idx",
+            ),
+            models.Index(
+                fields=["author", "created_at", "title", "id"],
+                name="post_author_created_title_idx",
+            ),
+        ]
+
+    def is_liked_by(self, user) -> bool:
+        """Single-row lookup on the unique (post, user) index"""
+        return Post.likes.through.objects.filter(
+            post_id=self.pk, user_id=user.pk
+        ).exists()
+
+    def add_like(self, user) -> bool:
+        """Likes the post, returns False if it was already liked.
+        Safe to call concurrently: the unique index decides who wins."""
+        with transaction.atomic():
+            _, created = Post.likes.through.objects.get_or_create(
+                post_id=self.pk, user_id=user.pk
+            )
+            if created:
+                change_counters(Post, self.pk, likes_count=1)
+                self.send_likes_changed("post_add", user)
+        return created
+
+    def remove_like(self, user) -> bool:
+        """Unlikes the post, returns False if it was not liked"""
+        with transaction.atomic():
+            deleted, _ = Post.likes.through.objects.filter(
+                post_id=self.pk, user_id=user.pk
+            ).delete()
+            if deleted:
+                change_counters(Post, self.pk, likes_count=-1)
+                self.send_likes_changed("post_remove", user)
+        return bool(deleted)
+
+    def add_comment(self, author, content) -> "Comment":
+        """Comments on the post, counted in ``comments_count``"""
+        with transaction.atomic():
+            comment = Comment.objects.create(
+                post=self, author=author, content=content
+            )
+            change_counters(Post, self.pk, comments_count=1)
+        return comment
+
+    def send_likes_changed(self, action, user):
+        """Rows written straight to the through table do not send
+        signals, notify receivers the same way ``likes.add()`` does"""
+        m2m_changed.send(
+            sender=Post.likes.through,
+            instance=self,
+            action=action,
+            reverse=False,
+            model=get_user_model(),
+            pk_set={user.pk},
+            using=self._state.db,
         )
 
     def __str__(self):
@@ -53,6 +132,28 @@ class Post(models.Model):
         )
 
 
+class PostTag(models.Model):
+    """Through table of ``Post.tags`` with a ``(tag, post)`` index,
+    so posts having a set of tags are found without scanning posts"""
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "post_post_tags"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "tag"], name="unique_post_tag"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["tag", "post"], name="post_tag_tag_post_idx"),
+        ]
+
+    def __str__(self):
+        return f"Tag {self.tag_id} on post {self.post_id}"
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post, related_name="comments", on_delete=models.CASCADE
@@ -65,8 +166,96 @@ class Comment(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = (
+            "created_at",
+            "id",
+        )
+        indexes = [
+            models.Index(
+                fields=["post", "created_at", "id"],
+                name="comment_post_created_id_idx",
+            ),
+            models.Index(
+                fields=["author", "created_at", "id"],
+                name="comment_author_created_id_idx",
+            ),
+        ]
+
     def __str__(self):
         return (
             f"Comment by {self.author.username} "
             f"on {self.post} at {self.created_at}"
         )
+
+
+class TimelineEntry(models.Model):
+    """A post materialized into a follower's home timeline"""
+
+    owner = models.ForeignKey(
+        get_user_model(),
+        related_name="timeline_entries",
+        on_delete=models.CASCADE,
+    )
+    post = models.ForeignKey(
+        Post, related_name="timeline_entries", on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        get_user_model(), related_name="+", on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "post"], name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["owner", "created_at", "post"],
+                name="timeline_owner_created_idx",
+            ),
+            models.Index(
+                fields=["owner", "author"],
+                name="timeline_owner_author_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.owner_id}'s timeline"
+
+
+class PostScore(models.Model):
+    """Time-decayed likes and comments of a post, see ``post.trending``"""
+
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        related_name="trending_score",
+        on_delete=models.CASCADE,
+    )
+    log_score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-log_score", "post"], name="post_score_log_score_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} scores {self.log_score:.3f}"
+
+
+class TagTrend(models.Model):
+    """A trending tag, ranked by ``manage.py trending``"""
+
+    tag = models.OneToOneField(
+        Tag, primary_key=True, related_name="trend", on_delete=models.CASCADE
+    )
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+
+    def __str__(self):
+        return f"Tag {self.tag_id} trends at #{self.rank + 1}"
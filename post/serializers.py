@@ -1,12 +1,47 @@
 from rest_framework import serializers
 
-from post.models import Tag, Post, Comment
+from media.serializers import SrcsetField
+from post.bulk import LIKE, UNLIKE
+from post.models import Tag, Post, Comment, TagTrend
+from social_media_api.bulk import BulkOperationsSerializer
+from user.relations import (
+    Relations,
+    RelationsListSerializer,
+    ViewerRelationsMixin,
+)
 
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ("id", "name")
+        # Creating an existing tag returns it instead of failing
+        extra_kwargs = {"name": {"validators": []}}
+
+
+class TrendingTagSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="tag_id")
+    name = serializers.CharField(source="tag.name")
+
+    class Meta:
+        model = TagTrend
+        fields = ("id", "name", "score")
+        read_only_fields = fields
+
+
+class LikeOperationSerializer(serializers.Serializer):
+    target_field = "post"
+
+    post = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=(LIKE, UNLIKE))
+
+    class Meta:
+        list_serializer_class = BulkOperationsSerializer
+
+
+class BulkCommentSerializer(serializers.Serializer):
+    post = serializers.IntegerField(min_value=1)
+    content = serializers.CharField()
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -37,25 +72,16 @@ class CommentListSerializer(serializers.ModelSerializer):
         )
 
 
-class PostSerializer(serializers.ModelSerializer):
-    likes_count = serializers.SerializerMethodField()
+class PostSerializer(ViewerRelationsMixin, serializers.ModelSerializer):
     author = serializers.HyperlinkedRelatedField(
         many=False,
         read_only=True,
         view_name="user:manage",
     )
-    comments_count = serializers.SerializerMethodField()
     tags = serializers.SlugRelatedField(
         many=True, slug_field="name", queryset=Tag.objects.all()
     )
-
-    @staticmethod
-    def get_likes_count(post):
-        return post.likes.count()
-
-    @staticmethod
-    def get_comments_count(post):
-        return post.post_comments.count()
+    image_srcset = SrcsetField(source="image_renditions")
 
     class Meta:
         model = Post
@@ -65,20 +91,41 @@ class PostSerializer(serializers.ModelSerializer):
             "content",
             "author",
             "image",
+            "image_status",
+            "image_srcset",
             "tags",
             "comments_count",
             "likes_count",
             "created_at",
             "changed_at",
         )
+        read_only_fields = ("image_status", "comments_count", "likes_count")
+        list_serializer_class = RelationsListSerializer
+
+    def load_relations(self, rows):
+        return Relations(
+            self.context["request"].user,
+            user_ids=[post.author_id for post in rows],
+            post_ids=[post.pk for post in rows],
+        )
+
+    def relations_of(self, post, relations):
+        return relations.post(post.pk, post.author_id)
 
 
 class PostRetrieveSerializer(PostSerializer):
+    """``likes`` and ``comments`` are the first few of them, with their
+    totals in the counts. The likes/ and comments/ sub-resources page
+    through the rest."""
+
     likes = serializers.SlugRelatedField(
-        many=True, read_only=True, slug_field="username"
+        source="preview_likes",
+        many=True,
+        read_only=True,
+        slug_field="username",
     )
     comments = CommentSerializer(
-        many=True, read_only=True, source="post_comments"
+        source="preview_comments", many=True, read_only=True
     )
 
     class Meta:
@@ -89,6 +136,9 @@ class PostRetrieveSerializer(PostSerializer):
             "title",
             "content",
             "image",
+            "image_status",
+            "image_srcset",
+            "comments_count",
             "comments",
             "likes_count",
             "likes",
@@ -96,3 +146,4 @@ class PostRetrieveSerializer(PostSerializer):
             "created_at",
             "changed_at",
         )
+        read_only_fields = ("image_status", "comments_count", "likes_count")
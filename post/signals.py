@@ -0,0 +1,142 @@
+from collections import Counter
+
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from media.pipeline import image_processed, register_image_field
+from post.models import Post, Comment, Tag
+from post.timeline import fan_out_post, retract_post
+from post.trending import record, trending_settings
+from social_media_api.cache import invalidate
+from social_media_api.signals import bulk_created
+from user.models import Notification
+from user.notifications import notify
+from user.recommendations import mark_changed
+
+register_image_field(Post, "image")
+
+
+@receiver(post_save, sender=Post)
+def push_new_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_timelines(sender, instance, **kwargs):
+    retract_post(instance)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    invalidate(f"post:{instance.pk}", f"comments:{instance.pk}")
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_post_comments(sender, instance, **kwargs):
+    invalidate(f"post:{instance.post_id}", f"comments:{instance.post_id}")
+
+
+@receiver(bulk_created, sender=Comment)
+def invalidate_bulk_comments(sender, instances, **kwargs):
+    post_ids = {comment.post_id for comment in instances}
+    invalidate(
+        *(f"post:{post_id}" for post_id in post_ids),
+        *(f"comments:{post_id}" for post_id in post_ids),
+    )
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, instance, **kwargs):
+    invalidate("tags")
+
+
+@receiver(bulk_created, sender=Tag)
+def invalidate_bulk_tags(sender, instances, **kwargs):
+    invalidate("tags")
+
+
+POST_RELATIONS = {
+    Post.likes.through: "likes",
+    Post.tags.through: "tags",
+}
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_relations(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        post_ids = [instance.pk]
+    elif pk_set is not None:
+        post_ids = pk_set
+    else:
+        post_ids = Post.objects.filter(
+            **{POST_RELATIONS[sender]: instance}
+        ).values_list("id", flat=True)
+    invalidate(*(f"post:{post_id}" for post_id in post_ids))
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def notify_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add":
+        return
+    if reverse:
+        for post_id in pk_set:
+            notify(Notification.Verb.LIKE, post_id, instance.pk)
+    else:
+        for user_id in pk_set:
+            notify(Notification.Verb.LIKE, instance.pk, user_id)
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def mark_likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Co-liker recommendations depend on the user's likes"""
+    if action in ("post_add", "post_remove"):
+        mark_changed([instance.pk] if reverse else pk_set)
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def score_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add":
+        return
+    weight = trending_settings()["LIKE_WEIGHT"]
+    if reverse:
+        record(dict.fromkeys(pk_set, weight))
+    else:
+        record({instance.pk: weight * len(pk_set)})
+
+
+@receiver(post_save, sender=Comment)
+def score_comment(sender, instance, created, **kwargs):
+    if created:
+        record({instance.post_id: trending_settings()["COMMENT_WEIGHT"]})
+
+
+@receiver(bulk_created, sender=Comment)
+def score_bulk_comments(sender, instances, **kwargs):
+    weight = trending_settings()["COMMENT_WEIGHT"]
+    comments = Counter(comment.post_id for comment in instances)
+    record(
+        {post_id: weight * count for post_id, count in comments.items()}
+    )
+
+
+@receiver(post_save, sender=Comment)
+def notify_comment(sender, instance, created, **kwargs):
+    if created:
+        notify(Notification.Verb.COMMENT, instance.post_id, instance.author_id)
+
+
+@receiver(bulk_created, sender=Comment)
+def notify_bulk_comments(sender, instances, **kwargs):
+    for comment in instances:
+        notify(Notification.Verb.COMMENT, comment.post_id, comment.author_id)
+
+
+@receiver(image_processed, sender=Post)
+def invalidate_processed_image(sender, object_id, **kwargs):
+    invalidate(f"post:{object_id}")
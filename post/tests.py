@@ -1,3 +1,1227 @@
-from django.test import TestCase
+import datetime
+import json
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from post.models import Tag, Post, Comment, PostScore, TimelineEntry
+from post.trending import score_of
+from post.serializers import PostSerializer
+from post.views import PostViewSet
+from social_media_api.cache import cache_stats, reset_cache_stats
+from social_media_api.testing import QueryBudgetMixin
+
+POST_URL = reverse("post:post-list")
+MY_BOARD_URL = reverse("post:post-user-posts")
+FOLLOWINGS_URL = reverse("post:post-get-following-posts")
+BULK_LIKE_URL = reverse("post:post-like-posts")
+BULK_COMMENT_URL = reverse("post:post-comment-posts")
+TAG_URL = reverse("post:tag-list")
+ASYNC_POST_URL = reverse("post:async-post-list")
+ASYNC_FOLLOWINGS_URL = reverse("post:async-post-followings")
+TRENDING_URL = reverse("post:trending")
+TRENDING_TAGS_URL = reverse("post:tags-trending")
+HALF_LIFE = datetime.timedelta(hours=6)
+
+
+def follow_url(user_id):
+    return reverse("user:follow", args=[user_id])
+
+
+def detail_url(post_id):
+    return reverse("post:post-detail", args=[post_id])
+
+
+def comments_url(post_id):
+    return reverse("post:post-comments", args=[post_id])
+
+
+def likes_url(post_id):
+    return reverse("post:post-likes", args=[post_id])
+
+
+def async_url(name, post_id):
+    return reverse(f"post:async-post-{name}", args=[post_id])
+
+
+def sample_user(email, **params):
+    return get_user_model().objects.create_user(
+        email, "password123", username=email.split("@")[0], **params
+    )
+
+
+class PostQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.author = sample_user("author@test.com")
+        self.user.follows.add(self.author)
+        self.tags = [Tag.objects.create(name=f"tag{i}") for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = self.create_posts(1, self.author)[0]
+
+    def create_posts(self, number, author):
+        posts = []
+        for i in range(number):
+            post = Post.objects.create(
+                title=f"Post {i}", content="content", author=author
+            )
+            post.tags.set(self.tags)
+            post.likes.add(self.user)
+            Comment.objects.create(post=post, author=self.user, content="hi")
+            posts.append(post)
+        return posts
+
+    def test_list_query_count_is_constant(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(POST_URL),
+            lambda: self.create_posts(5, self.author),
+            budget=3,
+        )
+
+    def test_my_board_query_count_is_constant(self):
+        self.create_posts(1, self.user)
+        self.assertConstantQueries(
+            lambda: self.client.get(MY_BOARD_URL),
+            lambda: self.create_posts(5, self.user),
+            budget=3,
+        )
+
+    def test_followings_query_count_is_constant(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(FOLLOWINGS_URL),
+            lambda: self.create_posts(5, self.author),
+            budget=4,
+        )
+
+    def test_retrieve_query_count_is_constant(self):
+        def grow():
+            for i in range(5):
+                liker = sample_user(f"liker{i}@test.com")
+                self.post.likes.add(liker)
+                Comment.objects.create(
+                    post=self.post, author=liker, content="hi"
+                )
+
+        self.assertConstantQueries(
+            lambda: self.client.get(detail_url(self.post.id)),
+            grow,
+            budget=4,
+        )
+
+    def test_comments_query_count_is_constant(self):
+        def grow():
+            for _ in range(5):
+                Comment.objects.create(
+                    post=self.post, author=self.author, content="hi"
+                )
+
+        self.assertConstantQueries(
+            lambda: self.client.get(comments_url(self.post.id)),
+            grow,
+            budget=3,
+        )
+
+
+class PostKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.posts = [
+            Post.objects.create(
+                title=f"Post {i}", content="content", author=self.user
+            )
+            for i in range(25)
+        ]
+
+    def test_walks_all_pages_forward_and_back(self):
+        seen = []
+        url = POST_URL
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.data["count"], 25)
+            seen.extend(post["id"] for post in res.data["results"])
+            last_page = res.data
+            url = res.data["next"]
+
+        self.assertEqual(seen, [post.id for post in self.posts])
+
+        res = self.client.get(last_page["previous"])
+        self.assertEqual(
+            [post["id"] for post in res.data["results"]],
+            [post.id for post in self.posts[10:20]],
+        )
+
+    def test_posts_of_the_same_time_are_ordered_by_title(self):
+        created_at = self.posts[0].created_at
+        Post.objects.update(created_at=created_at)
+        titles = sorted(post.title for post in self.posts)
+
+        seen = []
+        url = POST_URL
+        while url:
+            res = self.client.get(url)
+            seen.extend(post["title"] for post in res.data["results"])
+            url = res.data["next"]
+
+        self.assertEqual(seen, titles)
+        self.assertNotEqual(titles, [post.title for post in self.posts])
+
+    def test_tampered_cursor_is_rejected(self):
+        next_url = self.client.get(POST_URL).data["next"]
+        res = self.client.get(next_url[:-2] + "xx")
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_count_can_be_skipped(self):
+        res = self.client.get(POST_URL, {"count": "false"})
+
+        self.assertNotIn("count", res.data)
+        self.assertEqual(len(res.data["results"]), 10)
+
+    def test_page_number_mode_is_still_available(self):
+        res = self.client.get(POST_URL, {"page": 3})
+
+        self.assertEqual(res.data["count"], 25)
+        self.assertEqual(
+            [post["id"] for post in res.data["results"]],
+            [post.id for post in self.posts[20:]],
+        )
+
+
+class PostExportTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.author = sample_user("author@test.com")
+        self.user.follows.add(self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        tag = Tag.objects.create(name="tag")
+        self.posts = []
+        for i in range(5):
+            post = Post.objects.create(
+                title=f"Post {i}", content="content", author=self.user
+            )
+            post.tags.add(tag)
+            self.posts.append(post)
+
+    def export(self, url, params=None):
+        res = self.client.get(
+            url, params, HTTP_ACCEPT="application/x-ndjson"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in res.getvalue().splitlines()]
+
+    def test_my_board_is_paginated(self):
+        res = self.client.get(MY_BOARD_URL, {"page_size": 2})
+
+        self.assertEqual(res.data["count"], 5)
+        self.assertEqual(
+            [post["id"] for post in res.data["results"]],
+            [post.id for post in self.posts[:2]],
+        )
+        self.assertIsNotNone(res.data["next"])
+
+    def test_my_board_export_streams_every_post(self):
+        rows = self.export(MY_BOARD_URL)
+
+        self.assertEqual(
+            [row["id"] for row in rows], [post.id for post in self.posts]
+        )
+        page = self.client.get(MY_BOARD_URL, {"page_size": 5})
+        self.assertEqual(rows, json.loads(json.dumps(page.data["results"])))
+
+    @override_settings(STREAMING={"CHUNK_SIZE": 2})
+    def test_export_reads_rows_in_chunks(self):
+        res = self.client.get(MY_BOARD_URL, {"format": "ndjson"})
+        with CaptureQueriesContext(connection) as context:
+            chunks = list(res.streaming_content)
+
+        # One query for the rows and one tag prefetch per chunk
+        self.assertEqual(len(context.captured_queries), 1 + 3)
+        self.assertEqual(
+            [chunk.count(b"\n") for chunk in chunks], [2, 2, 1]
+        )
+
+    def test_followings_export(self):
+        post = Post.objects.create(
+            title="Followed", content="content", author=self.author
+        )
+
+        rows = self.export(FOLLOWINGS_URL)
+
+        self.assertEqual([row["id"] for row in rows], [post.id])
+        self.assertEqual(rows[0]["tags"], [])
+
+    def test_errors_are_rendered_as_ndjson(self):
+        self.client.force_authenticate(None)
+        res = self.client.get(MY_BOARD_URL, {"format": "ndjson"})
+
+        self.assertEqual(res.status_code, 401)
+        self.assertIn("detail", json.loads(res.content))
+
+
+class FollowingsTimelineTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.author = sample_user("author@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post(follow_url(self.author.id))
+
+    def create_post(self, author, title="Post"):
+        # Posts are fanned out once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(
+                title=title, content="text", author=author
+            )
+
+    def feed_ids(self, **params):
+        res = self.client.get(FOLLOWINGS_URL, params)
+        return [post["id"] for post in res.data["results"]]
+
+    def test_new_posts_are_pushed_to_followers_newest_first(self):
+        first = self.create_post(self.author)
+        second = self.create_post(self.author)
+        self.create_post(sample_user("stranger@test.com"))
+
+        self.assertEqual(self.feed_ids(), [second.id, first.id])
+
+    def test_deleted_post_leaves_the_timeline(self):
+        post = self.create_post(self.author)
+        post.delete()
+
+        self.assertEqual(self.feed_ids(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_follow_backfills_and_unfollow_clears(self):
+        other = sample_user("other@test.com")
+        post = self.create_post(other)
+
+        self.client.post(follow_url(other.id))
+        self.assertEqual(self.feed_ids(), [post.id])
+
+        self.client.delete(follow_url(other.id))
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_feed_is_paginated(self):
+        posts = [self.create_post(self.author) for _ in range(15)]
+
+        res = self.client.get(FOLLOWINGS_URL, {"page_size": 10})
+        second_page = self.client.get(res.data["next"])
+
+        self.assertEqual(len(res.data["results"]), 10)
+        self.assertEqual(
+            [post["id"] for post in second_page.data["results"]],
+            [post.id for post in reversed(posts[:5])],
+        )
+        self.assertIsNone(second_page.data["next"])
+
+    @override_settings(TIMELINE={"MAX_LENGTH": 3})
+    def test_trim_command_caps_timelines(self):
+        posts = [self.create_post(self.author) for _ in range(5)]
+        self.assertEqual(
+            TimelineEntry.objects.filter(owner=self.user).count(), 5
+        )
+
+        call_command("timelines", "trim", stdout=StringIO())
+
+        self.assertEqual(
+            TimelineEntry.objects.filter(owner=self.user).count(), 3
+        )
+        self.assertEqual(
+            self.feed_ids(), [post.id for post in reversed(posts[2:])]
+        )
+
+    def test_fan_out_waits_for_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Post.objects.create(
+                title="Post", content="text", author=self.author
+            )
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user).exists())
+
+    @override_settings(TIMELINE={"FANOUT_LIMIT": 1})
+    def test_popular_authors_are_merged_in_on_read(self):
+        self.author.refresh_from_db()
+        popular = self.create_post(self.author)
+        regular_author = sample_user("regular@test.com")
+        regular = self.create_post(regular_author)
+        self.client.post(follow_url(regular_author.id))
+        newest = self.create_post(self.author)
+
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.author).exists()
+        )
+        self.assertEqual(self.feed_ids(), [newest.id, regular.id, popular.id])
+
+
+class PostFilterTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.django = Tag.objects.create(name="django")
+        self.python = Tag.objects.create(name="python")
+        self.both = self.create_post("Django tips", [self.django, self.python])
+        self.only_django = self.create_post("Admin tricks", [self.django])
+        self.untagged = self.create_post("Weekend in Kyiv", [])
+
+    def create_post(self, title, tags):
+        post = Post.objects.create(
+            title=title, content="content", author=self.user
+        )
+        post.tags.set(tags)
+        return post
+
+    def result_ids(self, **params):
+        res = self.client.get(POST_URL, params)
+        return {post["id"] for post in res.data["results"]}
+
+    def test_filter_by_title(self):
+        self.assertEqual(self.result_ids(title="dJaNgo"), {self.both.id})
+
+    def test_filter_by_tags_requires_all_tags(self):
+        self.assertEqual(
+            self.result_ids(tags=f"{self.django.id}"),
+            {self.both.id, self.only_django.id},
+        )
+        self.assertEqual(
+            self.result_ids(tags=f"{self.django.id},{self.python.id}"),
+            {self.both.id},
+        )
+
+    def test_filter_by_title_and_tags(self):
+        self.assertEqual(
+            self.result_ids(title="admin", tags=f"{self.django.id}"),
+            {self.only_django.id},
+        )
+
+    def test_invalid_tag_ids_are_rejected(self):
+        res = self.client.get(POST_URL, {"tags": "4,seven"})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("tags", res.data)
+
+
+class PostResponseCacheTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(
+            title="Cached", content="content", author=self.user
+        )
+        reset_cache_stats()
+
+    def test_second_retrieve_is_served_from_cache(self):
+        self.client.get(detail_url(self.post.id))
+
+        with self.assertNumQueries(0):
+            res = self.client.get(detail_url(self.post.id))
+
+        self.assertEqual(res.data["title"], "Cached")
+        self.assertEqual(
+            cache_stats()["post-detail"], {"hits": 1, "misses": 1}
+        )
+
+    def test_pk_aliases_share_the_invalidated_scope(self):
+        alias = f"{POST_URL}0{self.post.id}/"
+        self.assertEqual(self.client.get(alias).data["likes_count"], 0)
+
+        self.post.add_like(self.user)
+
+        self.assertEqual(self.client.get(alias).data["likes_count"], 1)
+        self.assertEqual(
+            self.client.get(f"{POST_URL}x{self.post.id}/").status_code, 404
+        )
+
+    def test_read_before_commit_is_not_served_after_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.user)
+            # A concurrent request that read the rows before the commit
+            stale = mock.Mock(data={"likes_count": 0})
+            with mock.patch.object(
+                PostViewSet, "get_serializer", return_value=stale
+            ):
+                self.client.get(detail_url(self.post.id))
+
+        res = self.client.get(detail_url(self.post.id))
+        self.assertEqual(res.data["likes_count"], 1)
+
+    def test_comment_invalidates_post_and_comments(self):
+        self.client.get(detail_url(self.post.id))
+        self.client.get(comments_url(self.post.id))
+
+        self.client.post(
+            reverse("post:post-comment-post", args=[self.post.id]),
+            {"content": "new"},
+        )
+
+        res = self.client.get(detail_url(self.post.id))
+        self.assertEqual(len(res.data["comments"]), 1)
+        res = self.client.get(comments_url(self.post.id))
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_like_invalidates_post(self):
+        self.client.get(detail_url(self.post.id))
+
+        self.client.post(reverse("post:post-like-post", args=[self.post.id]))
+
+        res = self.client.get(detail_url(self.post.id))
+        self.assertEqual(res.data["likes_count"], 1)
+
+    def test_conditional_requests_get_304(self):
+        res = self.client.get(detail_url(self.post.id))
+
+        by_etag = self.client.get(
+            detail_url(self.post.id), HTTP_IF_NONE_MATCH=res["ETag"]
+        )
+        by_date = self.client.get(
+            detail_url(self.post.id),
+            HTTP_IF_MODIFIED_SINCE=res["Last-Modified"],
+        )
+
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+
+    def test_tag_rename_invalidates_tag_list(self):
+        tag = Tag.objects.create(name="old")
+        self.client.get(reverse("post:tag-list"))
+
+        tag.name = "new"
+        tag.save()
+
+        res = self.client.get(reverse("post:tag-list"))
+        self.assertEqual(res.data["results"][0]["name"], "new")
+
+
+class PostSubResourceTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(
+            title="Popular", content="content", author=self.user
+        )
+        self.likers = [sample_user(f"liker{i}@test.com") for i in range(5)]
+        for liker in self.likers:
+            self.post.add_like(liker)
+            Comment.objects.create(
+                post=self.post, author=liker, content=liker.username
+            )
+        # Counted by the views, not by ``Comment.objects.create``
+        Post.objects.filter(pk=self.post.pk).update(comments_count=5)
+
+    def test_detail_inlines_only_the_first_likes_and_comments(self):
+        res = self.client.get(detail_url(self.post.id))
+
+        self.assertEqual(res.data["likes_count"], 5)
+        self.assertEqual(res.data["comments_count"], 5)
+        self.assertEqual(res.data["likes"], ["liker0", "liker1", "liker2"])
+        self.assertEqual(
+            [comment["content"] for comment in res.data["comments"]],
+            ["liker0", "liker1", "liker2"],
+        )
+        async_res = self.client.get(async_url("detail", self.post.id))
+        self.assertEqual(async_res.json(), res.json())
+
+    def test_likes_are_paginated(self):
+        usernames = []
+        url = likes_url(self.post.id) + "?page_size=2&relations=true"
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data["count"], 5)
+            usernames += [user["username"] for user in res.data["results"]]
+            self.assertFalse(
+                any(user["followed_by_me"] for user in res.data["results"])
+            )
+            url = res.data["next"]
+
+        self.assertEqual(usernames, [liker.username for liker in self.likers])
+
+    def test_likes_query_count_is_constant(self):
+        def grow():
+            for i in range(5):
+                self.post.add_like(sample_user(f"more{i}@test.com"))
+
+        self.assertConstantQueries(
+            lambda: self.client.get(likes_url(self.post.id)),
+            grow,
+            budget=3,
+        )
+
+    def test_comments_are_paginated(self):
+        res = self.client.get(comments_url(self.post.id), {"page_size": 2})
+
+        self.assertEqual(res.data["count"], 5)
+        self.assertEqual(len(res.data["results"]), 2)
+        res = self.client.get(res.data["next"])
+        self.assertEqual(
+            [comment["content"] for comment in res.data["results"]],
+            ["liker2", "liker3"],
+        )
+
+    def test_missing_post(self):
+        self.assertEqual(self.client.get(likes_url(999)).status_code, 404)
+
+
+class PostRelationsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        reset_cache_stats()
+        self.user = sample_user("viewer@test.com")
+        self.followed = sample_user("followed@test.com")
+        self.follower = sample_user("follower@test.com")
+        self.user.follow(self.followed)
+        self.follower.follow(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.liked = Post.objects.create(
+            title="Liked", content="content", author=self.followed
+        )
+        self.liked.add_like(self.user)
+        self.other = Post.objects.create(
+            title="Other", content="content", author=self.follower
+        )
+
+    def relations(self, item):
+        return item["liked_by_me"], item["followed_by_me"], item["follows_me"]
+
+    def test_list_relations_cost_one_query_per_relation(self):
+        with self.assertQueryBudget(3) as plain:
+            self.client.get(POST_URL)
+
+        def grow():
+            for author in (self.followed, self.follower):
+                post = Post.objects.create(
+                    title="More", content="content", author=author
+                )
+                post.add_like(self.user)
+
+        self.assertConstantQueries(
+            lambda: self.client.get(POST_URL, {"relations": "true"}),
+            grow,
+            budget=len(plain.captured_queries) + 3,
+        )
+
+    def test_list_relations(self):
+        res = self.client.get(POST_URL, {"relations": "true"})
+
+        self.assertEqual(
+            [self.relations(item) for item in res.data["results"]],
+            [(True, True, False), (False, False, True)],
+        )
+        res = self.client.get(POST_URL)
+        self.assertNotIn("liked_by_me", res.data["results"][0])
+
+    def test_cached_detail_is_personalized_per_viewer(self):
+        url = detail_url(self.liked.id)
+        res = self.client.get(url, {"relations": "true"})
+        self.assertEqual(self.relations(res.data), (True, True, False))
+        self.assertNotIn("ETag", res)
+
+        self.client.force_authenticate(self.follower)
+        res = self.client.get(url, {"relations": "true"})
+        self.assertEqual(self.relations(res.data), (False, False, False))
+        res = self.client.get(url)
+        self.assertNotIn("liked_by_me", res.data)
+        self.assertEqual(
+            cache_stats()["post-detail"], {"hits": 1, "misses": 2}
+        )
+
+    def test_async_detail_is_personalized(self):
+        res = self.client.get(
+            async_url("detail", self.other.id), {"relations": "true"}
+        )
+
+        self.assertEqual(self.relations(res.data), (False, False, True))
+
+
+class IdempotentLikeTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("liker@test.com")
+        self.post = Post.objects.create(
+            title="post", content="content", author=self.user
+        )
+        self.url = reverse("post:post-like", args=[self.post.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_patch_keeps_concurrent_likes(self):
+        update = PostSerializer.update
+        fan = sample_user("fan@test.com")
+
+        def update_after_like(serializer, instance, validated_data):
+            # Another request likes the post after this one loaded it
+            Post.objects.get(pk=instance.pk).add_like(fan)
+            return update(serializer, instance, validated_data)
+
+        with mock.patch.object(PostSerializer, "update", update_after_like):
+            res = self.client.patch(
+                detail_url(self.post.id), {"title": "edited"}
+            )
+
+        self.assertEqual(res.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, "edited")
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_repeated_put_likes_once(self):
+        for _ in range(3):
+            res = self.client.put(self.url)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data, {"liked": True, "likes_count": 1})
+
+        self.assertEqual(self.post.likes.count(), 1)
+
+    def test_repeated_delete_unlikes_once(self):
+        self.client.put(self.url)
+        for _ in range(3):
+            res = self.client.delete(self.url)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data, {"liked": False, "likes_count": 0})
+
+        self.assertFalse(self.post.likes.exists())
+
+    def test_like_is_constant_queries(self):
+        for i in range(20):
+            self.post.add_like(sample_user(f"fan{i}@test.com"))
+
+        # Including the upsert marking the user's recommendations stale
+        # and the insert and update of the post's trending score
+        with self.assertNumQueries(12):
+            self.client.put(self.url)
+        with self.assertNumQueries(7):
+            self.client.delete(self.url)
+
+
+class ConcurrentLikeTests(TransactionTestCase):
+    def test_concurrent_likes_keep_counter_exact(self):
+        author = sample_user("author@test.com")
+        post = Post.objects.create(
+            title="post", content="content", author=author
+        )
+        users = [sample_user(f"fan{i}@test.com") for i in range(8)]
+        barrier = threading.Barrier(len(users) * 2)
+        errors = []
+
+        def like(user):
+            try:
+                barrier.wait()
+                for _ in range(5):
+                    while True:
+                        try:
+                            Post.objects.get(pk=post.pk).add_like(user)
+                            break
+                        except OperationalError:
+                            # The in-memory SQLite test database locks
+                            # whole tables instead of waiting, the write
+                            # was rolled back and is simply retried
+                            time.sleep(0.001)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        # Every user likes the post from two threads at once
+        threads = [
+            threading.Thread(target=like, args=(user,))
+            for user in users + users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        post.refresh_from_db()
+        self.assertEqual(post.likes.count(), len(users))
+        self.assertEqual(post.likes_count, len(users))
+
+
+class BulkWriteTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.author = sample_user("author@test.com")
+        self.posts = [
+            Post.objects.create(
+                title=f"post {i}", content="content", author=self.author
+            )
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_like_reports_each_operation(self):
+        first, second, third = self.posts
+        third.add_like(self.user)
+
+        res = self.client.post(
+            BULK_LIKE_URL,
+            [
+                {"post": first.id, "action": "like"},
+                {"post": second.id, "action": "unlike"},
+                {"post": third.id, "action": "unlike"},
+                {"post": 999, "action": "like"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in res.data["results"]],
+            ["created", "unchanged", "deleted", "not_found"],
+        )
+        counts = dict(Post.objects.values_list("id", "likes_count"))
+        self.assertEqual(
+            [counts[post.id] for post in self.posts], [1, 0, 0]
+        )
+        self.assertEqual(
+            list(self.user.liked_posts.values_list("id", flat=True)),
+            [first.id],
+        )
+
+    def test_bulk_like_is_constant_queries(self):
+        def bulk_like(action):
+            self.client.post(
+                BULK_LIKE_URL,
+                [{"post": post.id, "action": action} for post in self.posts],
+                format="json",
+            )
+
+        def grow():
+            bulk_like("unlike")
+            self.posts += [
+                Post.objects.create(
+                    title="more", content="content", author=self.author
+                )
+                for _ in range(5)
+            ]
+
+        self.assertConstantQueries(lambda: bulk_like("like"), grow, 12)
+
+    def test_bulk_like_rejects_duplicates_and_oversized_requests(self):
+        post = self.posts[0]
+        duplicated = [{"post": post.id, "action": "like"}] * 2
+        res = self.client.post(BULK_LIKE_URL, duplicated, format="json")
+        self.assertEqual(res.status_code, 400)
+
+        with override_settings(BULK_WRITES={"MAX_ITEMS": 2}):
+            res = self.client.post(
+                BULK_LIKE_URL,
+                [{"post": post.id, "action": "like"} for post in self.posts],
+                format="json",
+            )
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(post.likes.exists())
+
+    def test_bulk_comment_creates_comments_and_counts(self):
+        first, second, _ = self.posts
+        self.client.get(comments_url(first.id))
+
+        res = self.client.post(
+            BULK_COMMENT_URL,
+            [
+                {"post": first.id, "content": "one"},
+                {"post": first.id, "content": "two"},
+                {"post": second.id, "content": "three"},
+                {"post": 999, "content": "lost"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, 200)
+        results = res.data["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "created", "created", "not_found"],
+        )
+        self.assertEqual(
+            Comment.objects.get(id=results[2]["id"]).content, "three"
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.comments_count, 2)
+        self.assertEqual(second.comments_count, 1)
+        res = self.client.get(comments_url(first.id))
+        self.assertEqual(len(res.data["results"]), 2)
+
+    def test_tags_are_upserted_by_name(self):
+        existing = Tag.objects.create(name="django")
+        self.client.get(TAG_URL)
+
+        with self.assertQueryBudget(4):
+            res = self.client.post(
+                TAG_URL,
+                [{"name": "django"}, {"name": "python"}, {"name": "django"}],
+                format="json",
+            )
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(
+            [tag["name"] for tag in res.data], ["django", "python"]
+        )
+        self.assertEqual(res.data[0]["id"], existing.id)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(len(self.client.get(TAG_URL).data["results"]), 2)
+
+    def test_single_tag_create_returns_existing_tag(self):
+        existing = Tag.objects.create(name="django")
+
+        res = self.client.post(TAG_URL, {"name": "django"})
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data, {"id": existing.id, "name": "django"})
+
+
+class AsyncViewTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.author = sample_user("author@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.put(follow_url(self.author.id))
+        tags = [Tag.objects.create(name=f"tag{i}") for i in range(2)]
+        for i in range(3):
+            post = Post.objects.create(
+                title=f"Post {i}", content="content", author=self.author
+            )
+            post.tags.set(tags)
+            post.add_like(self.user)
+            self.client.post(
+                reverse("post:post-comment-post", args=[post.id]),
+                {"content": "hi"},
+            )
+        self.post = post
+
+    def test_reads_match_the_sync_views(self):
+        pairs = [
+            (POST_URL, ASYNC_POST_URL),
+            (FOLLOWINGS_URL, ASYNC_FOLLOWINGS_URL),
+        ]
+        for sync_url, async_url_ in pairs:
+            sync_res = self.client.get(sync_url)
+            async_res = self.client.get(async_url_)
+            self.assertEqual(async_res.status_code, 200)
+            self.assertEqual(
+                async_res.data["results"], sync_res.data["results"]
+            )
+
+        for sync_url, name in [
+            (detail_url(self.post.id), "detail"),
+            (comments_url(self.post.id), "comments"),
+        ]:
+            async_res = self.client.get(async_url(name, self.post.id))
+            self.assertEqual(async_res.status_code, 200)
+            self.assertEqual(
+                async_res.json(), self.client.get(sync_url).json()
+            )
+            self.assertIn("ETag", async_res)
+
+    def test_retrieve_query_count_is_constant(self):
+        def grow():
+            for i in range(5):
+                self.post.add_like(sample_user(f"liker{i}@test.com"))
+
+        self.assertConstantQueries(
+            lambda: self.client.get(async_url("detail", self.post.id)),
+            grow,
+            budget=4,
+        )
+
+    def test_list_filters_and_paginates(self):
+        res = self.client.get(ASYNC_POST_URL, {"page_size": 2})
+        self.assertEqual(res.data["count"], 3)
+        self.assertEqual(len(res.data["results"]), 2)
+        res = self.client.get(res.data["next"])
+        self.assertEqual(len(res.data["results"]), 1)
+
+        res = self.client.get(ASYNC_POST_URL, {"title": "Post 1"})
+        self.assertEqual(
+            [post["title"] for post in res.data["results"]], ["Post 1"]
+        )
+        res = self.client.get(ASYNC_POST_URL, {"tags": "x"})
+        self.assertEqual(res.status_code, 400)
+
+    def test_like_is_idempotent(self):
+        url = async_url("like", self.post.id)
+
+        res = self.client.delete(url)
+        self.assertEqual(res.data, {"liked": False, "likes_count": 0})
+        res = self.client.delete(url)
+        self.assertEqual(res.data, {"liked": False, "likes_count": 0})
+        self.client.put(url)
+        res = self.client.put(url)
+        self.assertEqual(res.data, {"liked": True, "likes_count": 1})
+
+    def test_comment_invalidates_cached_comments(self):
+        url = async_url("comments", self.post.id)
+        self.assertEqual(len(self.client.get(url).data["results"]), 1)
+
+        res = self.client.post(url, {"content": "async"})
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(self.client.get(url).data["results"]), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+    def test_comments_are_written_by_the_model_for_both_views(self):
+        urls = (
+            reverse("post:post-comment-post", args=[self.post.id]),
+            async_url("comments", self.post.id),
+        )
+        add_comment_ = Post.add_comment
+        with mock.patch.object(
+            Post, "add_comment", autospec=True, side_effect=add_comment_
+        ) as add_comment:
+            responses = [
+                self.client.post(url, {"content": "same"}) for url in urls
+            ]
+
+        self.assertEqual(add_comment.call_count, 2)
+        self.assertEqual(
+            [set(res.data) for res in responses],
+            [{"id", "content", "created_at"}] * 2,
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 3)
+
+    def test_missing_post_and_anonymous_user(self):
+        self.assertEqual(
+            self.client.get(async_url("detail", 999)).status_code, 404
+        )
+        self.assertEqual(
+            self.client.put(async_url("like", 999)).status_code, 404
+        )
+        self.assertEqual(APIClient().get(ASYNC_POST_URL).status_code, 401)
+
+
+@override_settings(ASYNC_VIEWS={"CONCURRENT_QUERIES": True})
+class ConcurrentQueryTests(TransactionTestCase):
+    def test_retrieve_with_queries_on_own_connections(self):
+        user = sample_user("viewer@test.com")
+        post = Post.objects.create(
+            title="post", content="content", author=user
+        )
+        post.add_like(user)
+        Comment.objects.create(post=post, author=user, content="hi")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(async_url("detail", post.id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["likes"], ["viewer"])
+        self.assertEqual(len(res.data["comments"]), 1)
+
+
+class TrendingTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        clock = mock.patch("post.trending.now", lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.likers = [sample_user(f"liker{i}@test.com") for i in range(3)]
+
+    def create_post(self, title, *tags):
+        post = Post.objects.create(
+            title=title, content="content", author=self.user
+        )
+        post.tags.set(Tag.objects.get_or_create(name=tag)[0] for tag in tags)
+        return post
+
+    def like(self, post, likes):
+        for liker in self.likers[:likes]:
+            post.add_like(liker)
+
+    def score(self, post) -> float:
+        return score_of(PostScore.objects.get(post=post).log_score)
+
+    def test_likes_and_comments_decay_with_the_half_life(self):
+        post = self.create_post("Post")
+        self.like(post, 1)
+        self.client.post(
+            reverse("post:post-comment-post", args=[post.id]),
+            {"content": "hi"},
+        )
+        self.assertAlmostEqual(self.score(post), 3.0)
+
+        self.now += HALF_LIFE
+        self.assertAlmostEqual(self.score(post), 1.5)
+
+        self.client.post(
+            reverse("post:post-comment-posts"),
+            [{"post": post.id, "content": "one"}] * 2,
+            format="json",
+        )
+        self.assertAlmostEqual(self.score(post), 5.5)
+
+    def test_recent_activity_outranks_older_activity(self):
+        older = self.create_post("Older")
+        newer = self.create_post("Newer")
+        self.like(older, 3)
+        self.now += 2 * HALF_LIFE
+        self.like(newer, 1)
+
+        with self.assertQueryBudget(2):
+            res = self.client.get(TRENDING_URL)
+
+        self.assertEqual(
+            [post["title"] for post in res.data], ["Newer", "Older"]
+        )
+        self.assertAlmostEqual(self.score(older), 0.75)
+
+    def test_decayed_posts_drop_out_and_are_pruned(self):
+        post = self.create_post("Post")
+        self.like(post, 1)
+        self.now += 4 * HALF_LIFE
+
+        self.assertEqual(self.client.get(TRENDING_URL).data, [])
+        call_command("trending", stdout=StringIO())
+        self.assertFalse(PostScore.objects.exists())
+
+    def test_tags_are_ranked_by_their_posts_scores(self):
+        self.like(self.create_post("One", "django", "python"), 1)
+        self.like(self.create_post("Two", "python"), 1)
+        self.like(self.create_post("Three", "rust"), 3)
+        self.now += HALF_LIFE
+
+        call_command("trending", stdout=StringIO())
+        with self.assertQueryBudget(1):
+            res = self.client.get(TRENDING_TAGS_URL)
+
+        self.assertEqual(
+            [(tag["name"], round(tag["score"], 3)) for tag in res.data],
+            [("rust", 1.5), ("python", 1.0), ("django", 0.5)],
+        )
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrates ``app`` back to ``migrate_from`` for ``setUpBeforeMigration``
+    to write rows with the historical models, then forward to
+    ``migrate_to``"""
+
+    app = "post"
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([(self.app, self.migrate_from)])
+        executor.loader.build_graph()
+        self.setUpBeforeMigration(
+            executor.loader.project_state((self.app, self.migrate_from)).apps
+        )
+        executor.migrate([(self.app, self.migrate_to)])
+        executor.loader.build_graph()
+        self.apps = executor.loader.project_state(
+            (self.app, self.migrate_to)
+        ).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+
+class PostTagMigrationTests(MigrationTestCase):
+    migrate_from = "0002_initial"
+    migrate_to = "0003_posttag"
+
+    def setUpBeforeMigration(self, apps):
+        user = apps.get_model("user", "User").objects.create(
+            email="author@test.com", username="author"
+        )
+        post = apps.get_model("post", "Post").objects.create(
+            title="Post", content="content", author_id=user.pk
+        )
+        Tag = apps.get_model("post", "Tag")
+        post.tags.add(
+            Tag.objects.create(name="a"), Tag.objects.create(name="b")
+        )
+        self.post_id = post.pk
+
+    def test_existing_tags_are_kept(self):
+        PostTag = self.apps.get_model("post", "PostTag")
+
+        self.assertEqual(
+            sorted(
+                PostTag.objects.filter(post_id=self.post_id).values_list(
+                    "tag__name", flat=True
+                )
+            ),
+            ["a", "b"],
+        )
+
+
+class DuplicateTagMigrationTests(MigrationTestCase):
+    migrate_from = "0003_posttag"
+    migrate_to = "0005_alter_tag_name"
+
+    def setUpBeforeMigration(self, apps):
+        user = apps.get_model("user", "User").objects.create(
+            email="author@test.com", username="author"
+        )
+        Post = apps.get_model("post", "Post")
+        Tag = apps.get_model("post", "Tag")
+        self.kept, duplicate, other = (
+            Tag.objects.create(name="python"),
+            Tag.objects.create(name="python"),
+            Tag.objects.create(name="django"),
+        )
+        both, moved = (
+            Post.objects.create(
+                title=title, content="content", author_id=user.pk
+            )
+            for title in ("Both", "Moved")
+        )
+        both.tags.add(self.kept, duplicate, other)
+        moved.tags.add(duplicate)
+        self.both, self.moved = both.pk, moved.pk
+
+    def test_duplicates_are_merged_into_the_oldest_tag(self):
+        Tag = self.apps.get_model("post", "Tag")
+        PostTag = self.apps.get_model("post", "PostTag")
+
+        self.assertEqual(
+            sorted(Tag.objects.values_list("name", flat=True)),
+            ["django", "python"],
+        )
+        self.assertEqual(Tag.objects.get(name="python").pk, self.kept.pk)
+        self.assertEqual(
+            sorted(
+                PostTag.objects.values_list("post_id", "tag__name")
+            ),
+            sorted(
+                [
+                    (self.both, "python"),
+                    (self.both, "django"),
+                    (self.moved, "python"),
+                ]
+            ),
+        )
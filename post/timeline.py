@@ -0,0 +1,355 @@
+"""Materialized home timelines for the followings feed.
+
+New posts are pushed into every follower's timeline once they are
+committed (fan-out on write), so reading a feed page is a single range
+read on the owner's timeline. Timelines are capped at ``MAX_LENGTH``
+entries by the periodic ``timelines trim`` command (the Redis backend
+also trims on push). Authors with more than ``FANOUT_LIMIT`` followers
+are not fanned out; their posts are merged in at read time (fan-out on
+read) to keep writes cheap.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from post.models import Post, TimelineEntry
+
+DEFAULTS = {
+    "BACKEND": "post.timeline.DatabaseTimeline",
+    "MAX_LENGTH": 800,
+    "FANOUT_LIMIT": 10_000,
+    "BATCH_SIZE": 1000,
+    "OPTIONS": {},
+}
+
+
+def timeline_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "TIMELINE", {})}
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BaseTimeline:
+    """Storage of ``(created_at, post_id)`` entries per timeline owner,
+    newest first"""
+
+    def __init__(self, max_length: int, batch_size: int, **options):
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+    def push(self, post: Post, owner_ids: list[int]) -> None:
+        raise NotImplementedError
+
+    def remove(self, post: Post) -> None:
+        raise NotImplementedError
+
+    def backfill(self, owner_id: int, posts: list[Post]) -> None:
+        raise NotImplementedError
+
+    def remove_author(self, owner_id: int, author_id: int) -> None:
+        raise NotImplementedError
+
+    def read(
+        self, owner_id: int, before: tuple | None, limit: int
+    ) -> list[tuple[datetime, int]]:
+        raise NotImplementedError
+
+    def trim(self, owner_ids: list[int]) -> None:
+        raise NotImplementedError
+
+
+class DatabaseTimeline(BaseTimeline):
+    """Timelines stored as ``TimelineEntry`` rows.
+
+    Pushes only insert: trimming windows over every entry of the
+    owners, so it is left to the periodic ``timelines trim`` command.
+    """
+
+    def push(self, post, owner_ids):
+        for batch in chunked(owner_ids, self.batch_size):
+            TimelineEntry.objects.bulk_create(
+                [
+                    TimelineEntry(
+                        owner_id=owner_id,
+                        post_id=post.pk,
+                        author_id=post.author_id,
+                        created_at=post.created_at,
+                    )
+                    for owner_id in batch
+                ],
+                ignore_conflicts=True,
+            )
+
+    def remove(self, post):
+        # Entries are deleted together with the post by ON DELETE CASCADE
+        pass
+
+    def backfill(self, owner_id, posts):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    owner_id=owner_id,
+                    post_id=post.pk,
+                    author_id=post.author_id,
+                    created_at=post.created_at,
+                )
+                for post in posts
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def remove_author(self, owner_id, author_id):
+        TimelineEntry.objects.filter(
+            owner_id=owner_id, author_id=author_id
+        ).delete()
+
+    def read(self, owner_id, before, limit):
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        if before is not None:
+            created_at, post_id = before
+            entries = entries.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, post_id__lt=post_id)
+            )
+
+        return list(
+            entries.order_by("-created_at", "-post_id").values_list(
+                "created_at", "post_id"
+            )[:limit]
+        )
+
+    def trim(self, owner_ids):
+        """Deletes all but the newest ``max_length`` entries of every
+        owner, one statement per batch of owners"""
+        for batch in chunked(list(owner_ids), self.batch_size):
+            excess = (
+                TimelineEntry.objects.filter(owner_id__in=batch)
+                .annotate(
+                    position=Window(
+                        RowNumber(),
+                        partition_by=F("owner_id"),
+                        order_by=[
+                            F("created_at").desc(),
+                            F("post_id").desc(),
+                        ],
+                    )
+                )
+                .filter(position__gt=self.max_length)
+                .values("pk")
+            )
+            TimelineEntry.objects.filter(pk__in=excess).delete()
+
+
+class RedisTimeline(BaseTimeline):
+    """Timelines stored as Redis sorted sets scored by the post's
+    creation time in microseconds"""
+
+    def __init__(
+        self,
+        max_length,
+        batch_size,
+        url="redis://localhost:6379/0",
+        key_prefix="timeline",
+        **options,
+    ):
+        super().__init__(max_length, batch_size)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                "RedisTimeline requires the 'redis' package."
+            )
+        self.client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+
+    def key(self, owner_id) -> str:
+        return f"{self.key_prefix}:{owner_id}"
+
+    @staticmethod
+    def score(created_at: datetime) -> int:
+        return int(created_at.timestamp() * 1_000_000)
+
+    @staticmethod
+    def from_score(score) -> datetime:
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return epoch + timedelta(microseconds=int(score))
+
+    def push(self, post, owner_ids):
+        score = self.score(post.created_at)
+        for batch in chunked(owner_ids, self.batch_size):
+            pipeline = self.client.pipeline(transaction=False)
+            for owner_id in batch:
+                pipeline.zadd(self.key(owner_id), {post.pk: score})
+                pipeline.zremrangebyrank(
+                    self.key(owner_id), 0, -self.max_length - 1
+                )
+            pipeline.execute()
+
+    def remove(self, post):
+        for batch in chunked(follower_ids(post.author_id), self.batch_size):
+            pipeline = self.client.pipeline(transaction=False)
+            for owner_id in batch:
+                pipeline.zrem(self.key(owner_id), post.pk)
+            pipeline.execute()
+
+    def backfill(self, owner_id, posts):
+        if not posts:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.zadd(
+            self.key(owner_id),
+            {post.pk: self.score(post.created_at) for post in posts},
+        )
+        pipeline.zremrangebyrank(self.key(owner_id), 0, -self.max_length - 1)
+        pipeline.execute()
+
+    def remove_author(self, owner_id, author_id):
+        post_ids = list(
+            Post.objects.filter(author_id=author_id)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)[: self.max_length]
+        )
+        if post_ids:
+            self.client.zrem(self.key(owner_id), *post_ids)
+
+    def read(self, owner_id, before, limit):
+        maximum = "+inf" if before is None else self.score(before[0])
+        # Entries sharing the cursor's score are filtered out below,
+        # so read a few more than needed
+        members = self.client.zrevrangebyscore(
+            self.key(owner_id),
+            maximum,
+            "-inf",
+            start=0,
+            num=limit + 16,
+            withscores=True,
+        )
+        entries = []
+        for member, score in members:
+            entry = (self.from_score(score), int(member))
+            if before is None or entry < tuple(before):
+                entries.append(entry)
+
+        return entries[:limit]
+
+    def trim(self, owner_ids):
+        for batch in chunked(owner_ids, self.batch_size):
+            pipeline = self.client.pipeline(transaction=False)
+            for owner_id in batch:
+                pipeline.zremrangebyrank(
+                    self.key(owner_id), 0, -self.max_length - 1
+                )
+            pipeline.execute()
+
+
+_timeline = None
+
+
+def get_timeline() -> BaseTimeline:
+    """Returns the configured timeline backend"""
+    global _timeline
+    if _timeline is None:
+        config = timeline_settings()
+        backend = import_string(config["BACKEND"])
+        _timeline = backend(
+            max_length=config["MAX_LENGTH"],
+            batch_size=config["BATCH_SIZE"],
+            **config["OPTIONS"],
+        )
+    return _timeline
+
+
+@receiver(setting_changed)
+def reset_timeline(*, setting, **kwargs):
+    global _timeline
+    if setting == "TIMELINE":
+        _timeline = None
+
+
+def is_fanned_out(author) -> bool:
+    """Authors above ``FANOUT_LIMIT`` followers are read on demand"""
+    return author.followers_count < timeline_settings()["FANOUT_LIMIT"]
+
+
+def follower_ids(author_id: int) -> list[int]:
+    follows = get_user_model().follows.through
+    return list(
+        follows.objects.filter(to_user_id=author_id).values_list(
+            "from_user_id", flat=True
+        )
+    )
+
+
+def fan_out_post(post: Post) -> None:
+    """Pushes a new post into its author's followers' timelines once
+    it is committed, outside of the request's transaction"""
+
+    def push():
+        if is_fanned_out(post.author):
+            get_timeline().push(post, follower_ids(post.author_id))
+
+    transaction.on_commit(push)
+
+
+def retract_post(post: Post) -> None:
+    """Removes a deleted post from every timeline it was pushed to"""
+    transaction.on_commit(lambda: get_timeline().remove(post))
+
+
+def follow_author(user, author) -> None:
+    """Backfills the latest posts of a newly followed author"""
+    if not is_fanned_out(author):
+        return
+    posts = list(
+        Post.objects.filter(author=author)
+        .order_by("-created_at", "-id")
+        .only("id", "author_id", "created_at")[
+            : timeline_settings()["MAX_LENGTH"]
+        ]
+    )
+    get_timeline().backfill(user.pk, posts)
+
+
+def unfollow_author(user, author) -> None:
+    get_timeline().remove_author(user.pk, author.pk)
+
+
+def read_feed(
+    user, before: tuple | None, limit: int
+) -> list[tuple[datetime, int]]:
+    """Returns up to ``limit`` ``(created_at, post_id)`` feed entries
+    older than ``before``, merging in posts of followed authors that
+    are not fanned out"""
+    entries = get_timeline().read(user.pk, before, limit)
+
+    unfanned_authors = list(
+        user.follows.filter(
+            followers_count__gte=timeline_settings()["FANOUT_LIMIT"]
+        ).values_list("id", flat=True)
+    )
+    if unfanned_authors:
+        posts = Post.objects.filter(author_id__in=unfanned_authors)
+        if before is not None:
+            created_at, post_id = before
+            posts = posts.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=post_id)
+            )
+        pulled = posts.order_by("-created_at", "-id").values_list(
+            "created_at", "id"
+        )[:limit]
+        entries = sorted(set(entries) | set(pulled), reverse=True)[:limit]
+
+    return entries
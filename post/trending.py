@@ -0,0 +1,158 @@
+"""Trending posts and tags, ranked by time-decayed likes and comments.
+
+Every like adds ``LIKE_WEIGHT`` to the score of its post and every
+comment ``COMMENT_WEIGHT``, and scores halve every ``HALF_LIFE``
+seconds. Decaying every row as time passes would rewrite the whole
+table, so ``PostScore`` keeps the logarithm of the score on a fixed
+time axis instead:
+
+    log_score = log2(sum(weight * 2 ** ((at - EPOCH) / HALF_LIFE)))
+
+Time decays all scores alike, which only shifts their logarithms, so
+ordering by ``log_score`` ranks posts by their current score and the
+trending posts are an indexed read. An event is added in place with
+``log2(2 ** a + 2 ** b) = max(a, b) + log2(1 + 2 ** -|a - b|)``, and
+``log_score`` grows by one per half-life, far from float limits.
+
+``manage.py trending`` periodically deletes scores decayed below
+``MIN_SCORE`` and ranks the ``TOP_N`` tags by the sum of the current
+scores of their posts, computed by the database in one aggregate.
+Unlikes and deleted comments are not subtracted; they fade with the
+rest of the score.
+"""
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from post.models import Post, PostScore, PostTag, TagTrend
+from social_media_api.replicas import replica_reads
+
+DEFAULTS = {
+    "HALF_LIFE": 6 * 60 * 60,
+    "LIKE_WEIGHT": 1.0,
+    "COMMENT_WEIGHT": 2.0,
+    "MIN_SCORE": 0.1,
+    "TOP_N": 50,
+    "INTERVAL": 300,
+}
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+# Half-lives below the current time of the score of new rows, which
+# vanishes in the float precision of the first event added to it
+NEGLIGIBLE = 64
+
+
+def trending_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "TRENDING", {})}
+
+
+def now() -> datetime.datetime:
+    """The clock of the scores, replaced in tests"""
+    return timezone.now()
+
+
+def log_time(at, config) -> float:
+    """Half-lives from ``EPOCH`` to ``at``"""
+    return (at - EPOCH).total_seconds() / config["HALF_LIFE"]
+
+
+def log_threshold(at, config) -> float:
+    """Lowest ``log_score`` of posts still trending at ``at``"""
+    return math.log2(config["MIN_SCORE"]) + log_time(at, config)
+
+
+def log_add(log_score, log_weight):
+    return Greatest(log_score, log_weight) + Log(
+        2.0, 1.0 + Power(2.0, -Abs(log_score - log_weight))
+    )
+
+
+def record(weights, at=None) -> None:
+    """Adds events weighing ``{post_id: weight}`` at ``at`` to the
+    scores, in one insert and one update per distinct weight"""
+    weights = {
+        post_id: weight for post_id, weight in weights.items() if weight
+    }
+    if not weights:
+        return
+    config = trending_settings()
+    at_log = log_time(at or now(), config)
+
+    # Missing rows are created with a negligible score first, so every
+    # event is added by the same atomic update, even when the first
+    # events of a post race to create its row
+    PostScore.objects.bulk_create(
+        [
+            PostScore(post_id=post_id, log_score=at_log - NEGLIGIBLE)
+            for post_id in weights
+        ],
+        ignore_conflicts=True,
+    )
+    by_weight = defaultdict(list)
+    for post_id, weight in weights.items():
+        by_weight[weight].append(post_id)
+    for weight, post_ids in by_weight.items():
+        PostScore.objects.filter(post_id__in=post_ids).update(
+            log_score=log_add(
+                F("log_score"), Value(math.log2(weight) + at_log)
+            )
+        )
+
+
+def score_of(log_score, at=None) -> float:
+    """Current score of a ``log_score``"""
+    return 2 ** (log_score - log_time(at or now(), trending_settings()))
+
+
+def trending_posts(at=None):
+    """The ``TOP_N`` posts with the highest current scores"""
+    config = trending_settings()
+    return Post.objects.filter(
+        trending_score__log_score__gte=log_threshold(at or now(), config)
+    ).order_by("-trending_score__log_score", "id")[: config["TOP_N"]]
+
+
+def prune(at=None) -> int:
+    """Deletes the scores decayed below ``MIN_SCORE``, returns how
+    many"""
+    config = trending_settings()
+    deleted, _ = PostScore.objects.filter(
+        log_score__lt=log_threshold(at or now(), config)
+    ).delete()
+    return deleted
+
+
+def rank_tags(at=None) -> int:
+    """Replaces the trending tags with the ``TOP_N`` tags whose posts
+    have the highest sum of current scores, returns how many"""
+    config = trending_settings()
+    at = at or now()
+    log_score = F("post__trending_score__log_score")
+    with replica_reads():
+        ranking = list(
+            PostTag.objects.filter(
+                post__trending_score__log_score__gte=log_threshold(at, config)
+            )
+            .values("tag_id")
+            .annotate(
+                score=Sum(Power(2.0, log_score - Value(log_time(at, config))))
+            )
+            .order_by("-score", "tag_id")
+            .values_list("tag_id", "score")[: config["TOP_N"]]
+        )
+
+    with transaction.atomic():
+        TagTrend.objects.all().delete()
+        TagTrend.objects.bulk_create(
+            [
+                TagTrend(tag_id=tag_id, rank=rank, score=score)
+                for rank, (tag_id, score) in enumerate(ranking)
+            ]
+        )
+    return len(ranking)
@@ -1,13 +1,55 @@
-from django.urls import path, include
+from django.urls import path
 from rest_framework import routers
 
-from post.views import TagViewSet, PostViewSet, CommentViewSet
+from post.async_views import (
+    AsyncCommentsView,
+    AsyncFeedView,
+    AsyncLikeView,
+    AsyncPostDetailView,
+    AsyncPostListView,
+)
+from post.views import (
+    CommentViewSet,
+    PostViewSet,
+    TagViewSet,
+    TrendingPostView,
+    TrendingTagView,
+)
 
 router = routers.DefaultRouter()
 router.register("tags", TagViewSet)
 router.register("posts", PostViewSet)
 router.register("comments", CommentViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("trending/", TrendingPostView.as_view(), name="trending"),
+    path(
+        "tags/trending/", TrendingTagView.as_view(), name="tags-trending"
+    ),
+    # Async variants of the hot endpoints, served natively under ASGI
+    path(
+        "async/posts/", AsyncPostListView.as_view(), name="async-post-list"
+    ),
+    path(
+        "async/posts/followings/",
+        AsyncFeedView.as_view(),
+        name="async-post-followings",
+    ),
+    path(
+        "async/posts/<int:pk>/",
+        AsyncPostDetailView.as_view(),
+        name="async-post-detail",
+    ),
+    path(
+        "async/posts/<int:pk>/comments/",
+        AsyncCommentsView.as_view(),
+        name="async-post-comments",
+    ),
+    path(
+        "async/posts/<int:pk>/like/",
+        AsyncLikeView.as_view(),
+        name="async-post-like",
+    ),
+]
 
 app_name = "post"
@@ -1,40 +1,167 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from rest_framework import status, viewsets, mixins
+from rest_framework import generics, status, viewsets, mixins
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
-from post.models import Tag, Post, Comment
+from post.bulk import bulk_like, bulk_comment, upsert_tags
+from post.models import Tag, Post, Comment, PostTag, TagTrend
 from post.permissions import IsPostAuthorOrReadOnly
+from post.timeline import read_feed
+from post.trending import trending_posts
+from social_media_api.bulk import max_items
+from social_media_api.cache import CachedResponseMixin
 from post.serializers import (
     TagSerializer,
     PostSerializer,
     PostRetrieveSerializer,
     CommentSerializer,
     CommentListSerializer,
+    LikeOperationSerializer,
+    BulkCommentSerializer,
+    TrendingTagSerializer,
 )
+from social_media_api.counters import change_counters
+from social_media_api.metrics import (
+    TimedListMixin,
+    TimedRetrieveMixin,
+    serializer_data,
+)
+from social_media_api.pagination import KeysetPagination
+from social_media_api.streaming import (
+    NDJSONRenderer,
+    ndjson_response,
+    wants_ndjson,
+)
+from user.relations import personalize_post, wants_relations
+from user.serializers import UserSummarySerializer
+
+
+BULK_RESULTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"status": {"type": "string"}},
+            },
+        }
+    },
+}
 
+# Lists that can also be exported with ?format=ndjson
+EXPORT_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
 
-class DefaultPagination(PageNumberPagination):
+
+class DefaultPagination(KeysetPagination):
     page_size = 10
     max_page_size = 100
+    ordering = ("created_at", "id")
+
+
+class PostPagination(DefaultPagination):
+    """Posts keep their ``(created_at, title)`` order, ``id`` breaks
+    the ties"""
+
+    ordering = ("created_at", "title", "id")
+
+
+class LikePagination(DefaultPagination):
+    page_size = 20
+    ordering = ("id",)
+
+
+class TagPagination(DefaultPagination):
+    ordering = ("id",)
+
+
+class FeedPagination(DefaultPagination):
+    """Pages through the user's materialized home timeline, newest first"""
+
+    ordering = ("-created_at", "-id")
+
+    def paginate_feed(self, request, queryset):
+        post_ids = self.read_page(request)
+        posts = queryset.in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+    def read_page(self, request) -> list[int]:
+        """Ids of the posts on the requested page of the timeline"""
+        self.request = request
+        self.page_number_paginator = None
+        self.count = None
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, _ = self.decode_cursor(request, Post)
+
+        entries = read_feed(request.user, position, page_size + 1)
+        has_next = len(entries) > page_size
+        entries = entries[:page_size]
+
+        self.next_position = None
+        if has_next:
+            created_at, post_id = entries[-1]
+            self.next_position = [created_at.isoformat(), str(post_id)]
+        self.previous_position = None
+
+        return [post_id for _, post_id in entries]
 
 
 class TagViewSet(
+    CachedResponseMixin,
+    TimedListMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     GenericViewSet,
 ):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    pagination_class = DefaultPagination
+    pagination_class = TagPagination
     permission_classes = (IsAuthenticated,)
 
+    def list(self, request, *args, **kwargs):
+        def build():
+            return super(TagViewSet, self).list(request).data, None
+
+        return self.cached_response(request, "tag-list", ["tags"], build)
+
+    def create(self, request, *args, **kwargs):
+        """Create a tag, or a list of tags. Tags that already exist are
+        returned as they are instead of being duplicated"""
+        many = isinstance(request.data, list)
+        if many:
+            serializer = self.get_serializer(
+                data=request.data,
+                many=True,
+                max_length=max_items(),
+                allow_empty=False,
+            )
+        else:
+            serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        items = serializer.validated_data if many else [
+            serializer.validated_data
+        ]
+        tags = upsert_tags([item["name"] for item in items])
+        data = self.get_serializer(tags, many=True).data
+
+        return Response(
+            data if many else data[0], status=status.HTTP_201_CREATED
+        )
+
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(
+    TimedListMixin, TimedRetrieveMixin, viewsets.ModelViewSet
+):
     """Shows only author's comments if author is authorized"""
 
     queryset = Comment.objects.all()
@@ -49,13 +176,98 @@ class CommentViewSet(viewsets.ModelViewSet):
         return queryset
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        data = serializer.validated_data
+        serializer.instance = data["post"].add_comment(
+            self.request.user, data["content"]
+        )
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_post_id = serializer.instance.post_id
+        comment = serializer.save()
+        if comment.post_id != old_post_id:
+            change_counters(Post, old_post_id, comments_count=-1)
+            change_counters(Post, comment.post_id, comments_count=1)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        post_id = instance.post_id
+        instance.delete()
+        change_counters(Post, post_id, comments_count=-1)
 
-class PostViewSet(viewsets.ModelViewSet):
+
+class PostViewSet(
+    CachedResponseMixin, TimedListMixin, viewsets.ModelViewSet
+):
     queryset = Post.objects.all()
-    pagination_class = DefaultPagination
+    pagination_class = PostPagination
     permission_classes = (IsAuthenticated, IsPostAuthorOrReadOnly)
+    # Cache scopes use the int pk, aliases like 01/ are read as post 1
+    lookup_value_regex = r"\d+"
+    # Set per action, see ``ScopedRateThrottle``
+    throttle_scope = None
+
+    def get_queryset(self):
+        """Explicit query plan per action, so the number of queries
+        does not depend on the number of posts or relations"""
+        queryset = self.queryset
+
+        if self.action == "retrieve":
+            return queryset.prefetch_related(
+                "tags",
+                LikePagination.preview(
+                    "likes",
+                    get_user_model().objects.only("id", "username"),
+                    "preview_likes",
+                ),
+                DefaultPagination.preview(
+                    "comments", Comment.objects.all(), "preview_comments"
+                ),
+            )
+
+        if self.action == "list":
+            queryset = self.filter_posts(queryset, self.request.query_params)
+
+        if self.action in ("list", "user_posts", "get_following_posts"):
+            return queryset.prefetch_related("tags")
+
+        return queryset
+
+    @staticmethod
+    def _params_to_ints(query_string):
+        """Converts a list of string IDs to a list of unique integers"""
+        try:
+            ids = {int(str_id) for str_id in query_string.split(",")}
+        except ValueError:
+            raise ValidationError(
+                {"tags": "Tags must be a comma separated list of ids."}
+            )
+        if len(ids) > 10:
+            raise ValidationError({"tags": "No more than 10 tags allowed."})
+        return ids
+
+    @classmethod
+    def filter_posts(cls, queryset, query_params):
+        """Applies ``?title=`` and ``?tags=`` filters, where posts must
+        have all of the given tags"""
+        title = query_params.get("title")
+        tags = query_params.get("tags")
+
+        if title:
+            queryset = queryset.filter(title__icontains=title)
+
+        if tags:
+            tag_ids = cls._params_to_ints(tags)
+            tagged_posts = (
+                PostTag.objects.filter(tag_id__in=tag_ids)
+                .values("post_id")
+                .annotate(matched=Count("tag_id"))
+                .filter(matched=len(tag_ids))
+                .values("post_id")
+            )
+            queryset = queryset.filter(id__in=tagged_posts)
+
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -63,6 +275,14 @@ class PostViewSet(viewsets.ModelViewSet):
 
         return PostSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Cached representations are shared, see ``retrieve``
+        context["relations"] = (
+            self.action != "retrieve" and wants_relations(self.request)
+        )
+        return context
+
     def create(self, request, *args, **kwargs):
         """Create post with automatically added author if author is
         authorized"""
@@ -82,6 +302,27 @@ class PostViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """Post with its likes and comments, served from the
+        representation cache"""
+
+        def build():
+            instance = self.get_object()
+            serializer = self.get_serializer(instance)
+            return serializer_data(serializer), instance.changed_at
+
+        personalize = None
+        if wants_relations(request):
+            personalize = personalize_post(request.user)
+
+        return self.cached_response(
+            request,
+            "post-detail",
+            [f"post:{int(kwargs['pk'])}", "tags"],
+            build,
+            personalize,
+        )
+
     def destroy(self, request, *args, **kwargs):
         """Delete author's own post if author is authorized"""
         instance = self.get_object()
@@ -92,29 +333,121 @@ class PostViewSet(viewsets.ModelViewSet):
         methods=["GET"],
         detail=False,
         url_path="my_board",
+        renderer_classes=EXPORT_RENDERERS,
     )
     def user_posts(self, request) -> Response:
-        """The user receives all his/her posts"""
-        queryset = Post.objects.filter(author=request.user)
+        """The user receives his/her posts a page at a time, or all of
+        them streamed with ?format=ndjson"""
+        queryset = self.get_queryset().filter(author=request.user)
+        if wants_ndjson(request):
+            return ndjson_response(
+                queryset.order_by(*self.paginator.ordering),
+                PostSerializer(context={"request": request}),
+            )
+
+        page = self.paginate_queryset(queryset)
         serializer = PostSerializer(
-            queryset, many=True, context={"request": request}
+            page, many=True, context=self.get_serializer_context()
         )
 
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
 
     @action(detail=True, methods=["POST"])
     def like_post(self, request, pk=None):
+        """Toggles the user's like. Prefer the idempotent
+        PUT/DELETE on like/ for retries and double clicks"""
         post = self.get_object()
-        author = request.user
-        if author in post.likes.all():
-            post.likes.remove(author)
+        if post.is_liked_by(request.user):
+            post.remove_like(request.user)
             message = "Post unliked successfully"
         else:
-            post.likes.add(author)
+            post.add_like(request.user)
             message = "Post liked successfully"
 
         return Response({"message": message}, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        request=None,
+        responses={
+            status.HTTP_200_OK: {
+                "type": "object",
+                "properties": {
+                    "liked": {"type": "boolean"},
+                    "likes_count": {"type": "integer"},
+                },
+            }
+        },
+    )
+    @action(
+        detail=True,
+        methods=["PUT", "DELETE"],
+        url_path="like",
+        permission_classes=(IsAuthenticated,),
+    )
+    def like(self, request, pk=None):
+        """PUT likes the post, DELETE unlikes it. Repeating either
+        request has no further effect"""
+        post = self.get_object()
+        if request.method == "PUT":
+            post.add_like(request.user)
+        else:
+            post.remove_like(request.user)
+        post.refresh_from_db(fields=["likes_count"])
+        data = {
+            "liked": request.method == "PUT",
+            "likes_count": post.likes_count,
+        }
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        request=LikeOperationSerializer(many=True),
+        responses={status.HTTP_200_OK: BULK_RESULTS_SCHEMA},
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk_like",
+        permission_classes=(IsAuthenticated,),
+    )
+    def like_posts(self, request):
+        """Likes and unlikes many posts in one transaction, with a result
+        per operation: created, deleted, unchanged or not_found"""
+        serializer = LikeOperationSerializer(
+            data=request.data,
+            many=True,
+            max_length=max_items(),
+            allow_empty=False,
+        )
+        serializer.is_valid(raise_exception=True)
+        results = bulk_like(request.user, serializer.validated_data)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        request=BulkCommentSerializer(many=True),
+        responses={status.HTTP_200_OK: BULK_RESULTS_SCHEMA},
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk_comment",
+        permission_classes=(IsAuthenticated,),
+    )
+    def comment_posts(self, request):
+        """Comments on many posts in one transaction, with a result per
+        comment: created (with its id) or not_found"""
+        serializer = BulkCommentSerializer(
+            data=request.data,
+            many=True,
+            max_length=max_items(),
+            allow_empty=False,
+        )
+        serializer.is_valid(raise_exception=True)
+        results = bulk_comment(request.user, serializer.validated_data)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["POST"], url_path="comment_post")
     def comment_post(self, request, pk=None):
         post = get_object_or_404(Post, pk=pk)
@@ -124,7 +457,9 @@ class PostViewSet(viewsets.ModelViewSet):
         )
 
         serializer.is_valid(raise_exception=True)
-        serializer.save(author=request.user, post=post)
+        serializer.instance = post.add_comment(
+            request.user, serializer.validated_data["content"]
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
@@ -135,7 +470,9 @@ class PostViewSet(viewsets.ModelViewSet):
     def delete_comment(self, request, pk=None, comment_pk=None):
         comment = get_object_or_404(Comment, pk=comment_pk, post__id=pk)
         if request.user == comment.author:
-            comment.delete()
+            with transaction.atomic():
+                comment.delete()
+                change_counters(Post, comment.post_id, comments_count=-1)
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response(
@@ -145,34 +482,77 @@ class PostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
+    @extend_schema(responses=UserSummarySerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="likes",
+    )
+    def likes(self, request, pk=None) -> Response:
+        """Users who liked the post, a page at a time"""
+        post = self.get_object()
+        paginator = LikePagination()
+        page = paginator.paginate_queryset(
+            post.likes.only("id", "username"), request, self
+        )
+        serializer = UserSummarySerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+
+        return paginator.get_paginated_response(serializer_data(serializer))
+
+    @extend_schema(responses=CommentListSerializer(many=True))
     @action(
         methods=["GET"],
         detail=True,
         url_path="comments",
     )
     def comments(self, request, pk=None) -> Response:
-        """Get a list of comments for specified post"""
-        post = self.get_object()
-        queryset = Comment.objects.filter(post=post)
-        serializer = CommentListSerializer(
-            queryset, many=True, context={"request": request}
+        """Get the comments of the specified post, a page at a time"""
+
+        def build():
+            post = self.get_object()
+            paginator = DefaultPagination()
+            page = paginator.paginate_queryset(
+                Comment.objects.filter(post=post), request, self
+            )
+            serializer = CommentListSerializer(
+                page, many=True, context={"request": request}
+            )
+            data = serializer_data(serializer)
+            return paginator.get_paginated_response(data).data, None
+
+        return self.cached_response(
+            request, "post-comments", [f"comments:{int(pk)}"], build
         )
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=["GET"],
         detail=False,
         url_path="followings",
+        throttle_scope="followings",
+        renderer_classes=EXPORT_RENDERERS,
     )
     def get_following_posts(self, request) -> Response:
-        """User receives all posts of the users he/she follows"""
-        following_users = request.user.follows.all()
-        queryset = self.queryset.filter(author__in=following_users)
+        """User receives posts of the users he/she follows,
+        newest first, from his/her home timeline. ?format=ndjson
+        streams every post of the followed users instead"""
+        if wants_ndjson(request):
+            queryset = self.get_queryset().filter(
+                author__in=request.user.follows.values("id")
+            )
+            return ndjson_response(
+                queryset.order_by(*FeedPagination.ordering),
+                PostSerializer(context={"request": request}),
+            )
+
+        paginator = FeedPagination()
+        posts = paginator.paginate_feed(request, self.get_queryset())
         serializer = PostSerializer(
-            queryset, many=True, context={"request": request}
+            posts, many=True, context=self.get_serializer_context()
         )
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer_data(serializer))
 
     @extend_schema(
         parameters=[
@@ -193,3 +573,29 @@ class PostViewSet(viewsets.ModelViewSet):
     def list(self, request, *args, **kwargs):
         """List posts with filter by title or tags"""
         return super().list(request, *args, **kwargs)
+
+
+class TrendingPostView(TimedListMixin, generics.ListAPIView):
+    """Posts with the most likes and comments lately, best first"""
+
+    serializer_class = PostSerializer
+    pagination_class = None
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return trending_posts().prefetch_related("tags")
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["relations"] = wants_relations(self.request)
+        return context
+
+
+class TrendingTagView(TimedListMixin, generics.ListAPIView):
+    """Tags whose posts had the most likes and comments lately, as of
+    the last ``manage.py trending`` run"""
+
+    queryset = TagTrend.objects.select_related("tag").order_by("rank")
+    serializer_class = TrendingTagSerializer
+    pagination_class = None
+    permission_classes = (IsAuthenticated,)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class SearchConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "search"
+
+    def ready(self):
+        import search.signals  # noqa: F401
+        from search.indexes import POSTGRES_INDEXES
+        from social_media_api.indexes import register_postgres_indexes
+
+        register_postgres_indexes(self, POSTGRES_INDEXES)
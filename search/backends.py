@@ -0,0 +1,229 @@
+"""Search backends.
+
+``PostgresSearchBackend`` ranks rows with ``ts_rank`` over the GIN-indexed
+``SearchDocument.vector`` column. ``PythonSearchBackend`` keeps an
+in-process inverted index instead, for databases without full-text
+search such as SQLite.
+Both store documents in the ``SearchDocument`` table.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from search.models import SearchDocument
+
+TITLE_WEIGHT = "A"
+BODY_WEIGHT = "B"
+
+
+@dataclass
+class SearchHit:
+    document: SearchDocument
+    rank: float
+
+
+class BaseSearchBackend:
+    def index(self, documents: list[SearchDocument]) -> None:
+        """Inserts or replaces documents by ``(kind, object_id)``"""
+        SearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=["kind", "object_id"],
+            update_fields=["parent_id", "title", "body", "updated_at"],
+        )
+
+    def remove(self, kind: str, object_ids: list[int]) -> None:
+        SearchDocument.objects.filter(
+            kind=kind, object_id__in=object_ids
+        ).delete()
+
+    def search(
+        self, query: str, kinds: list[str], limit: int
+    ) -> list[SearchHit]:
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def __init__(self, config="english", **options):
+        self.config = config
+
+    def vector(self):
+        return SearchVector(
+            "title", weight=TITLE_WEIGHT, config=self.config
+        ) + SearchVector("body", weight=BODY_WEIGHT, config=self.config)
+
+    def index(self, documents):
+        super().index(documents)
+        for kind in {document.kind for document in documents}:
+            SearchDocument.objects.filter(
+                kind=kind,
+                object_id__in=[
+                    document.object_id
+                    for document in documents
+                    if document.kind == kind
+                ],
+            ).update(vector=self.vector())
+
+    def search(self, query, kinds, limit):
+        search_query = SearchQuery(
+            query, search_type="websearch", config=self.config
+        )
+        documents = (
+            SearchDocument.objects.filter(kind__in=kinds, vector=search_query)
+            .annotate(rank=SearchRank(F("vector"), search_query))
+            .order_by("-rank", "kind", "object_id")
+            .defer("vector")[:limit]
+        )
+        return [SearchHit(document, document.rank) for document in documents]
+
+
+class PythonSearchBackend(BaseSearchBackend):
+    """Inverted index ``term -> {(kind, object_id): weighted frequency}``
+    kept in memory and updated on every index/remove call. It is loaded
+    from the ``SearchDocument`` table on first use."""
+
+    token_pattern = re.compile(r"\w+", re.UNICODE)
+    weights = {TITLE_WEIGHT: 2.0, BODY_WEIGHT: 1.0}
+
+    def __init__(self, **options):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.postings = defaultdict(dict)
+        self.terms_by_key = {}
+
+    def tokenize(self, text: str) -> list[str]:
+        return self.token_pattern.findall(text.lower())
+
+    def _add(self, document):
+        key = (document.kind, document.object_id)
+        self._discard(key)
+        frequencies = defaultdict(float)
+        for weight, text in (
+            (TITLE_WEIGHT, document.title),
+            (BODY_WEIGHT, document.body),
+        ):
+            for term in self.tokenize(text or ""):
+                frequencies[term] += self.weights[weight]
+        for term, frequency in frequencies.items():
+            self.postings[term][key] = frequency
+        self.terms_by_key[key] = frozenset(frequencies)
+
+    def _discard(self, key):
+        for term in self.terms_by_key.pop(key, ()):
+            self.postings[term].pop(key, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def _load(self):
+        if self.loaded:
+            return
+        for document in SearchDocument.objects.defer("vector").iterator(
+            chunk_size=2000
+        ):
+            self._add(document)
+        self.loaded = True
+
+    def index(self, documents):
+        super().index(documents)
+        with self.lock:
+            if self.loaded:
+                for document in documents:
+                    self._add(document)
+
+    def remove(self, kind, object_ids):
+        super().remove(kind, object_ids)
+        with self.lock:
+            for object_id in object_ids:
+                self._discard((kind, object_id))
+
+    def search(self, query, kinds, limit):
+        terms = set(self.tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            self._load()
+            total = max(len(self.terms_by_key), 1)
+            scores = None
+            for term in terms:
+                postings = self.postings.get(term, {})
+                idf = math.log(1 + total / (1 + len(postings)))
+                term_scores = {
+                    key: frequency * idf
+                    for key, frequency in postings.items()
+                    if key[0] in kinds
+                }
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        key: score + term_scores[key]
+                        for key, score in scores.items()
+                        if key in term_scores
+                    }
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        ranked = ranked[: limit * 2]
+        hits = []
+        for kind in kinds:
+            candidates = [key[1] for key, _ in ranked if key[0] == kind]
+            documents = SearchDocument.objects.filter(
+                kind=kind, object_id__in=candidates
+            ).defer("vector")
+            hits.extend(
+                SearchHit(document, scores[(kind, document.object_id)])
+                for document in documents
+                if terms.issubset(
+                    self.tokenize(f"{document.title} {document.body}")
+                )
+            )
+
+        # Documents changed or removed outside of this process are
+        # skipped above
+        hits.sort(
+            key=lambda hit: (
+                -hit.rank,
+                hit.document.kind,
+                hit.document.object_id,
+            )
+        )
+        return hits[:limit]
+
+
+_backend = None
+
+
+def get_backend() -> BaseSearchBackend:
+    """Returns ``SEARCH["BACKEND"]``, or the backend matching the
+    database vendor when it is not set"""
+    global _backend
+    if _backend is None:
+        config = getattr(settings, "SEARCH", {})
+        path = config.get("BACKEND") or (
+            "search.backends.PostgresSearchBackend"
+            if connection.vendor == "postgresql"
+            else "search.backends.PythonSearchBackend"
+        )
+        _backend = import_string(path)(**config.get("OPTIONS", {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting, **kwargs):
+    global _backend
+    if setting in ("SEARCH", "DATABASES"):
+        _backend = None
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+
+from post.models import Post, Comment
+from search.models import SearchDocument
+
+
+def post_document(post) -> SearchDocument:
+    return SearchDocument(
+        kind=SearchDocument.KIND_POST,
+        object_id=post.pk,
+        title=post.title,
+        body=post.content,
+    )
+
+
+def comment_document(comment) -> SearchDocument:
+    return SearchDocument(
+        kind=SearchDocument.KIND_COMMENT,
+        object_id=comment.pk,
+        parent_id=comment.post_id,
+        body=comment.content,
+    )
+
+
+def user_document(user) -> SearchDocument:
+    return SearchDocument(
+        kind=SearchDocument.KIND_USER,
+        object_id=user.pk,
+        title=user.username,
+        body=user.user_info or "",
+    )
+
+
+def indexed_models():
+    """``(model, kind, to_document, fields)`` for every searchable model,
+    where ``fields`` are the columns the document is built from"""
+    return (
+        (
+            Post,
+            SearchDocument.KIND_POST,
+            post_document,
+            ("id", "title", "content"),
+        ),
+        (
+            Comment,
+            SearchDocument.KIND_COMMENT,
+            comment_document,
+            ("id", "post", "content"),
+        ),
+        (
+            get_user_model(),
+            SearchDocument.KIND_USER,
+            user_document,
+            ("id", "username", "user_info"),
+        ),
+    )
@@ -0,0 +1,7 @@
+"""PostgreSQL-only indexes of the search app, created after ``migrate``
+(see ``social_media_api.indexes``)."""
+
+POSTGRES_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS search_document_vector_idx "
+    "ON search_searchdocument USING gin (vector)",
+)
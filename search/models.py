@@ -0,0 +1,37 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+
+
+class SearchDocument(models.Model):
+    """Searchable text of a post, comment or user.
+
+    ``vector`` is maintained on PostgreSQL only and is backed by a GIN
+    index; other databases search ``title`` and ``body`` in Python.
+    """
+
+    KIND_POST = "post"
+    KIND_COMMENT = "comment"
+    KIND_USER = "user"
+    KIND_CHOICES = (
+        (KIND_POST, "Post"),
+        (KIND_COMMENT, "Comment"),
+        (KIND_USER, "User"),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="unique_search_document"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
@@ -0,0 +1,47 @@
+from django.urls import reverse
+from rest_framework import serializers
+
+from search.models import SearchDocument
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    type = serializers.MultipleChoiceField(
+        choices=SearchDocument.KIND_CHOICES, required=False
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=50, default=20, required=False
+    )
+
+    def to_internal_value(self, data):
+        data = data.copy()
+        if "type" in data:
+            data.setlist("type", data["type"].split(","))
+        return super().to_internal_value(data)
+
+
+class SearchHitSerializer(serializers.Serializer):
+    type = serializers.CharField(source="document.kind")
+    id = serializers.IntegerField(source="document.object_id")
+    rank = serializers.FloatField()
+    title = serializers.CharField(source="document.title")
+    excerpt = serializers.SerializerMethodField()
+    url = serializers.SerializerMethodField()
+
+    @staticmethod
+    def get_excerpt(hit) -> str:
+        return hit.document.body[:200]
+
+    def get_url(self, hit) -> str:
+        document = hit.document
+        if document.kind == SearchDocument.KIND_USER:
+            path = reverse("user:manage", args=[document.object_id])
+        else:
+            post_id = (
+                document.parent_id
+                if document.kind == SearchDocument.KIND_COMMENT
+                else document.object_id
+            )
+            path = reverse("post:post-detail", args=[post_id])
+
+        return self.context["request"].build_absolute_uri(path)
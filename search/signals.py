@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from post.models import Post, Comment
+from search.backends import get_backend
+from search.documents import post_document, comment_document, user_document
+from search.models import SearchDocument
+from social_media_api.signals import bulk_created
+
+USER_SEARCH_FIELDS = {"username", "user_info"}
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    get_backend().index([post_document(instance)])
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    get_backend().index([comment_document(instance)])
+
+
+@receiver(bulk_created, sender=Comment)
+def index_bulk_comments(sender, instances, **kwargs):
+    get_backend().index([comment_document(comment) for comment in instances])
+
+
+@receiver(post_save, sender=get_user_model())
+def index_user(sender, instance, update_fields=None, **kwargs):
+    # Logins save only last_login, which is not searchable
+    if update_fields and not USER_SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_backend().index([user_document(instance)])
+
+
+@receiver(post_delete, sender=Post)
+def remove_post(sender, instance, **kwargs):
+    get_backend().remove(SearchDocument.KIND_POST, [instance.pk])
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment(sender, instance, **kwargs):
+    get_backend().remove(SearchDocument.KIND_COMMENT, [instance.pk])
+
+
+@receiver(post_delete, sender=get_user_model())
+def remove_user(sender, instance, **kwargs):
+    get_backend().remove(SearchDocument.KIND_USER, [instance.pk])
@@ -0,0 +1,93 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from post.models import Post, Comment
+from search.models import SearchDocument
+
+SEARCH_URL = reverse("search:search")
+
+
+def sample_user(email, **params):
+    return get_user_model().objects.create_user(
+        email, "password123", username=email.split("@")[0], **params
+    )
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com", user_info="I love hiking")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(
+            title="Hiking in the Carpathians",
+            content="Three days of mountains",
+            author=self.user,
+        )
+        self.other_post = Post.objects.create(
+            title="Borscht recipe",
+            content="Beets, cabbage and a little hiking appetite",
+            author=self.user,
+        )
+        self.comment = Comment.objects.create(
+            post=self.other_post, author=self.user, content="Tasty recipe"
+        )
+
+    def search(self, **params):
+        res = self.client.get(SEARCH_URL, params)
+        self.assertEqual(res.status_code, 200)
+        return [(hit["type"], hit["id"]) for hit in res.data]
+
+    def test_title_matches_rank_above_body_matches(self):
+        self.assertEqual(
+            self.search(q="hiking", type="post"),
+            [("post", self.post.id), ("post", self.other_post.id)],
+        )
+
+    def test_searches_comments_and_users(self):
+        self.assertEqual(
+            self.search(q="recipe", type="comment"),
+            [("comment", self.comment.id)],
+        )
+        self.assertIn(("user", self.user.id), self.search(q="hiking"))
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(
+            self.search(q="hiking mountains"), [("post", self.post.id)]
+        )
+
+    def test_index_follows_updates_and_deletes(self):
+        self.post.title = "Kayaking"
+        self.post.save()
+        self.other_post.delete()
+
+        self.assertEqual(self.search(q="hiking", type="post"), [])
+        self.assertEqual(
+            self.search(q="kayaking"), [("post", self.post.id)]
+        )
+
+    def test_comment_result_links_to_its_post(self):
+        res = self.client.get(SEARCH_URL, {"q": "tasty"})
+
+        self.assertTrue(
+            res.data[0]["url"].endswith(f"/posts/{self.other_post.id}/")
+        )
+
+    def test_query_is_required(self):
+        res = self.client.get(SEARCH_URL)
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_reindex_command_rebuilds_documents(self):
+        SearchDocument.objects.all().delete()
+
+        call_command("search_reindex", "--clear", stdout=StringIO())
+
+        self.assertEqual(SearchDocument.objects.count(), 4)
+        self.assertEqual(
+            self.search(q="carpathians"), [("post", self.post.id)]
+        )
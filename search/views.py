@@ -0,0 +1,57 @@
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from search.backends import get_backend
+from search.models import SearchDocument
+from search.serializers import SearchQuerySerializer, SearchHitSerializer
+from social_media_api.metrics import serializer_data
+
+
+class SearchView(APIView):
+    permission_classes = (IsAuthenticated,)
+    throttle_scope = "search"
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Search terms (web search syntax)",
+                required=True,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="type",
+                description="Comma separated kinds to search "
+                "(ex. ?type=post,user), all by default",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Maximum number of results (1-50)",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=SearchHitSerializer(many=True),
+    )
+    def get(self, request):
+        """Ranked full-text search over posts, comments and users"""
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        kinds = sorted(params.validated_data.get("type")) or [
+            kind for kind, _ in SearchDocument.KIND_CHOICES
+        ]
+
+        hits = get_backend().search(
+            params.validated_data["q"],
+            kinds,
+            params.validated_data["limit"],
+        )
+        serializer = SearchHitSerializer(
+            hits, many=True, context={"request": request}
+        )
+
+        return Response(serializer_data(serializer))
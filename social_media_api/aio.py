@@ -0,0 +1,133 @@
+"""Building blocks of ``async def`` API views.
+
+DRF views are synchronous, so under ASGI every request still holds a
+thread for its whole duration. The handlers of ``AsyncAPIView`` run on
+the event loop instead, and DRF's authentication, permission and
+throttle checks run in a thread, as they may hit the database.
+
+Django's async ORM sends every query through the request's database
+thread, one after the other. ``gather`` evaluates independent queries
+concurrently: with ``ASYNC_VIEWS["CONCURRENT_QUERIES"]`` each one runs on
+a pooled thread with its own connection, otherwise they only stop
+blocking the event loop.
+"""
+import asyncio
+from collections.abc import Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import QuerySet
+from django.http import Http404
+from rest_framework.views import APIView
+
+from social_media_api.cache import (
+    cache_settings,
+    entry_response,
+    get_cache,
+    get_versions,
+    make_entry,
+    personal_response,
+    record,
+    response_key,
+)
+
+DEFAULTS = {
+    "CONCURRENT_QUERIES": False,
+}
+
+
+def async_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "ASYNC_VIEWS", {})}
+
+
+def evaluate(query: QuerySet | Callable):
+    return list(query) if isinstance(query, QuerySet) else query()
+
+
+def evaluate_on_own_connection(query):
+    try:
+        return evaluate(query)
+    finally:
+        # Pooled threads outlive requests, so their connections are
+        # closed here as CONN_MAX_AGE says, not on request_finished
+        close_old_connections()
+
+
+async def gather(*queries) -> list:
+    """Results of querysets, as lists, and of callables, e.g.
+    ``queryset.count``, running them concurrently"""
+    if async_settings()["CONCURRENT_QUERIES"]:
+        run = sync_to_async(evaluate_on_own_connection, thread_sensitive=False)
+    else:
+        run = sync_to_async(evaluate)
+    return list(await asyncio.gather(*(run(query) for query in queries)))
+
+
+async def aget_or_404(queryset: QuerySet, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches.")
+
+
+def set_prefetched(instance, name: str, objects) -> None:
+    """Stores ``objects`` as the result of ``instance.<name>.all()``, as
+    ``prefetch_related`` does, so serializers do not query them"""
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault("_prefetched_objects_cache", {})[
+        name
+    ] = queryset
+
+
+async def cached_response(request, name, scopes, build, personalize=None):
+    """``CachedResponseMixin.cached_response`` with an async ``build``.
+    ``personalize`` is sync, it runs in a thread."""
+    stamps = await sync_to_async(get_versions)(scopes)
+    key = response_key(request, name, scopes, stamps)
+
+    cache = get_cache()
+    entry = await cache.aget(key)
+    if entry is None:
+        record(name, "misses")
+        entry = make_entry(*await build(), stamps)
+        await cache.aset(key, entry, timeout=cache_settings()["TIMEOUT"])
+    else:
+        record(name, "hits")
+
+    if personalize is not None:
+        data = await sync_to_async(personalize)(entry["data"])
+        return personal_response(data)
+    return entry_response(request, entry)
+
+
+class AsyncAPIView(APIView):
+    """``APIView`` whose handlers are ``async def``. Serializers must not
+    query the database: fetch and ``set_prefetched`` relations first."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = self.http_method_not_allowed
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class SocialMediaApiConfig(AppConfig):
+    name = "social_media_api"
+
+    def ready(self):
+        from social_media_api.metrics import install
+
+        install()
@@ -0,0 +1,89 @@
+"""Set-based writes behind the bulk endpoints.
+
+A bulk request is a list of operations, each on one target row. All of
+them are applied in a single transaction with a constant number of
+queries, and every operation gets its own result status.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+CREATED = "created"
+DELETED = "deleted"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+INVALID = "invalid"
+
+
+def max_items() -> int:
+    return getattr(settings, "BULK_WRITES", {}).get("MAX_ITEMS", 100)
+
+
+class BulkOperationsSerializer(serializers.ListSerializer):
+    """Operations of a bulk request, at most one per target"""
+
+    def validate(self, attrs):
+        targets = [item[self.child.target_field] for item in attrs]
+        if len(set(targets)) != len(targets):
+            raise serializers.ValidationError(
+                f"Each {self.child.target_field} may appear only once."
+            )
+        return attrs
+
+
+def apply_relations(through, source, add, remove):
+    """Inserts the ``through`` rows for the ``add`` targets and deletes
+    those of the ``remove`` targets, where ``source`` is
+    ``(source_field, source_id)``. Returns the targets that were really
+    added and removed; call it inside a transaction.
+
+    Rows found up front are locked, so concurrent deletes of them wait
+    for this transaction. ``bulk_create(ignore_conflicts=True)`` would
+    not tell which rows it inserted, and counters must only move for
+    those: the insert runs without it and falls back to one
+    ``get_or_create`` per row if a concurrent request won a race.
+    """
+    source_field, source_id = source
+    target_field = next(
+        field.attname
+        for field in through._meta.get_fields()
+        if field.many_to_one and field.attname != source_field
+    )
+    owned = through.objects.filter(**{source_field: source_id})
+    existing = set(
+        owned.select_for_update()
+        .filter(**{f"{target_field}__in": add | remove})
+        .values_list(target_field, flat=True)
+    )
+
+    added = add - existing
+    try:
+        with transaction.atomic():
+            through.objects.bulk_create(
+                through(**{source_field: source_id, target_field: target})
+                for target in added
+            )
+    except IntegrityError:
+        added = {
+            target
+            for target in added
+            if through.objects.get_or_create(
+                **{source_field: source_id, target_field: target}
+            )[1]
+        }
+
+    removed = remove & existing
+    if removed:
+        owned.filter(**{f"{target_field}__in": removed}).delete()
+
+    return added, removed
+
+
+def relation_status(target, found, added, removed) -> str:
+    if target not in found:
+        return NOT_FOUND
+    if target in added:
+        return CREATED
+    if target in removed:
+        return DELETED
+    return UNCHANGED
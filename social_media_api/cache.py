@@ -0,0 +1,189 @@
+"""Cache of serialized API representations.
+
+Every cached response depends on one or more *scopes*, e.g. ``post:5`` or
+``tags``. Each scope has a version stamp in the cache, and the stamps are
+part of the response cache key, so invalidating a scope is a single
+``set`` of a fresh stamp: stale entries are never read again and simply
+expire. Signal handlers in the ``post`` and ``user`` apps invalidate
+scopes when the underlying rows change, and again once the change is
+committed.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+DEFAULTS = {
+    "ALIAS": "default",
+    "TIMEOUT": 300,
+    "KEY_PREFIX": "repr",
+}
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def cache_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "RESPONSE_CACHE", {})}
+
+
+def get_cache():
+    return caches[cache_settings()["ALIAS"]]
+
+
+def version_key(scope: str) -> str:
+    return f"{cache_settings()['KEY_PREFIX']}:version:{scope}"
+
+
+def new_stamp() -> int:
+    """Version stamps are creation times in microseconds, which also
+    gives every version a modification time"""
+    return time.time_ns() // 1000
+
+
+def get_versions(scopes) -> list[int]:
+    cache = get_cache()
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, new_stamp(), timeout=None)
+            found[key] = cache.get(key)
+
+    return [found[key] for key in keys]
+
+
+def bump(scopes) -> None:
+    stamp = new_stamp()
+    get_cache().set_many(
+        {version_key(scope): stamp for scope in scopes}, timeout=None
+    )
+
+
+def invalidate(*scopes: str) -> None:
+    """Moves the given scopes to a new version, now and once the current
+    transaction commits: requests reading the old rows until then may
+    have cached them under the first new version"""
+    if scopes:
+        bump(scopes)
+        transaction.on_commit(lambda: bump(scopes))
+
+
+def record(name: str, outcome: str) -> None:
+    with _stats_lock:
+        _stats[(name, outcome)] += 1
+
+
+def cache_stats() -> dict:
+    """Hit and miss counts of this process per cached endpoint"""
+    with _stats_lock:
+        stats = {}
+        for (name, outcome), count in _stats.items():
+            stats.setdefault(name, {"hits": 0, "misses": 0})[outcome] = count
+        return stats
+
+
+def reset_cache_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def not_modified(request, entry) -> bool:
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        etags = {etag.strip() for etag in if_none_match.split(",")}
+        return entry["etag"] in etags or "*" in etags
+
+    if_modified_since = parse_http_date_safe(
+        request.META.get("HTTP_IF_MODIFIED_SINCE", "")
+    )
+    return (
+        if_modified_since is not None
+        and int(entry["last_modified"]) <= if_modified_since
+    )
+
+
+def response_key(request, name, scopes, stamps) -> str:
+    fingerprint = "|".join(
+        [
+            request.build_absolute_uri(),
+            request.accepted_media_type or "",
+            *scopes,
+            *map(str, stamps),
+        ]
+    )
+    return (
+        f"{cache_settings()['KEY_PREFIX']}:{name}:"
+        f"{hashlib.md5(fingerprint.encode()).hexdigest()}"
+    )
+
+
+def make_entry(data, modified, stamps) -> dict:
+    last_modified = max(stamps) / 1_000_000
+    if isinstance(modified, datetime):
+        last_modified = max(last_modified, modified.timestamp())
+    # Plain JSON types only: serializer output may hold model
+    # instances (e.g. in hyperlinks) that must not be pickled
+    body = JSONRenderer().render(data)
+    return {
+        "data": json.loads(body),
+        "etag": f'"{hashlib.md5(body).hexdigest()}"',
+        "last_modified": last_modified,
+    }
+
+
+def entry_response(request, entry) -> Response:
+    if not_modified(request, entry):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(entry["data"])
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    response["Cache-Control"] = "private, no-cache"
+
+    return response
+
+
+def personal_response(data) -> Response:
+    """Cached data with per-viewer additions, which the validators of
+    the shared entry do not cover"""
+    response = Response(data)
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class CachedResponseMixin:
+    """Serves GET responses from the representation cache with
+    ``ETag``/``Last-Modified`` validators"""
+
+    def cached_response(
+        self, request, name, scopes, build, personalize=None
+    ) -> Response:
+        """Returns the cached representation for ``scopes``, or calls
+        ``build()``, which returns ``(data, last_modified)``, on a miss.
+        ``personalize(data)`` adds per-viewer data, which is not cached."""
+        stamps = get_versions(scopes)
+        key = response_key(request, name, scopes, stamps)
+
+        cache = get_cache()
+        entry = cache.get(key)
+        if entry is None:
+            record(name, "misses")
+            entry = make_entry(*build(), stamps)
+            cache.set(key, entry, timeout=cache_settings()["TIMEOUT"])
+        else:
+            record(name, "hits")
+
+        if personalize is not None:
+            return personal_response(personalize(entry["data"]))
+        return entry_response(request, entry)
@@ -0,0 +1,57 @@
+from typing import Iterable
+
+from django.db.models import F, Model
+from django.db.models.functions import Greatest
+
+
+def shifted(deltas: dict[str, int]) -> dict:
+    return {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    }
+
+
+def change_counters(model: type[Model], pk: int, **deltas: int) -> None:
+    """Atomically shift denormalized counter columns of a single row.
+
+    The update is done with F-expressions, so concurrent requests never
+    overwrite each other's changes. Counters are clamped at zero.
+    """
+    model.objects.filter(pk=pk).update(**shifted(deltas))
+
+
+def change_many_counters(
+    model: type[Model], pks: Iterable[int], **deltas: int
+) -> None:
+    """``change_counters`` for every row in ``pks``, in one statement"""
+    pks = list(pks)
+    if pks:
+        model.objects.filter(pk__in=pks).update(**shifted(deltas))
+
+
+class CounterFieldsMixin:
+    """Keeps the ``counter_fields`` of a model out of ``save()``.
+
+    Counters only change through ``change_counters``. A full save would
+    write back the values loaded with the instance and undo increments
+    made since, so updates of existing rows never include them.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if not self._state.adding and not kwargs.get("force_insert"):
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+            update_fields = [
+                name
+                for name in update_fields
+                if name not in self.counter_fields
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
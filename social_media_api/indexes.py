@@ -0,0 +1,33 @@
+"""PostgreSQL-only indexes that the model layer cannot express portably.
+
+Apps register their ``CREATE INDEX IF NOT EXISTS`` statements with
+``register_postgres_indexes`` from ``AppConfig.ready``. They run after
+every ``migrate`` of that app, so running migrations again is harmless,
+and other databases are left untouched.
+"""
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def create_postgres_indexes(statements, using="default") -> None:
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def register_postgres_indexes(app_config, statements) -> None:
+    """Runs ``statements`` after ``migrate`` of ``app_config``"""
+
+    def receiver(using="default", **kwargs):
+        create_postgres_indexes(statements, using)
+
+    post_migrate.connect(
+        receiver,
+        sender=app_config,
+        weak=False,
+        dispatch_uid=f"{app_config.label}.postgres_indexes",
+    )
@@ -0,0 +1,144 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from post.bulk import bulk_comment
+from post.models import Post
+
+# (scenario, sync view path, async view path), ``{post}`` is a post id
+SCENARIOS = (
+    ("post list", "/api/post/posts/", "/api/post/async/posts/"),
+    (
+        "post detail",
+        "/api/post/posts/{post}/",
+        "/api/post/async/posts/{post}/",
+    ),
+    (
+        "comments",
+        "/api/post/posts/{post}/comments/",
+        "/api/post/async/posts/{post}/comments/",
+    ),
+    (
+        "feed",
+        "/api/post/posts/followings/",
+        "/api/post/async/posts/followings/",
+    ),
+)
+
+
+class Command(BaseCommand):
+    """Django command to compare the throughput of the sync views served
+    over WSGI with the async views served over ASGI at high concurrency.
+    Both servers must be running against this database, e.g.
+
+        gunicorn social_media_api.wsgi -w 4 -b :8001
+        uvicorn social_media_api.asgi:application --workers 4 --port 8002
+    """
+
+    help = "Benchmark sync WSGI views against async ASGI views."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi-url", default="http://localhost:8001")
+        parser.add_argument("--asgi-url", default="http://localhost:8002")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=200,
+            help="Number of requests in flight at once.",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=5000,
+            help="Number of requests per scenario and server.",
+        )
+
+    def handle(self, *args, **options):
+        user, post = self.seed()
+        token, _ = Token.objects.get_or_create(user=user)
+
+        self.stdout.write(
+            f"{'scenario':<14}{'server':<8}{'req/s':>10}{'p50 ms':>10}"
+            f"{'p99 ms':>10}{'errors':>8}"
+        )
+        for name, sync_path, async_path in SCENARIOS:
+            targets = (
+                ("wsgi", options["wsgi_url"] + sync_path),
+                ("asgi", options["asgi_url"] + async_path),
+            )
+            for server, url in targets:
+                elapsed, timings, errors = asyncio.run(
+                    self.load(
+                        url.format(post=post.pk),
+                        token.key,
+                        options["concurrency"],
+                        options["requests"],
+                    )
+                )
+                timings.sort()
+                p50 = statistics.median(timings) if timings else 0
+                p99 = timings[int(len(timings) * 0.99) - 1] if timings else 0
+                self.stdout.write(
+                    f"{name:<14}{server:<8}"
+                    f"{options['requests'] / elapsed:>10.0f}"
+                    f"{p50:>10.1f}{p99:>10.1f}{errors:>8}"
+                )
+
+    async def load(self, url, token, concurrency, total):
+        """Sends ``total`` GET requests, ``concurrency`` at a time.
+        Returns ``(seconds, latencies in ms, failed requests)``."""
+        timings = []
+        errors = 0
+        remaining = iter(range(total))
+        headers = {"Authorization": f"Token {token}"}
+
+        async def worker(session):
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        await response.read()
+                        ok = response.status == 200
+                except aiohttp.ClientError:
+                    ok = False
+                timings.append((time.perf_counter() - started) * 1000)
+                errors += not ok
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(worker(session) for _ in range(concurrency))
+            )
+            elapsed = time.perf_counter() - started
+
+        return elapsed, timings, errors
+
+    def seed(self):
+        """A reader following an author with posts, likes and comments"""
+        users = get_user_model().objects
+        reader, _ = users.get_or_create(
+            email="bench-reader@example.com",
+            defaults={"username": "bench-reader"},
+        )
+        author, created = users.get_or_create(
+            email="bench-author@example.com",
+            defaults={"username": "bench-author"},
+        )
+        reader.follow(author)
+        if created:
+            for i in range(30):
+                post = Post.objects.create(
+                    title=f"Bench {i}", content="benchmark", author=author
+                )
+                post.add_like(reader)
+                bulk_comment(
+                    reader, [{"post": post.pk, "content": "benchmark"}] * 5
+                )
+        return reader, Post.objects.filter(author=author).latest("id")
@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from post.models import Post, PostTag, Tag
+from post.views import PostViewSet
+
+WORDS = (
+    "django python weekend kyiv coffee travel music photo code sunset "
+    "mountain river cat dog recipe summer winter book movie garden"
+).split()
+
+
+class Command(BaseCommand):
+    """Django command to measure PostViewSet.list latency with and
+    without title/tag filters on a seeded dataset"""
+
+    help = "Seed posts and benchmark filtered post list latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--posts",
+            type=int,
+            default=1_000_000,
+            help="Number of posts the dataset should contain.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Number of requests measured per scenario.",
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        author, _ = get_user_model().objects.get_or_create(
+            email="bench@example.com", defaults={"username": "bench"}
+        )
+        tags = [
+            Tag.objects.get_or_create(name=f"bench-{word}")[0]
+            for word in WORDS
+        ]
+        self.seed(author, tags, options["posts"], options["batch_size"])
+
+        scenarios = {
+            "unfiltered": {},
+            "title": {"title": "sunset"},
+            "one tag": {"tags": f"{tags[0].id}"},
+            "two tags": {"tags": f"{tags[0].id},{tags[1].id}"},
+            "title and tags": {"title": "coffee", "tags": f"{tags[2].id}"},
+        }
+        view = PostViewSet.as_view({"get": "list"})
+        factory = APIRequestFactory()
+
+        self.stdout.write(f"{'scenario':<16}{'median ms':>12}{'p95 ms':>12}")
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for name, params in scenarios.items():
+                timings = []
+                for _ in range(options["repeat"]):
+                    request = factory.get(
+                        "/api/post/posts/", {**params, "count": "false"}
+                    )
+                    force_authenticate(request, user=author)
+                    started = time.perf_counter()
+                    response = view(request)
+                    response.render()
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f"{name:<16}{statistics.median(timings):>12.2f}"
+                    f"{p95:>12.2f}"
+                )
+
+    def seed(self, author, tags, total, batch_size):
+        existing = Post.objects.count()
+        if existing >= total:
+            return
+
+        self.stdout.write(f"Seeding {total - existing} posts...")
+        rng = random.Random(existing)
+        for start in range(existing, total, batch_size):
+            size = min(batch_size, total - start)
+            posts = Post.objects.bulk_create(
+                [
+                    Post(
+                        title=" ".join(rng.sample(WORDS, 3)),
+                        content="benchmark",
+                        author=author,
+                    )
+                    for _ in range(size)
+                ]
+            )
+            PostTag.objects.bulk_create(
+                [
+                    PostTag(post=post, tag=tag)
+                    for post in posts
+                    for tag in rng.sample(tags, 2)
+                ],
+                ignore_conflicts=True,
+            )
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from user.authentication import auth_settings
+
+
+class Command(BaseCommand):
+    """Django command to delete authentication tokens
+    older than TOKEN_AUTH["EXPIRE_AFTER"]"""
+
+    help = "Delete expired authentication tokens."
+
+    def handle(self, *args, **options):
+        expire_after = auth_settings()["EXPIRE_AFTER"]
+        if expire_after is None:
+            self.stdout.write("Tokens do not expire, nothing to delete.")
+            return
+
+        cutoff = timezone.now() - timedelta(seconds=expire_after)
+        deleted, _ = Token.objects.filter(created__lte=cutoff).delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tokens"))
@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from media.uploads import discard_upload, expired_uploads, upload_settings
+
+
+class Command(BaseCommand):
+    """Django command to delete resumable uploads that were not touched
+    for UPLOADS["EXPIRE_AFTER"] seconds, with their staging files"""
+
+    help = "Delete abandoned chunked uploads."
+
+    def handle(self, *args, **options):
+        deleted = 0
+        for upload in expired_uploads().iterator():
+            discard_upload(upload)
+            deleted += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {deleted} uploads older than "
+                f"{upload_settings()['EXPIRE_AFTER']} seconds"
+            )
+        )
@@ -0,0 +1,132 @@
+import hashlib
+import os
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from media.blobs import references
+from media.models import Blob
+from media.pipeline import IMAGE_FIELDS
+from media.storage import BLOB_DIR, ContentAddressedStorage, blob_name
+
+
+class Command(BaseCommand):
+    """Django command to move existing media files into the
+    content-addressed layout in place, keeping one file per distinct
+    content, and to recount the references of every blob"""
+
+    help = (
+        "Deduplicate the media tree and recount blob references. "
+        "Run it while no uploads are being processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be moved and deleted.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError(
+                "The default storage is not content-addressed."
+            )
+        self.dry_run = options["dry_run"]
+        self.moved = {}
+        self.sizes = {}
+        self.duplicates = 0
+        self.saved_bytes = 0
+        refcounts = Counter()
+
+        for model, field in IMAGE_FIELDS:
+            renditions_field = f"{field}_renditions"
+            rows = (
+                model._base_manager.exclude(**{f"{field}__isnull": True})
+                .exclude(**{field: ""})
+                .values_list("pk", field, renditions_field)
+                .order_by("pk")
+            )
+            for pk, name, renditions in rows.iterator(
+                chunk_size=options["batch_size"]
+            ):
+                new_name = self.store(name)
+                new_renditions = {
+                    image_format: {
+                        width: self.store(rendition)
+                        for width, rendition in by_width.items()
+                    }
+                    for image_format, by_width in (renditions or {}).items()
+                }
+                refcounts.update(references(new_name, new_renditions))
+                changed = (new_name, new_renditions) != (name, renditions)
+                if changed and not self.dry_run:
+                    model._base_manager.filter(pk=pk).update(
+                        **{field: new_name, renditions_field: new_renditions}
+                    )
+
+        if not self.dry_run:
+            self.recount(refcounts, options["batch_size"])
+
+        verb = "Would move" if self.dry_run else "Moved"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {len(self.moved)} files, {self.duplicates} were "
+                f"duplicates ({self.saved_bytes} bytes)"
+            )
+        )
+
+    def store(self, name: str) -> str:
+        """Blob name of a media file, moving the file there if needed"""
+        if name.startswith(f"{BLOB_DIR}/"):
+            return name
+        if name in self.moved:
+            return self.moved[name]
+
+        path = default_storage.path(name)
+        if not os.path.exists(path):
+            self.stderr.write(f"Missing file {name}, left as it is")
+            return name
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(64 * 1024):
+                digest.update(chunk)
+        new_name = blob_name(digest.hexdigest(), name)
+        new_path = default_storage.path(new_name)
+        size = os.path.getsize(path)
+
+        if new_name in self.sizes or os.path.exists(new_path):
+            self.duplicates += 1
+            self.saved_bytes += size
+            if not self.dry_run:
+                os.remove(path)
+        elif not self.dry_run:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(path, new_path)
+
+        self.sizes[new_name] = size
+        self.moved[name] = new_name
+        return new_name
+
+    def recount(self, refcounts: Counter, batch_size: int) -> None:
+        names = list(refcounts)
+        with transaction.atomic():
+            Blob.objects.update(refcount=0)
+            for start in range(0, len(names), batch_size):
+                Blob.objects.bulk_create(
+                    [
+                        Blob(
+                            name=name,
+                            size=self.sizes.get(name, 0),
+                            refcount=refcounts[name],
+                        )
+                        for name in names[start:start + batch_size]
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["name"],
+                    update_fields=["refcount"],
+                )
@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+
+from media.blobs import collect_garbage, gc_settings
+
+
+class Command(BaseCommand):
+    """Django command to delete media files no post or user references"""
+
+    help = "Delete unreferenced media blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=None,
+            help="Seconds a blob must have been unreferenced, "
+            "MEDIA_GC['GRACE_PERIOD'] by default.",
+        )
+
+    def handle(self, *args, **options):
+        grace_period = options["grace_period"]
+        if grace_period is None:
+            grace_period = gc_settings()["GRACE_PERIOD"]
+        deleted = collect_garbage(grace_period)
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} blobs"))
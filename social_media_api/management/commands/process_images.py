@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from media.blobs import collect_garbage, gc_settings
+from media.pipeline import image_settings, process_pending
+
+
+class Command(BaseCommand):
+    """Django command to run the image processing worker"""
+
+    help = "Validate uploaded images and render their renditions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of rendering processes, 0 renders in-process.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling.",
+        )
+
+    def handle(self, *args, **options):
+        config = image_settings()
+        workers = options["workers"]
+        if workers is None:
+            workers = config["WORKERS"]
+
+        executor = ProcessPoolExecutor(workers) if workers else None
+        processed = 0
+        collected_at = time.monotonic()
+        try:
+            while True:
+                close_old_connections()
+                claimed = process_pending(executor)
+                processed += claimed
+                if claimed:
+                    continue
+                if options["once"]:
+                    break
+                if (
+                    time.monotonic() - collected_at
+                    > gc_settings()["INTERVAL"]
+                ):
+                    collect_garbage()
+                    collected_at = time.monotonic()
+                time.sleep(config["POLL_INTERVAL"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Images processed: {processed}"))
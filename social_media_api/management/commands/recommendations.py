@@ -0,0 +1,56 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from user.recommendations import (
+    recommendation_settings,
+    refresh_all,
+    refresh_changed,
+)
+
+
+class Command(BaseCommand):
+    """Django command to compute who-to-follow recommendations. Run it
+    with --full now and then, e.g. nightly, as incremental runs only
+    rescore users whose own follows or likes changed."""
+
+    help = "Store the top friends of friends and co-likers of users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rescore every user instead of users whose edges changed.",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep rescoring changed users every INTERVAL seconds.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of users scored and stored per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["full"]:
+            scored = refresh_all(batch_size)
+        else:
+            scored = refresh_changed(batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Users scored: {scored}"))
+
+        if not options["watch"]:
+            return
+        try:
+            while True:
+                time.sleep(recommendation_settings()["INTERVAL"])
+                close_old_connections()
+                scored = refresh_changed(batch_size)
+                if scored:
+                    self.stdout.write(f"Users scored: {scored}")
+        except KeyboardInterrupt:
+            pass
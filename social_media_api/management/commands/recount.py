@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from post.models import Post, Comment
+
+
+class Command(BaseCommand):
+    """Django command to rebuild denormalized like, comment
+    and follow counters that have drifted"""
+
+    help = "Recalculate counters on posts and users batch by batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows recounted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        fixed_posts = self.recount(
+            Post,
+            batch_size,
+            likes_count=(Post.likes.through, "post_id"),
+            comments_count=(Comment, "post_id"),
+        )
+        self.stdout.write(f"Posts fixed: {fixed_posts}")
+
+        user_model = get_user_model()
+        follows = user_model.follows.through
+        fixed_users = self.recount(
+            user_model,
+            batch_size,
+            followers_count=(follows, "to_user_id"),
+            follows_count=(follows, "from_user_id"),
+        )
+        self.stdout.write(f"Users fixed: {fixed_users}")
+
+        self.stdout.write(self.style.SUCCESS("Counters recalculated!"))
+
+    @staticmethod
+    def count_by(model, key, ids) -> dict[int, int]:
+        """Counts rows of ``model`` grouped by ``key`` for the given ids"""
+        rows = (
+            model.objects.filter(**{f"{key}__in": ids})
+            .order_by()
+            .values(key)
+            .annotate(total=Count("pk"))
+            .values_list(key, "total")
+        )
+        return dict(rows)
+
+    def recount(self, model, batch_size, **counters) -> int:
+        """Walks ``model`` by primary key and rewrites only rows whose
+        stored counters differ from the real ones"""
+        fields = list(counters)
+        last_pk = 0
+        fixed = 0
+
+        while True:
+            batch = list(
+                model.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", *fields)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            ids = [obj.pk for obj in batch]
+
+            totals = {
+                field: self.count_by(source, key, ids)
+                for field, (source, key) in counters.items()
+            }
+            changed = []
+            for obj in batch:
+                stale = False
+                for field in fields:
+                    actual = totals[field].get(obj.pk, 0)
+                    if getattr(obj, field) != actual:
+                        setattr(obj, field, actual)
+                        stale = True
+                if stale:
+                    changed.append(obj)
+
+            if changed:
+                with transaction.atomic():
+                    model.objects.bulk_update(changed, fields)
+                fixed += len(changed)
+
+        return fixed
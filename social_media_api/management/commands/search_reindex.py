@@ -0,0 +1,54 @@
+from django.core.management import BaseCommand
+
+from search.backends import get_backend
+from search.documents import indexed_models
+from search.models import SearchDocument
+
+
+class Command(BaseCommand):
+    """Django command to rebuild search documents of posts,
+    comments and users"""
+
+    help = "Stream searchable rows and reindex them in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of rows fetched and indexed at a time.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete existing documents before reindexing.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        backend = get_backend()
+
+        for model, kind, to_document, fields in indexed_models():
+            if options["clear"]:
+                SearchDocument.objects.filter(kind=kind).delete()
+
+            indexed = 0
+            batch = []
+            # iterator() uses a server-side cursor on PostgreSQL, so rows
+            # are streamed instead of being loaded all at once
+            rows = model.objects.only(*fields).order_by().iterator(
+                chunk_size=batch_size
+            )
+            for obj in rows:
+                batch.append(to_document(obj))
+                if len(batch) == batch_size:
+                    backend.index(batch)
+                    indexed += len(batch)
+                    batch = []
+            if batch:
+                backend.index(batch)
+                indexed += len(batch)
+
+            self.stdout.write(f"Indexed {indexed} {kind} documents")
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt!"))
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+
+from post.models import Post
+from post.timeline import get_timeline, timeline_settings
+
+
+class Command(BaseCommand):
+    """Django command to maintain materialized home timelines"""
+
+    help = "Rebuild home timelines from follows, or trim them to MAX_LENGTH."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=("rebuild", "trim"))
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of timeline owners processed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        users = get_user_model().objects.order_by("pk")
+        last_pk = 0
+        processed = 0
+
+        while True:
+            owner_ids = list(
+                users.filter(pk__gt=last_pk).values_list("pk", flat=True)[
+                    :batch_size
+                ]
+            )
+            if not owner_ids:
+                break
+            last_pk = owner_ids[-1]
+
+            if options["action"] == "rebuild":
+                for owner_id in owner_ids:
+                    self.rebuild(owner_id)
+            get_timeline().trim(owner_ids)
+            processed += len(owner_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Timelines processed: {processed}")
+        )
+
+    @staticmethod
+    def rebuild(owner_id):
+        config = timeline_settings()
+        posts = list(
+            Post.objects.filter(
+                author__followers__id=owner_id,
+                author__followers_count__lt=config["FANOUT_LIMIT"],
+            )
+            .order_by("-created_at", "-id")
+            .only("id", "author_id", "created_at")[: config["MAX_LENGTH"]]
+        )
+        get_timeline().backfill(owner_id, posts)
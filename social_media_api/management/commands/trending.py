@@ -0,0 +1,42 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from post.trending import prune, rank_tags, trending_settings
+
+
+class Command(BaseCommand):
+    """Django command to rank trending tags. Post scores are kept up to
+    date by likes and comments as they happen; this drops the scores
+    that decayed away and ranks tags by the scores of their posts."""
+
+    help = "Drop decayed post scores and rank the trending tags."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep ranking every INTERVAL seconds.",
+        )
+
+    def handle(self, *args, **options):
+        self.refresh()
+        if not options["watch"]:
+            return
+        try:
+            while True:
+                time.sleep(trending_settings()["INTERVAL"])
+                close_old_connections()
+                self.refresh()
+        except KeyboardInterrupt:
+            pass
+
+    def refresh(self):
+        pruned = prune()
+        ranked = rank_tags()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Scores dropped: {pruned}, tags ranked: {ranked}"
+            )
+        )
@@ -1,21 +1,63 @@
+import random
 import time
+
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
-    """Django command to pause execution until db is available"""
+    """Django command to pause execution until db is available. Retries
+    back off exponentially, with jitter, up to ``--max-delay``."""
+
+    help = "Wait until the database accepts connections."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60,
+            help="Seconds to wait before failing, 0 waits forever.",
+        )
+        parser.add_argument(
+            "--initial-delay",
+            type=float,
+            default=0.1,
+            help="Seconds to wait after the first failed attempt.",
+        )
+        parser.add_argument(
+            "--max-delay",
+            type=float,
+            default=5,
+            help="Longest wait between two attempts.",
+        )
+        parser.add_argument("--database", default="default")
 
     def handle(self, *args, **options):
         self.stdout.write("Waiting for database...")
-        db_conn = None
-        while not db_conn:
+        connection = connections[options["database"]]
+        timeout = options["timeout"]
+        deadline = time.monotonic() + timeout
+        delay = options["initial_delay"]
+
+        while True:
             try:
-                connections["default"].ensure_connection()
-                db_conn = True
-            except OperationalError:
-                self.stdout.write("Database unavailable, waiting 1 second...")
-                time.sleep(1)
+                connection.ensure_connection()
+                break
+            except OperationalError as error:
+                remaining = deadline - time.monotonic()
+                if timeout and remaining <= 0:
+                    raise CommandError(
+                        f"Database unavailable after {timeout:g} seconds: "
+                        f"{error}"
+                    )
+                wait = random.uniform(delay / 2, delay)
+                if timeout:
+                    wait = min(wait, remaining)
+                self.stdout.write(
+                    f"Database unavailable, waiting {wait:.2f} seconds..."
+                )
+                time.sleep(wait)
+                delay = min(delay * 2, options["max_delay"])
 
         self.stdout.write(self.style.SUCCESS("Database available!"))
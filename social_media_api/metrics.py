@@ -0,0 +1,452 @@
+"""Per-request performance instrumentation.
+
+``metrics_middleware`` times every request and observes the duration in
+a latency histogram per view action, served in the Prometheus text
+format by ``MetricsView``. A ``SAMPLE_RATE`` share of the requests is
+also instrumented in detail:
+
+* SQL queries, their time and the number of duplicates, i.e. queries
+  repeating the SQL of an earlier query with other parameters, the
+  shape of N+1 lookups. ``record_query`` is installed as an
+  ``execute_wrapper`` on every database connection, so queries of any
+  thread working for the request are counted.
+* Time spent in serializers' ``data``, measured by
+  ``serializer_data()`` in the list and retrieve paths of the views
+  (``TimedListMixin`` and ``TimedRetrieveMixin`` for DRF's generic
+  ones). It includes the queries the serializers run, which are also
+  counted in ``sql``.
+* Time spent rendering the response, measured by the ``Timed*``
+  renderers set in ``DEFAULT_RENDERER_CLASSES``.
+
+Sampled requests report these in a ``Server-Timing`` header, to staff
+users only unless ``SERVER_TIMING`` is ``True``, and, with ``LOG``, as a
+JSON line on the ``social_media_api.metrics`` logger when they are
+slower than ``LOG_MIN_MS`` or ran ``LOG_MIN_DUPLICATES`` duplicate
+queries.
+
+The histograms are kept per worker process. With ``MULTIPROCESS_DIR``
+every worker also writes them to a file of its own there, at most every
+``FLUSH_INTERVAL`` seconds and on exit, and ``exposition()`` serves the
+sum of all the files, so a scrape reaching any worker sees the whole
+server. Files of exited workers are kept, so counters never go back
+when workers are recycled; the directory is emptied when the server
+starts (see ``gunicorn.conf.py``).
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": 1.0,
+    "SERVER_TIMING": "staff",
+    "LOG": False,
+    "LOG_MIN_MS": 0,
+    "LOG_MIN_DUPLICATES": None,
+    "BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "MULTIPROCESS_DIR": None,
+    "FLUSH_INTERVAL": 5,
+}
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def metrics_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "METRICS", {})}
+
+
+class RequestMetrics:
+    """Detailed measurements of one sampled request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def duplicates(self) -> int:
+        return sum(count - 1 for count in self.statements.values())
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        with metrics.lock:
+            metrics.queries += 1
+            metrics.sql_time += elapsed
+            metrics.statements[sql] += 1
+
+
+def install_query_recorder(connection, **kwargs) -> None:
+    """``connection_created`` receiver. The recorder goes first, as
+    ``execute_wrapper()`` blocks pop the last wrapper when they exit."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def install() -> None:
+    """Instruments connections, from ``AppConfig.ready``"""
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(install_query_recorder)
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    atexit.register(flush_metrics)
+
+
+@contextmanager
+def timed(attribute: str):
+    """Adds the time spent in the block to ``attribute`` of the sampled
+    request's metrics"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with metrics.lock:
+            setattr(metrics, attribute, getattr(metrics, attribute) + elapsed)
+
+
+def serializer_data(serializer):
+    """``serializer.data``, timed as the request's serializer time"""
+    with timed("serializer_time"):
+        return serializer.data
+
+
+class TimedListMixin:
+    """``ListModelMixin.list()`` with the serializer's ``data`` timed"""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer_data(serializer))
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer_data(serializer))
+
+
+class TimedRetrieveMixin:
+    """``RetrieveModelMixin.retrieve()`` with the serializer's ``data``
+    timed"""
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer_data(serializer))
+
+
+class TimedRendererMixin:
+    """Adds the time spent in ``render()`` to the sampled request"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("render_time"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total: float, count: int) -> None:
+        """Adds the observations of another histogram with the same
+        buckets"""
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def samples(self):
+        """``(le, cumulative count)`` pairs, ending with ``+Inf``"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f"{bound:g}", total
+        yield "+Inf", self.count
+
+
+_histograms = {}
+_responses = Counter()
+_registry_lock = threading.Lock()
+_flushed_at = 0.0
+
+
+def observe(view: str, method: str, status: int, seconds: float) -> None:
+    config = metrics_settings()
+    with _registry_lock:
+        histogram = _histograms.get((view, method))
+        if histogram is None:
+            histogram = _histograms[(view, method)] = Histogram(
+                config["BUCKETS"]
+            )
+        histogram.observe(seconds)
+        _responses[(view, f"{status // 100}xx")] += 1
+    if (
+        config["MULTIPROCESS_DIR"]
+        and time.monotonic() - _flushed_at >= config["FLUSH_INTERVAL"]
+    ):
+        flush_metrics()
+
+
+def reset_metrics() -> None:
+    with _registry_lock:
+        _histograms.clear()
+        _responses.clear()
+
+
+def snapshot() -> dict:
+    """The registry of this process, as written to its file"""
+    with _registry_lock:
+        return {
+            "histograms": [
+                [view, method, h.counts, h.sum, h.count]
+                for (view, method), h in _histograms.items()
+            ],
+            "responses": [
+                [view, status, count]
+                for (view, status), count in _responses.items()
+            ],
+        }
+
+
+def flush_metrics() -> None:
+    """Writes the registry of this process to its file in
+    ``MULTIPROCESS_DIR``, replacing it atomically"""
+    global _flushed_at
+    directory = metrics_settings()["MULTIPROCESS_DIR"]
+    if not directory:
+        return
+    _flushed_at = time.monotonic()
+    path = Path(directory) / f"metrics-{os.getpid()}.json"
+    temporary = path.with_suffix(".tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary.write_text(json.dumps(snapshot()))
+    os.replace(temporary, path)
+
+
+def collect():
+    """``(histograms, responses)`` of the whole server: the files of
+    every worker in ``MULTIPROCESS_DIR``, or this process without it"""
+    config = metrics_settings()
+    directory = config["MULTIPROCESS_DIR"]
+    if directory:
+        flush_metrics()
+        snapshots = []
+        for path in Path(directory).glob("metrics-*.json"):
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # Replaced or removed while reading
+                continue
+    else:
+        snapshots = [snapshot()]
+
+    histograms = {}
+    responses = Counter()
+    for data in snapshots:
+        for view, method, counts, total, count in data["histograms"]:
+            histogram = histograms.get((view, method))
+            if histogram is None:
+                histogram = histograms[(view, method)] = Histogram(
+                    config["BUCKETS"]
+                )
+            histogram.merge(counts, total, count)
+        for view, status, count in data["responses"]:
+            responses[(view, status)] += count
+    return histograms, responses
+
+
+def label_value(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def exposition() -> str:
+    """The metrics in the Prometheus text format"""
+    histograms, responses = collect()
+    name = "http_request_duration_seconds"
+    lines = [
+        f"# HELP {name} Time to produce a response, by view action.",
+        f"# TYPE {name} histogram",
+    ]
+    for (view, method), histogram in sorted(histograms.items()):
+        labels = f'view="{label_value(view)}",method="{method}"'
+        for le, count in histogram.samples():
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+    name = "http_responses_total"
+    lines += [
+        f"# HELP {name} Responses by view action and status class.",
+        f"# TYPE {name} counter",
+    ]
+    for (view, status), count in sorted(responses.items()):
+        lines.append(
+            f'{name}{{view="{label_value(view)}",status="{status}"}} {count}'
+        )
+    return "\n".join(lines) + "\n"
+
+
+def view_name(request) -> str:
+    """``ViewSet.action`` or ``View.method`` of the resolved view. The
+    path is never used, it would make a label value per object."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    view = getattr(match.func, "cls", None)
+    if view is None:
+        return f"{match.func.__module__}.{match.func.__qualname__}"
+    method = request.method.lower()
+    actions = getattr(match.func, "actions", None) or {}
+    return f"{view.__name__}.{actions.get(method, method)}"
+
+
+def server_timing(total: float, metrics: RequestMetrics) -> str:
+    return ", ".join(
+        (
+            f"total;dur={total * 1000:.1f}",
+            f"sql;dur={metrics.sql_time * 1000:.1f};"
+            f'desc="{metrics.queries} queries, '
+            f'{metrics.duplicates} duplicates"',
+            f"serialize;dur={metrics.serializer_time * 1000:.1f}",
+            f"render;dur={metrics.render_time * 1000:.1f}",
+        )
+    )
+
+
+def shows_server_timing(request, config) -> bool:
+    """The header reveals query counts and timings, so ``"staff"`` sends
+    it to staff users only. DRF sets the user it authenticated on the
+    Django request, which the middleware sees here."""
+    if config["SERVER_TIMING"] == "staff":
+        user = getattr(request, "user", None)
+        return bool(getattr(user, "is_staff", False))
+    return bool(config["SERVER_TIMING"])
+
+
+def log_line(request, response, view, total, metrics) -> None:
+    config = metrics_settings()
+    min_duplicates = config["LOG_MIN_DUPLICATES"]
+    if total * 1000 < config["LOG_MIN_MS"] and (
+        min_duplicates is None or metrics.duplicates < min_duplicates
+    ):
+        return
+    logger.info(
+        json.dumps(
+            {
+                "view": view,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(total * 1000, 2),
+                "queries": metrics.queries,
+                "sql_ms": round(metrics.sql_time * 1000, 2),
+                "duplicate_queries": metrics.duplicates,
+                "serializer_ms": round(metrics.serializer_time * 1000, 2),
+                "render_ms": round(metrics.render_time * 1000, 2),
+            }
+        )
+    )
+
+
+class Measurement:
+    """Measures one request from the middleware"""
+
+    def __init__(self):
+        config = metrics_settings()
+        self.enabled = config["ENABLED"]
+        self.metrics = None
+        self.token = None
+        if self.enabled and random.random() < config["SAMPLE_RATE"]:
+            self.metrics = RequestMetrics()
+            self.token = _current.set(self.metrics)
+        self.started = time.perf_counter()
+
+    def finish(self, request, response):
+        if not self.enabled:
+            return response
+        total = time.perf_counter() - self.started
+        if self.token is not None:
+            _current.reset(self.token)
+
+        view = view_name(request)
+        observe(view, request.method, response.status_code, total)
+
+        if self.metrics is not None:
+            config = metrics_settings()
+            if shows_server_timing(request, config):
+                response["Server-Timing"] = server_timing(total, self.metrics)
+            if config["LOG"]:
+                log_line(request, response, view, total, self.metrics)
+        return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            measurement = Measurement()
+            response = await get_response(request)
+            return measurement.finish(request, response)
+
+    else:
+
+        def middleware(request):
+            measurement = Measurement()
+            response = get_response(request)
+            return measurement.finish(request, response)
+
+    return middleware
@@ -0,0 +1,275 @@
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.db.models import Prefetch, Q
+from django.utils.translation import gettext as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from social_media_api.aio import gather
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a composite, unique ordering key.
+
+    Pages are fetched with ``WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n``
+    instead of ``OFFSET``, so deep pages cost the same as the first one.
+    Cursors are signed, so clients cannot forge arbitrary positions.
+    The total ``count`` can be skipped with ``?count=false``, and the old
+    page-number mode is still served when ``?page=`` is given.
+    """
+
+    page_size = 10
+    max_page_size = 100
+    ordering = ("created_at", "id")
+    # Rows of a paginated sub-resource inlined in its parent, see
+    # ``preview``
+    preview_size = 3
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+    page_query_param = "page"
+
+    invalid_cursor_message = _("Invalid cursor")
+    signing_salt = "social_media_api.pagination.cursor"
+
+    @classmethod
+    def preview(cls, lookup, queryset, to_attr) -> Prefetch:
+        """Prefetches the first ``preview_size`` rows of the sub-resource
+        for every parent, in one windowed query however many parents
+        there are. They are the rows its first page starts with."""
+        return Prefetch(
+            lookup,
+            queryset=queryset.order_by(*cls.ordering)[: cls.preview_size],
+            to_attr=to_attr,
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+
+        self.page_number_paginator = None
+        if self.page_query_param in request.query_params:
+            self.page_number_paginator = self.get_page_number_paginator()
+            return self.page_number_paginator.paginate_queryset(
+                queryset, request, view
+            )
+
+        page, page_size, position, reverse = self.prepare_page(
+            queryset, request
+        )
+        self.count = queryset.count() if self.include_count(request) else None
+        return self.page_results(
+            list(page[: page_size + 1]), page_size, position, reverse
+        )
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, counting and fetching
+        the page concurrently"""
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+
+        self.page_number_paginator = None
+        if self.page_query_param in request.query_params:
+            self.page_number_paginator = self.get_page_number_paginator()
+            return await sync_to_async(
+                self.page_number_paginator.paginate_queryset
+            )(queryset, request, view)
+
+        page, page_size, position, reverse = self.prepare_page(
+            queryset, request
+        )
+        queries = [page[: page_size + 1]]
+        if self.include_count(request):
+            queries.append(queryset.count)
+        results, *count = await gather(*queries)
+        self.count = count[0] if count else None
+        return self.page_results(results, page_size, position, reverse)
+
+    def prepare_page(self, queryset, request):
+        """Returns ``(page_queryset, page_size, position, reverse)``"""
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        if reverse:
+            queryset = queryset.order_by(*self.reversed_ordering())
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        return queryset, page_size, position, reverse
+
+    def page_results(self, results, page_size, position, reverse) -> list:
+        """Trims the ``page_size + 1`` fetched rows to the page and
+        remembers the positions of the next and previous pages"""
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        has_next = has_more if not reverse else True
+        has_previous = position is not None if not reverse else has_more
+
+        self.next_position = (
+            self.get_position(results[-1]) if has_next and results else None
+        )
+        self.previous_position = (
+            self.get_position(results[0]) if has_previous and results else None
+        )
+
+        return results
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+
+        payload = {}
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["next"] = self.get_next_link()
+        payload["previous"] = self.get_previous_link()
+        payload["results"] = data
+
+        return Response(payload)
+
+    def get_page_number_paginator(self) -> PageNumberPagination:
+        paginator = PageNumberPagination()
+        paginator.page_size = self.page_size
+        paginator.max_page_size = self.max_page_size
+        paginator.page_query_param = self.page_query_param
+        paginator.page_size_query_param = self.page_size_query_param
+        return paginator
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def include_count(self, request) -> bool:
+        value = request.query_params.get(self.count_query_param, "true")
+        return value.lower() not in ("0", "false", "no")
+
+    def reversed_ordering(self) -> tuple:
+        return tuple(
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in self.ordering
+        )
+
+    def keyset_filter(self, position, reverse) -> Q:
+        """Expands ``(a, b) > (x, y)`` into ``a > x OR (a = x AND b > y)``,
+        which every database can answer from a composite index"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+
+        return condition
+
+    def get_position(self, obj) -> list[str]:
+        return [
+            obj._meta.get_field(field.lstrip("-")).value_to_string(obj)
+            for field in self.ordering
+        ]
+
+    def encode_cursor(self, position, reverse) -> str:
+        return signing.dumps(
+            {"p": position, "r": reverse},
+            salt=self.signing_salt,
+            compress=True,
+        )
+
+    def decode_cursor(self, request, model):
+        """Returns ``(position, reverse)`` of the requested cursor,
+        ``(None, False)`` for the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = signing.loads(encoded, salt=self.signing_salt)
+            raw_position, reverse = cursor["p"], bool(cursor["r"])
+            if len(raw_position) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, raw_position)
+            ]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position, reverse=False),
+        )
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_cursor(self.previous_position, reverse=True),
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                },
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opaque cursor from a next/previous link",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Pass false to skip the total count",
+                "schema": {"type": "boolean"},
+            },
+            {
+                "name": self.page_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Page number (legacy page-number mode)",
+                "schema": {"type": "integer"},
+            },
+        ]
@@ -0,0 +1,149 @@
+"""Routing of reads to database replicas.
+
+``replica_middleware`` remembers the current request. ``ReplicaRouter``
+then sends the reads of ``GET``/``HEAD``/``OPTIONS`` requests to one of
+``REPLICAS["ALIASES"]``, chosen once per request, and everything else to
+``default``. Reads of models in ``PRIMARY_MODELS`` stay on ``default``
+(authentication must see fresh logins), and so does every read once the
+request wrote anything, or locked rows for writing.
+
+A request that wrote pins its user to ``default`` for ``PIN_SECONDS``, so
+the user reads their own writes while the replicas catch up. Pins are
+kept in the ``CACHE`` alias, which must be shared by all workers.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import LazyObject
+from rest_framework.permissions import SAFE_METHODS
+
+DEFAULTS = {
+    "ALIASES": [],
+    "PIN_SECONDS": 5,
+    "CACHE": "default",
+    "PRIMARY_MODELS": ["authtoken.token", "sessions.session"],
+}
+
+_routing = ContextVar("replica_routing", default=None)
+
+
+def replica_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "REPLICAS", {})}
+
+
+def pin_key(user_id) -> str:
+    return f"replicas:pin:{user_id}"
+
+
+class Routing:
+    """Routing state of one request or ``replica_reads()`` block"""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.wrote = False
+        self.pinned = None
+        self.alias = None
+
+    def user_id(self):
+        """Id of the authenticated user, once known. Until DRF has
+        authenticated the request, ``request.user`` is still the lazy
+        session user, which is not evaluated here."""
+        user = self.request.__dict__.get("user")
+        if user is None or isinstance(user, (LazyObject, AnonymousUser)):
+            return None
+        return user.pk
+
+    def is_pinned(self) -> bool:
+        if self.pinned is None:
+            user_id = self.user_id()
+            if user_id is None:
+                return False
+            cache = caches[replica_settings()["CACHE"]]
+            self.pinned = cache.get(pin_key(user_id)) is not None
+        return self.pinned
+
+    def read_alias(self, model):
+        config = replica_settings()
+        if (
+            self.wrote
+            or not config["ALIASES"]
+            or model._meta.label_lower in config["PRIMARY_MODELS"]
+        ):
+            return None
+        if self.request is not None and (
+            self.request.method not in SAFE_METHODS or self.is_pinned()
+        ):
+            return None
+        if self.alias is None:
+            self.alias = random.choice(config["ALIASES"])
+        return self.alias
+
+    def pin(self) -> None:
+        """Pins the user to ``default`` if the request wrote"""
+        user_id = self.user_id()
+        if self.wrote and user_id is not None:
+            config = replica_settings()
+            caches[config["CACHE"]].set(
+                pin_key(user_id), True, timeout=config["PIN_SECONDS"]
+            )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        return routing.read_alias(model) if routing else None
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+@contextmanager
+def replica_reads():
+    """Sends reads to replicas outside requests, e.g. in batch jobs that
+    tolerate replication lag"""
+    token = _routing.set(Routing())
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            routing = Routing(request)
+            token = _routing.set(routing)
+            try:
+                return await get_response(request)
+            finally:
+                _routing.reset(token)
+                await sync_to_async(routing.pin)()
+
+    else:
+
+        def middleware(request):
+            routing = Routing(request)
+            token = _routing.set(routing)
+            try:
+                return get_response(request)
+            finally:
+                _routing.reset(token)
+                routing.pin()
+
+    return middleware
@@ -40,16 +40,23 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework.authtoken",
     "rest_framework",
     "drf_spectacular",
-    "django_probes"
+    "django_probes",
+    "social_media_api",
+    "media",
     "post",
     "user",
+    "search",
 ]
 
 MIDDLEWARE = [
+    "social_media_api.metrics.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
+    "social_media_api.replicas.replica_middleware",
+    "social_media_api.throttling.rate_limit_headers",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -82,6 +89,11 @@ WSGI_APPLICATION = "social_media_api.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds and checked before
+# reuse. Behind a transaction-pooling PgBouncer (DB_TRANSACTION_POOLING)
+# server-side cursors must be disabled, as they outlive transactions.
+DB_TRANSACTION_POOLING = os.environ.get("DB_TRANSACTION_POOLING") == "true"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -90,9 +102,37 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST"),
         "PORT": os.environ.get("POSTGRES_PORT"),
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "DISABLE_SERVER_SIDE_CURSORS": DB_TRANSACTION_POOLING,
+        "OPTIONS": {
+            "connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", 5)),
+        },
     }
 }
 
+# Read replicas of default, e.g. DB_REPLICA_HOSTS=replica1,replica2.
+# GET requests read from one of them, see social_media_api.replicas.
+REPLICA_HOSTS = [
+    host for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if host
+]
+for number, host in enumerate(REPLICA_HOSTS, 1):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["social_media_api.replicas.ReplicaRouter"]
+
+# Users are pinned to default for PIN_SECONDS after a write, in CACHE,
+# which must be shared by the workers (CACHE_BACKEND=redis)
+REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias.startswith("replica")],
+    "PIN_SECONDS": int(os.environ.get("DB_REPLICA_PIN_SECONDS", 5)),
+    "CACHE": "default",
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -115,18 +155,200 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "social_media_api.throttling.AnonRateThrottle",
+        "social_media_api.throttling.UserRateThrottle",
+        "social_media_api.throttling.ScopedRateThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "100/day", "user": "1000/day"},
+    # Scoped rates apply to views with that ``throttle_scope`` on top of
+    # the user and anonymous rates
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "100/day",
+        "user": "1000/day",
+        "followings": "60/min",
+        "search": "30/min",
+    },
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "user.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # DRF's JSON and browsable renderers, timed for METRICS
+    "DEFAULT_RENDERER_CLASSES": [
+        "social_media_api.metrics.TimedJSONRenderer",
+        "social_media_api.metrics.TimedBrowsableAPIRenderer",
+    ],
 }
 
 AUTH_USER_MODEL = "user.User"
 
+# Throttle counters live in CACHE, which must be shared by the workers
+# (CACHE_BACKEND=redis) for the rates to hold across processes
+THROTTLING = {
+    "CACHE": "default",
+}
+
+# Token lookups are cached per process (LRU_SIZE entries for LRU_TTL
+# seconds) and, when SHARED_CACHE names a cache alias, across workers.
+# Tokens older than EXPIRE_AFTER seconds are rejected and deleted.
+TOKEN_AUTH = {
+    "LRU_SIZE": 10_000,
+    "LRU_TTL": 60,
+    "SHARED_CACHE": os.environ.get("TOKEN_SHARED_CACHE") or None,
+    "SHARED_TTL": 300,
+    # Must be shared by all workers, see user.authentication
+    "REVOCATION_CACHE": "default",
+    "EXPIRE_AFTER": (
+        int(os.environ["TOKEN_EXPIRE_AFTER"])
+        if os.environ.get("TOKEN_EXPIRE_AFTER")
+        else None
+    ),
+}
+
+# Home timelines for the followings feed. Authors with FANOUT_LIMIT or more
+# followers are merged in at read time instead of being pushed on write.
+# Use "post.timeline.RedisTimeline" with OPTIONS {"url": ...} for Redis.
+TIMELINE = {
+    "BACKEND": os.environ.get(
+        "TIMELINE_BACKEND", "post.timeline.DatabaseTimeline"
+    ),
+    "MAX_LENGTH": 800,
+    "FANOUT_LIMIT": 10_000,
+    "BATCH_SIZE": 1000,
+    "OPTIONS": (
+        {"url": os.environ["REDIS_URL"]} if "REDIS_URL" in os.environ else {}
+    ),
+}
+
+
+# Cache backend: locmem (per process), file or redis (shared by workers)
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[os.environ.get("CACHE_BACKEND", "locmem")],
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# Serialized representations of hot read endpoints
+RESPONSE_CACHE = {
+    "ALIAS": "default",
+    "TIMEOUT": 300,
+    "KEY_PREFIX": "repr",
+}
+
+# Async views run the independent queries of a request concurrently, each
+# on a pooled thread with its own connection
+ASYNC_VIEWS = {
+    "CONCURRENT_QUERIES": True,
+}
+
+# Bulk write endpoints accept at most MAX_ITEMS operations per request
+BULK_WRITES = {
+    "MAX_ITEMS": 100,
+}
+
+# Request latency histograms are served at /metrics. SAMPLE_RATE of the
+# requests also count SQL queries and render time, reported in the
+# Server-Timing header of staff users and, with LOG, as JSON lines for
+# requests slower than LOG_MIN_MS or with LOG_MIN_DUPLICATES repeated
+# queries. Workers share the histograms through files in
+# MULTIPROCESS_DIR, set by gunicorn.conf.py; without it /metrics only
+# reports the worker that serves the scrape.
+METRICS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": float(os.environ.get("METRICS_SAMPLE_RATE", 1.0)),
+    "SERVER_TIMING": "staff",
+    "LOG": bool(os.environ.get("METRICS_LOG")),
+    "LOG_MIN_MS": int(os.environ.get("METRICS_LOG_MIN_MS", 0)),
+    "LOG_MIN_DUPLICATES": None,
+    "MULTIPROCESS_DIR": os.environ.get("METRICS_MULTIPROCESS_DIR") or None,
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {
+        "metrics": {"class": "logging.StreamHandler", "formatter": "message"}
+    },
+    "loggers": {
+        "social_media_api.metrics": {
+            "handlers": ["metrics"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
+# Likes, comments and follows are buffered per process, coalesced and
+# written every FLUSH_INTERVAL seconds by a background thread
+NOTIFICATIONS = {
+    "FLUSH_INTERVAL": 2.0,
+    "MAX_PENDING": 1000,
+    "BACKGROUND": True,
+}
+
+# Who-to-follow: ``manage.py recommendations`` stores the TOP_K friends
+# of friends and co-likers (posts with at most MAX_POST_LIKES likes) of
+# every user, or with --watch rescores users whose edges changed every
+# INTERVAL seconds
+RECOMMENDATIONS = {
+    "TOP_K": 20,
+    "FOLLOW_WEIGHT": 1.0,
+    "LIKE_WEIGHT": 0.5,
+    "MAX_POST_LIKES": 1000,
+    "BATCH_SIZE": 500,
+    "INTERVAL": 300,
+}
+
+# Trending posts: likes and comments weigh LIKE_WEIGHT and COMMENT_WEIGHT
+# and halve every HALF_LIFE seconds. ``manage.py trending`` drops scores
+# below MIN_SCORE and ranks the TOP_N tags, every INTERVAL seconds with
+# --watch
+TRENDING = {
+    "HALF_LIFE": 6 * 60 * 60,
+    "LIKE_WEIGHT": 1.0,
+    "COMMENT_WEIGHT": 2.0,
+    "MIN_SCORE": 0.1,
+    "TOP_N": 50,
+    "INTERVAL": 300,
+}
+
+# NDJSON exports read and send CHUNK_SIZE rows at a time
+STREAMING = {
+    "CHUNK_SIZE": 500,
+}
+
+# Uploaded post images and avatars are validated and rendered at WIDTHS
+# in every format of FORMATS by ``manage.py process_images``
+IMAGES = {
+    "WIDTHS": [320, 640, 1280],
+    "FORMATS": ["webp", "jpeg"],
+    "QUALITY": 80,
+    "MAX_PIXELS": 40_000_000,
+    "WORKERS": int(os.environ.get("IMAGE_WORKERS", 2)),
+}
+
+# Resumable chunked uploads, staged under MEDIA_ROOT/STAGING_DIR
+UPLOADS = {
+    "STAGING_DIR": "staging",
+    "MAX_SIZE": 50 * 1024 * 1024,
+    "MAX_DIMENSION": 10_000,
+    "MAX_PIXELS": 40_000_000,
+    "EXPIRE_AFTER": 24 * 60 * 60,
+}
+
+# Full-text search. BACKEND defaults to PostgreSQL ranking on PostgreSQL
+# and to an in-process inverted index on other databases.
+SEARCH = {
+    "BACKEND": None,
+    "OPTIONS": {},
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -142,6 +364,32 @@ USE_TZ = True
 MEDIA_URL = "/media/"
 MEDIA_ROOT = "/vol/web/media"
 
+# Uploaded media is stored once per distinct content, see media.storage
+STORAGES = {
+    "default": {
+        "BACKEND": "media.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# How media files are sent once Django allowed it: "django" streams them
+# with Range support, "x-accel-redirect" hands them to nginx through an
+# internal location serving MEDIA_ROOT at INTERNAL_URL, and "x-sendfile"
+# to Apache or lighttpd
+MEDIA_SERVING = {
+    "MODE": os.environ.get("MEDIA_SERVING_MODE", "django"),
+    "INTERNAL_URL": "/protected-media/",
+}
+
+# Media files nothing references are deleted after GRACE_PERIOD seconds,
+# checked every INTERVAL seconds by the image worker
+MEDIA_GC = {
+    "GRACE_PERIOD": 60 * 60,
+    "INTERVAL": 10 * 60,
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
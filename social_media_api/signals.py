@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after rows were written with ``bulk_create``, which does not send
+# ``post_save``. Receivers get the model as ``sender`` and the written
+# ``instances``.
+bulk_created = Signal()
@@ -0,0 +1,77 @@
+"""Streaming NDJSON exports of large querysets.
+
+Views that offer ``NDJSONRenderer`` serve ``Accept: application/x-ndjson``
+(or ``?format=ndjson``, which DRF then keeps in hyperlinks) as one JSON
+object per line. The rows are read with ``.iterator(chunk_size=...)``
+and encoded chunk by chunk while the response is sent, so memory stays
+flat however many rows there are, instead of holding every row, its dict
+and the whole JSON document at once.
+"""
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULTS = {
+    "CHUNK_SIZE": 500,
+}
+
+
+def streaming_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "STREAMING", {})}
+
+
+def encode_line(data) -> bytes:
+    return json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")
+    ).encode() + b"\n"
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders non-streamed responses, e.g. errors, as NDJSON too"""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        return b"".join(encode_line(row) for row in rows)
+
+
+def wants_ndjson(request) -> bool:
+    renderer = getattr(request, "accepted_renderer", None)
+    return getattr(renderer, "format", None) == NDJSONRenderer.format
+
+
+def ndjson_lines(queryset, serializer, chunk_size: int):
+    """Yields one encoded chunk of ``chunk_size`` rows at a time.
+    Prefetches of the queryset run once per chunk."""
+    lines = []
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        lines.append(encode_line(serializer.to_representation(instance)))
+        if len(lines) == chunk_size:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+
+def ndjson_response(queryset, serializer, chunk_size=None):
+    """Streams ``queryset`` serialized by ``serializer``, an unbound
+    serializer instance with its context"""
+    chunk_size = chunk_size or streaming_settings()["CHUNK_SIZE"]
+    # Rows are read after the view returned, outside of the request's
+    # database routing, so choose the database now
+    queryset = queryset.using(queryset.db)
+    response = StreamingHttpResponse(
+        ndjson_lines(queryset, serializer, chunk_size),
+        content_type=NDJSONRenderer.media_type,
+    )
+    # Proxies would otherwise buffer the export before sending it
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,30 @@
+"""Settings of the test suite.
+
+    DJANGO_SETTINGS_MODULE=social_media_api.test_settings \\
+        python manage.py test
+
+Tests run against PostgreSQL, configured by the same ``POSTGRES_*``
+variables as the app, so full-text search, the trigram index and the
+other PostgreSQL-only paths are exercised. Replica routing is tested
+against ``replica``, a second, empty test database.
+"""
+from social_media_api.settings import *  # noqa: F401, F403
+from social_media_api.settings import (
+    ASYNC_VIEWS,
+    DATABASES,
+    NOTIFICATIONS,
+    REPLICAS,
+)
+
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    "TEST": {"NAME": f"test_{DATABASES['default']['NAME']}_replica"},
+}
+REPLICAS["ALIASES"] = []
+
+# Tests keep one connection, as other connections cannot see the rows
+# a test has not committed
+ASYNC_VIEWS = {**ASYNC_VIEWS, "CONCURRENT_QUERIES": False}
+
+# Tests flush notifications explicitly
+NOTIFICATIONS = {**NOTIFICATIONS, "BACKGROUND": False}
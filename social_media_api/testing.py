@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting how many SQL queries an endpoint may run"""
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int):
+        """Fails if the wrapped block runs more than ``budget`` queries"""
+        with CaptureQueriesContext(connection) as context:
+            yield context
+
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = "\n".join(
+                f"{number}. {query['sql']}"
+                for number, query in enumerate(context.captured_queries, 1)
+            )
+            self.fail(
+                f"{executed} queries executed, budget is {budget}:\n{queries}"
+            )
+
+    def assertConstantQueries(self, request, grow, budget: int):
+        """Runs ``request`` before and after ``grow`` adds more rows and
+        fails if the query count changed or went over ``budget``"""
+        with self.assertQueryBudget(budget) as before:
+            request()
+        grow()
+        with self.assertQueryBudget(budget) as after:
+            request()
+
+        self.assertEqual(
+            len(before.captured_queries),
+            len(after.captured_queries),
+            "Query count depends on the number of rows",
+        )
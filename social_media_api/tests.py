@@ -0,0 +1,349 @@
+import io
+import json
+import re
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from post.indexes import POSTGRES_INDEXES
+from post.models import Post, Tag
+from post.serializers import TagSerializer
+from social_media_api.indexes import create_postgres_indexes
+from social_media_api.metrics import (
+    RequestMetrics,
+    TimedJSONRenderer,
+    _current,
+    reset_metrics,
+    serializer_data,
+    snapshot,
+)
+from social_media_api.replicas import pin_key, replica_reads
+from social_media_api.throttling import (
+    FixedWindowRateThrottle,
+    ScopedRateThrottle,
+    UserRateThrottle,
+    hit,
+)
+
+ENSURE_CONNECTION = (
+    "django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection"
+)
+SLEEP = "social_media_api.management.commands.wait_for_db.time.sleep"
+POST_URL = reverse("post:post-list")
+FOLLOWINGS_URL = reverse("post:post-get-following-posts")
+ASYNC_POST_URL = reverse("post:async-post-list")
+LIKE_URL = "/api/post/posts/{}/like/"
+METRICS_URL = reverse("metrics")
+
+
+class WaitForDbTests(SimpleTestCase):
+    def test_retries_with_exponential_backoff(self):
+        failures = [OperationalError] * 4 + [None]
+        with mock.patch(ENSURE_CONNECTION, side_effect=failures), \
+                mock.patch(SLEEP) as sleep:
+            call_command(
+                "wait_for_db",
+                "--initial-delay=1",
+                "--max-delay=4",
+                stdout=io.StringIO(),
+            )
+
+        waits = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(waits), 4)
+        # Each wait is jittered within the upper half of its delay
+        for wait, delay in zip(waits, [1, 2, 4, 4]):
+            self.assertTrue(delay / 2 <= wait <= delay)
+
+    def test_gives_up_after_timeout(self):
+        with mock.patch(ENSURE_CONNECTION, side_effect=OperationalError):
+            with self.assertRaises(CommandError):
+                call_command(
+                    "wait_for_db",
+                    "--timeout=0.05",
+                    "--initial-delay=0.01",
+                    stdout=io.StringIO(),
+                )
+
+
+class PostgresIndexTests(SimpleTestCase):
+    def test_statements_only_run_on_postgresql(self):
+        for vendor, executed in (
+            ("sqlite", []),
+            ("postgresql", list(POSTGRES_INDEXES)),
+        ):
+            with self.subTest(vendor=vendor):
+                connection = mock.MagicMock(vendor=vendor)
+                with mock.patch(
+                    "social_media_api.indexes.connections",
+                    {"default": connection},
+                ):
+                    create_postgres_indexes(POSTGRES_INDEXES)
+
+                cursor = connection.cursor.return_value.__enter__.return_value
+                self.assertEqual(
+                    [call.args[0] for call in cursor.execute.call_args_list],
+                    executed,
+                )
+
+
+@override_settings(REPLICAS={"ALIASES": ["replica"], "PIN_SECONDS": 60})
+class ReplicaRoutingTests(TestCase):
+    """``replica`` is a second, empty test database: whatever is read
+    from it is missing the rows written to ``default``"""
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = get_user_model().objects.create_user(
+            "viewer@test.com", "password123", username="viewer"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="content", author=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_titles(self, client=None, url=POST_URL):
+        res = (client or self.client).get(url)
+        return [post["title"] for post in res.data["results"]]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.post_titles(), [])
+        self.assertEqual(self.post_titles(url=ASYNC_POST_URL), [])
+
+    def test_writes_pin_the_user_to_primary(self):
+        res = self.client.put(LIKE_URL.format(self.post.id))
+        self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(self.post_titles(), ["Post"])
+
+        other = APIClient()
+        other.force_authenticate(
+            get_user_model().objects.create_user(
+                "other@test.com", "password123", username="other"
+            )
+        )
+        self.assertEqual(self.post_titles(other), [])
+
+    def test_pin_expires(self):
+        self.client.put(LIKE_URL.format(self.post.id))
+        caches["default"].delete(pin_key(self.user.id))
+
+        self.assertEqual(self.post_titles(), [])
+
+    def test_replica_reads_outside_requests(self):
+        self.assertEqual(Post.objects.db, "default")
+        with replica_reads():
+            self.assertEqual(Post.objects.all().db, "replica")
+            self.assertFalse(Post.objects.exists())
+            Post.objects.filter(pk=self.post.pk).update(title="Edited")
+            self.assertEqual(Post.objects.get().title, "Edited")
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.user = get_user_model().objects.create_user(
+            "viewer@test.com", "password123", username="viewer"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        rates = {"anon": "5/min", "user": "5/min", "followings": "2/min"}
+        for throttle in (UserRateThrottle, ScopedRateThrottle):
+            patcher = mock.patch.object(throttle, "THROTTLE_RATES", rates)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_counters_are_per_window(self):
+        cache = caches["default"]
+        self.assertEqual([hit(cache, "k:1", 60) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(hit(cache, "k:2", 60), 1)
+
+    def test_rate_limit_headers_and_429(self):
+        for remaining in range(4, -1, -1):
+            res = self.client.get(POST_URL)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res["RateLimit-Limit"], "5")
+            self.assertEqual(res["RateLimit-Remaining"], str(remaining))
+            self.assertTrue(0 < int(res["RateLimit-Reset"]) <= 60)
+
+        res = self.client.get(POST_URL)
+        self.assertEqual(res.status_code, 429)
+        self.assertIn("Retry-After", res)
+
+    def test_scoped_rate_is_stricter(self):
+        for _ in range(2):
+            res = self.client.get(FOLLOWINGS_URL)
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["RateLimit-Limit"], "2")
+
+        self.assertEqual(self.client.get(FOLLOWINGS_URL).status_code, 429)
+        self.assertEqual(self.client.get(POST_URL).status_code, 200)
+
+    def test_windows_reset_the_count(self):
+        with mock.patch.object(
+            FixedWindowRateThrottle, "timer", return_value=60.0
+        ):
+            for _ in range(5):
+                self.client.get(POST_URL)
+            self.assertEqual(self.client.get(POST_URL).status_code, 429)
+
+        with mock.patch.object(
+            FixedWindowRateThrottle, "timer", return_value=120.0
+        ):
+            self.assertEqual(self.client.get(POST_URL).status_code, 200)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        self.user = get_user_model().objects.create_user(
+            "viewer@test.com", "password123", username="viewer"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            Post.objects.create(
+                title=f"Post {i}", content="", author=self.user
+            )
+
+    def test_queries_and_duplicates_are_recorded(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            for post in Post.objects.all():
+                Post.objects.get(pk=post.pk)
+        finally:
+            _current.reset(token)
+
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicates, 2)
+        self.assertGreater(metrics.sql_time, 0)
+
+    def test_server_timing_header(self):
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.get(POST_URL)
+
+        timing = res["Server-Timing"]
+        self.assertEqual(
+            re.findall(r"(\w+);dur=", timing),
+            ["total", "sql", "serialize", "render"],
+        )
+        self.assertIn('desc="3 queries, 0 duplicates"', timing)
+
+    def test_server_timing_is_only_sent_to_staff(self):
+        self.assertNotIn("Server-Timing", self.client.get(POST_URL))
+        self.assertNotIn("Server-Timing", APIClient().get(POST_URL))
+
+    def test_render_time_is_recorded(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            TimedJSONRenderer().render({"posts": list(range(1000))})
+        finally:
+            _current.reset(token)
+
+        self.assertGreater(metrics.render_time, 0)
+
+    def test_serializer_time_is_recorded(self):
+        Tag.objects.bulk_create(Tag(name=f"tag{i}") for i in range(100))
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            serializer_data(TagSerializer(Tag.objects.all(), many=True))
+        finally:
+            _current.reset(token)
+
+        self.assertGreater(metrics.serializer_time, 0)
+        self.assertEqual(metrics.render_time, 0)
+
+    @override_settings(METRICS={"SAMPLE_RATE": 0})
+    def test_unsampled_requests_are_only_timed(self):
+        res = self.client.get(POST_URL)
+
+        self.assertNotIn("Server-Timing", res)
+        self.user.is_staff = True
+        self.user.save()
+        body = self.client.get(METRICS_URL).content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{view="PostViewSet.list",method="GET"} 1',
+            body,
+        )
+
+    @override_settings(METRICS={"LOG": True, "LOG_MIN_MS": 0})
+    def test_log_line(self):
+        with self.assertLogs("social_media_api.metrics") as logs:
+            self.client.get(POST_URL)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "PostViewSet.list")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["queries"], 3)
+        self.assertGreater(line["serializer_ms"], 0)
+        self.assertIn("render_ms", line)
+
+    @override_settings(
+        METRICS={"LOG": True, "LOG_MIN_MS": 60_000, "LOG_MIN_DUPLICATES": 1}
+    )
+    def test_fast_requests_below_thresholds_are_not_logged(self):
+        with mock.patch("social_media_api.metrics.logger") as logger:
+            self.client.get(POST_URL)
+
+        logger.info.assert_not_called()
+
+    def test_metrics_endpoint(self):
+        self.client.get(POST_URL)
+        self.client.get(POST_URL + "999999/")
+
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+        body = res.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_bucket'
+            '{view="PostViewSet.list",method="GET",le="+Inf"} 1',
+            body,
+        )
+        self.assertIn(
+            'http_responses_total{view="PostViewSet.retrieve",status="4xx"} 1',
+            body,
+        )
+
+    def test_metrics_are_summed_across_workers(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            METRICS={"MULTIPROCESS_DIR": directory}
+        ):
+            self.client.get(POST_URL)
+            # Another worker, recycled since
+            other = Path(directory) / "metrics-1.json"
+            other.write_text(json.dumps(snapshot()))
+            reset_metrics()
+            self.client.get(POST_URL)
+            self.user.is_staff = True
+            self.user.save()
+            body = self.client.get(METRICS_URL).content.decode()
+
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{view="PostViewSet.list",method="GET"} 2',
+            body,
+        )
+        self.assertIn(
+            'http_responses_total{view="PostViewSet.list",status="2xx"} 2',
+            body,
+        )
@@ -0,0 +1,120 @@
+"""Request throttling with counters in a shared cache.
+
+DRF's throttles keep a list of request timestamps per client and rewrite
+it on every request. These throttles count requests in fixed windows
+instead: one counter per client and window, incremented atomically with
+``cache.incr``, so a request costs a single cache operation, plus an
+``add`` on the first request of a window. With a cache shared by the
+workers (``THROTTLING["CACHE"]``), the limits hold across processes.
+
+A client may send up to twice its rate around a window boundary, the
+price of keeping one counter instead of a history.
+
+``rate_limit_headers`` adds ``RateLimit-Limit``, ``RateLimit-Remaining``
+and ``RateLimit-Reset`` of the most restrictive throttle to responses.
+"""
+import math
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework import throttling
+
+DEFAULTS = {
+    "CACHE": "default",
+}
+
+
+def throttle_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "THROTTLING", {})}
+
+
+def hit(cache, key: str, timeout: int) -> int:
+    """Increments the counter ``key``, which expires after ``timeout``
+    seconds, and returns its new value. The expiry is set by the
+    ``add`` that creates the counter; ``incr`` keeps it."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # First request of the window
+        if cache.add(key, 1, timeout=timeout):
+            return 1
+        return cache.incr(key)
+
+
+def record_limit(request, limit, remaining, reset) -> None:
+    """Keeps the rate limit closest to being exhausted for the headers"""
+    request = getattr(request, "_request", request)
+    current = getattr(request, "rate_limit", None)
+    if current is None or remaining < current[1]:
+        request.rate_limit = (limit, remaining, reset)
+
+
+class FixedWindowRateThrottle(throttling.SimpleRateThrottle):
+    @property
+    def cache(self):
+        return caches[throttle_settings()["CACHE"]]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.reset_at = (window + 1) * self.duration
+        count = hit(self.cache, f"{self.key}:{window}", self.duration)
+
+        record_limit(
+            request,
+            self.num_requests,
+            max(self.num_requests - count, 0),
+            math.ceil(self.reset_at - self.now),
+        )
+        return count <= self.num_requests
+
+    def wait(self):
+        return self.reset_at - self.now
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, FixedWindowRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, FixedWindowRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(
+    throttling.ScopedRateThrottle, FixedWindowRateThrottle
+):
+    """Limits views and actions with a ``throttle_scope``, in addition to
+    the user and anonymous rates"""
+
+
+@sync_and_async_middleware
+def rate_limit_headers(get_response):
+    def add_headers(request, response):
+        rate_limit = getattr(request, "rate_limit", None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response["RateLimit-Limit"] = limit
+            response["RateLimit-Remaining"] = remaining
+            response["RateLimit-Reset"] = reset
+        return response
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            return add_headers(request, await get_response(request))
+
+    else:
+
+        def middleware(request):
+            return add_headers(request, get_response(request))
+
+    return middleware
@@ -1,19 +1,29 @@
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from media.views import media_file
 from social_media_api import settings
+from social_media_api.views import CacheStatsView, MetricsView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/doc/", SpectacularAPIView.as_view(), name="schema"),
     path("api/post/", include("post.urls", namespace="post")),
     path("api/user/", include("user.urls", namespace="user")),
+    path("api/search/", include("search.urls", namespace="search")),
+    path("api/media/", include("media.urls", namespace="media")),
+    path("api/cache/stats/", CacheStatsView.as_view(), name="cache-stats"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("api/doc/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/doc/swagger/",
         SpectacularSwaggerView.as_view(url_name="schema"),
         name="swagger-ui",
     ),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(
+        rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>.+)$",
+        media_file,
+        name="media-file",
+    ),
+]
@@ -0,0 +1,27 @@
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from social_media_api.cache import cache_stats
+from social_media_api.metrics import exposition
+
+
+class CacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        """Representation cache hits and misses of this worker"""
+        return Response(cache_stats())
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+    # Scrapers poll, with an admin's token
+    throttle_classes = ()
+
+    def get(self, request):
+        """Request metrics of all workers in the Prometheus text format"""
+        return HttpResponse(
+            exposition(), content_type="text/plain; version=0.0.4"
+        )
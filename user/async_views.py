@@ -0,0 +1,64 @@
+"""Async versions of the follow endpoints, for ASGI deployments"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from post.timeline import follow_author, unfollow_author
+from social_media_api.aio import AsyncAPIView, aget_or_404
+
+
+def follow(user, author) -> None:
+    if user.follow(author):
+        follow_author(user, author)
+
+
+def unfollow(user, author) -> None:
+    if user.unfollow(author):
+        unfollow_author(user, author)
+
+
+class AsyncFollowView(AsyncAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(
+        request=None,
+        responses={
+            status.HTTP_200_OK: {"type": "message"},
+            status.HTTP_400_BAD_REQUEST: {"type": "error"},
+        },
+        methods=["PUT"],
+    )
+    async def put(self, request, pk=None):
+        """The user follows another user, repeating it has no effect"""
+        author = await aget_or_404(get_user_model().objects.all(), pk=pk)
+        if request.user.pk == author.pk:
+            return Response(
+                {"error": "You cannot follow this user."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        await sync_to_async(follow)(request.user, author)
+        return Response(
+            {"message": "User followed successfully."},
+            status=status.HTTP_200_OK,
+        )
+
+    @extend_schema(
+        request=None,
+        responses={status.HTTP_204_NO_CONTENT: None},
+        methods=["DELETE"],
+    )
+    async def delete(self, request, pk=None):
+        """The user unfollows another user, repeating it has no effect"""
+        author = await aget_or_404(get_user_model().objects.all(), pk=pk)
+        if request.user.pk == author.pk:
+            return Response(
+                {"error": "You cannot unfollow this user."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        await sync_to_async(unfollow)(request.user, author)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,173 @@
+"""Token authentication with cached token lookups.
+
+``TokenAuthentication`` runs a ``Token`` join ``User`` query on every
+request. ``CachedTokenAuthentication`` keeps resolved tokens in a bounded
+in-process LRU with a TTL and, optionally, in a shared Django cache.
+
+Deleting a token or deactivating its user evicts it from this process
+and leaves a revocation marker in ``REVOCATION_CACHE``, which every
+LRU hit checks, so the other workers stop accepting it right away too.
+That cache must be shared by the workers (e.g. Redis or Memcached) for
+revocations to reach them.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+DEFAULTS = {
+    "LRU_SIZE": 10_000,
+    "LRU_TTL": 60,
+    "SHARED_CACHE": None,
+    "SHARED_TTL": 300,
+    "REVOCATION_CACHE": "default",
+    "EXPIRE_AFTER": None,
+}
+
+KEY_PREFIX = "auth-token"
+
+
+def auth_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "TOKEN_AUTH", {})}
+
+
+def token_expires_at(token):
+    """Expiry time of a token, ``None`` when tokens do not expire"""
+    expire_after = auth_settings()["EXPIRE_AFTER"]
+    if expire_after is None:
+        return None
+    return token.created + timedelta(seconds=expire_after)
+
+
+def is_token_expired(token) -> bool:
+    expires_at = token_expires_at(token)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+class TokenLRU:
+    """Thread-safe LRU of ``key -> (user, token)`` with a TTL"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > auth_settings()["LRU_TTL"]:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > auth_settings()["LRU_SIZE"]:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_lru = TokenLRU()
+
+
+def shared_cache():
+    alias = auth_settings()["SHARED_CACHE"]
+    return caches[alias] if alias else None
+
+
+def revocation_cache():
+    return caches[auth_settings()["REVOCATION_CACHE"]]
+
+
+def revoked_key(key: str) -> str:
+    return f"{KEY_PREFIX}:revoked:{key}"
+
+
+def evict_token(key: str) -> None:
+    """Forgets a token in this process and in the shared cache, and
+    revokes it in the LRUs of the other workers"""
+    token_lru.discard(key)
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(f"{KEY_PREFIX}:{key}")
+    # Outlives every LRU entry stored before the revocation
+    revocation_cache().set(
+        revoked_key(key), True, timeout=auth_settings()["LRU_TTL"]
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement of ``TokenAuthentication``"""
+
+    def authenticate_credentials(self, key):
+        entry = self.get_cached(key)
+        if entry is None:
+            entry = self.load(key)
+            token_lru.set(key, entry)
+            cache = shared_cache()
+            if cache is not None:
+                cache.set(
+                    f"{KEY_PREFIX}:{key}",
+                    entry,
+                    timeout=auth_settings()["SHARED_TTL"],
+                )
+
+        user, token = entry
+        if is_token_expired(token):
+            self.get_model().objects.filter(key=key).delete()
+            evict_token(key)
+            raise exceptions.AuthenticationFailed(_("Token has expired."))
+
+        # Views may change request.user, keep the cached instance intact
+        return copy.copy(user), token
+
+    @staticmethod
+    def get_cached(key):
+        entry = token_lru.get(key)
+        if entry is not None:
+            if revocation_cache().get(revoked_key(key)):
+                token_lru.discard(key)
+                return None
+            return entry
+
+        cache = shared_cache()
+        if cache is None:
+            return None
+        entry = cache.get(f"{KEY_PREFIX}:{key}")
+        if entry is not None:
+            token_lru.set(key, entry)
+        return entry
+
+    def load(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related("user").get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _("User inactive or deleted.")
+            )
+
+        return token.user, token
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+
+from post.timeline import follow_author, unfollow_author
+from social_media_api.bulk import INVALID, apply_relations, relation_status
+from social_media_api.counters import change_counters, change_many_counters
+
+FOLLOW = "follow"
+UNFOLLOW = "unfollow"
+
+
+def send_follows_changed(user, action, user_ids):
+    if user_ids:
+        m2m_changed.send(
+            sender=get_user_model().follows.through,
+            instance=user,
+            action=action,
+            reverse=False,
+            model=get_user_model(),
+            pk_set=set(user_ids),
+            using=user._state.db,
+        )
+
+
+def bulk_follow(user, operations) -> list[dict]:
+    """Applies ``{"user": id, "action": "follow" | "unfollow"}``
+    operations of ``user``"""
+    targets = get_user_model().objects.in_bulk(
+        [
+            operation["user"]
+            for operation in operations
+            if operation["user"] != user.pk
+        ]
+    )
+    follow, unfollow = set(), set()
+    for operation in operations:
+        if operation["user"] in targets:
+            (follow if operation["action"] == FOLLOW else unfollow).add(
+                operation["user"]
+            )
+
+    with transaction.atomic():
+        followed, unfollowed = apply_relations(
+            get_user_model().follows.through,
+            ("from_user_id", user.pk),
+            follow,
+            unfollow,
+        )
+        if followed or unfollowed:
+            change_counters(
+                get_user_model(),
+                user.pk,
+                follows_count=len(followed) - len(unfollowed),
+            )
+        change_many_counters(get_user_model(), followed, followers_count=1)
+        change_many_counters(
+            get_user_model(), unfollowed, followers_count=-1
+        )
+        send_follows_changed(user, "post_add", followed)
+        send_follows_changed(user, "post_remove", unfollowed)
+
+    for user_id in followed:
+        follow_author(user, targets[user_id])
+    for user_id in unfollowed:
+        unfollow_author(user, targets[user_id])
+
+    return [
+        {
+            **operation,
+            "status": (
+                INVALID
+                if operation["user"] == user.pk
+                else relation_status(
+                    operation["user"], targets, followed, unfollowed
+                )
+            ),
+        }
+        for operation in operations
+    ]
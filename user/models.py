@@ -6,10 +6,14 @@ from django.contrib.auth.models import (
     BaseUserManager,
 )
 from django.contrib.auth.validators import UnicodeUsernameValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
 from django.utils.text import slugify
 from django.utils.translation import gettext as _
 
+from media.models import IMAGE_NONE, IMAGE_STATUS_CHOICES
+from social_media_api.counters import CounterFieldsMixin, change_counters
+
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
@@ -52,7 +56,7 @@ def user_image_file_path(instance, filename):
     return os.path.join("uploads/users/", filename)
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     username_validator = UnicodeUsernameValidator()
 
     email = models.EmailField(_("email address"), unique=True)
@@ -67,6 +71,13 @@ class User(AbstractUser):
         blank=True,
         upload_to=user_image_file_path,
     )
+    avatar_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_NONE,
+        editable=False,
+    )
+    avatar_renditions = models.JSONField(default=dict, editable=False)
     user_info = models.TextField(_("user_info"), max_length=255, null=True)
     birthday = models.DateField(_("birthday"), null=True)
     follows = models.ManyToManyField(
@@ -74,6 +85,10 @@ class User(AbstractUser):
         related_name="followers",
         blank=True,
     )
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    follows_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ("followers_count", "follows_count")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -81,11 +96,135 @@ class User(AbstractUser):
     objects = UserManager()
 
     class Meta:
-        ordering = ("email",)
+        ordering = ("email", "id")
         verbose_name = _("user")
         verbose_name_plural = _("users")
 
-    @property
-    def followers_count(self) -> int:
-        """Calculates and returns the number of users following the current user."""
-        return self.followers.count()
+    def is_following(self, user) -> bool:
+        """Single-row lookup on the unique (from_user, to_user) index"""
+        return User.follows.through.objects.filter(
+            from_user_id=self.pk, to_user_id=user.pk
+        ).exists()
+
+    def follow(self, user) -> bool:
+        """Follows ``user``, returns False if already following.
+        Safe to call concurrently: the unique index decides who wins."""
+        with transaction.atomic():
+            _, created = User.follows.through.objects.get_or_create(
+                from_user_id=self.pk, to_user_id=user.pk
+            )
+            if created:
+                change_counters(User, self.pk, follows_count=1)
+                change_counters(User, user.pk, followers_count=1)
+                self.send_follows_changed("post_add", user)
+        return created
+
+    def unfollow(self, user) -> bool:
+        """Unfollows ``user``, returns False if not following"""
+        with transaction.atomic():
+            deleted, _ = User.follows.through.objects.filter(
+                from_user_id=self.pk, to_user_id=user.pk
+            ).delete()
+            if deleted:
+                change_counters(User, self.pk, follows_count=-1)
+                change_counters(User, user.pk, followers_count=-1)
+                self.send_follows_changed("post_remove", user)
+        return bool(deleted)
+
+    def send_follows_changed(self, action, user):
+        """Rows written straight to the through table do not send
+        signals, notify receivers the same way ``follows.add()`` does"""
+        m2m_changed.send(
+            sender=User.follows.through,
+            instance=self,
+            action=action,
+            reverse=False,
+            model=User,
+            pk_set={user.pk},
+            using=self._state.db,
+        )
+
+
+class Notification(models.Model):
+    """Likes, comments and follows for the recipient. A burst of events
+    on the same post (or follows of the same user) is coalesced into one
+    row: ``actor`` is the latest of ``actor_count`` users."""
+
+    class Verb(models.IntegerChoices):
+        LIKE = 1, "like"
+        COMMENT = 2, "comment"
+        FOLLOW = 3, "follow"
+
+    recipient = models.ForeignKey(
+        User, related_name="notifications", on_delete=models.CASCADE
+    )
+    verb = models.PositiveSmallIntegerField(choices=Verb.choices)
+    actor = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    actor_count = models.PositiveIntegerField(default=1)
+    post = models.ForeignKey(
+        "post.Post",
+        related_name="+",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+    )
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["recipient", "created_at", "id"],
+                name="notification_recipient_idx",
+            ),
+            models.Index(
+                fields=["recipient"],
+                condition=models.Q(read=False),
+                name="notification_unread_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.get_verb_display()} by {self.actor_count} user(s) "
+            f"for {self.recipient_id}"
+        )
+
+
+class Recommendation(models.Model):
+    """A user the recommendations job suggests following, ``rank`` 0
+    being the best"""
+
+    user = models.ForeignKey(
+        User, related_name="recommendations", on_delete=models.CASCADE
+    )
+    candidate = models.ForeignKey(
+        User, related_name="+", on_delete=models.CASCADE
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    mutual_follows = models.PositiveIntegerField(default=0)
+    shared_likes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "rank"], name="unique_recommendation_rank"
+            ),
+        ]
+
+    def __str__(self):
+        return f"User {self.candidate_id} for {self.user_id}"
+
+
+class RecommendationRefresh(models.Model):
+    """A user whose follows or likes changed at ``changed_at``, so
+    their recommendations are recomputed by the next incremental run"""
+
+    user = models.OneToOneField(
+        User, primary_key=True, related_name="+", on_delete=models.CASCADE
+    )
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Refresh recommendations of {self.user_id}"
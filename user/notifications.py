@@ -0,0 +1,212 @@
+"""Coalescing notification buffer.
+
+Likes, comments and follows are not written as they happen. Once their
+transaction commits, ``notify`` adds them to an in-process buffer keyed
+by ``(verb, post or followed user)``, which a background thread flushes
+every ``FLUSH_INTERVAL`` seconds, or as soon as ``MAX_PENDING`` keys are
+waiting. A flush turns every key into one ``Notification`` ("37 people
+liked your post"), after looking up the recipients and dropping events
+whose post or users were deleted. Keys that already have an unread row
+are merged into it with a single ``bulk_update``, the others inserted
+with a single ``bulk_create``. A viral post keeps one unread row,
+updated once per flush instead of written once per like.
+
+Events still in the buffer when a worker is killed are lost; workers
+that exit normally flush first.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from post.models import Post
+from user.models import Notification
+
+DEFAULTS = {
+    "FLUSH_INTERVAL": 2.0,
+    "MAX_PENDING": 1000,
+    "BACKGROUND": True,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def notification_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "NOTIFICATIONS", {})}
+
+
+def build_notifications(pending) -> list[Notification]:
+    """``Notification`` rows of ``{(verb, target_id): {actor_id: time}}``.
+    Actors never notify themselves."""
+    follow = Notification.Verb.FOLLOW
+    post_ids = {target for verb, target in pending if verb != follow}
+    authors = dict(
+        Post.objects.filter(pk__in=post_ids).values_list("id", "author_id")
+    )
+    user_ids = {actor for actors in pending.values() for actor in actors}
+    user_ids.update(target for verb, target in pending if verb == follow)
+    users = set(
+        get_user_model()
+        .objects.filter(pk__in=user_ids)
+        .values_list("id", flat=True)
+    )
+
+    notifications = []
+    for (verb, target), actors in pending.items():
+        if verb == follow:
+            recipient = target if target in users else None
+            post_id = None
+        else:
+            recipient = authors.get(target)
+            post_id = target
+        actors = {
+            actor: at
+            for actor, at in actors.items()
+            if actor != recipient and actor in users
+        }
+        if recipient is None or not actors:
+            continue
+
+        latest = max(actors, key=actors.get)
+        notification = Notification(
+            recipient_id=recipient,
+            verb=verb,
+            actor_id=latest,
+            actor_count=len(actors),
+            post_id=post_id,
+            created_at=actors[latest],
+        )
+        notification.actor_ids = set(actors)
+        notifications.append(notification)
+    return notifications
+
+
+def merge_notifications(notifications) -> None:
+    """Folds every notification into the unread row of its recipient,
+    verb and post, which gets its actors and moves up to its time, and
+    inserts only those without one. Actors are only known per flush: an
+    actor of both is counted once if it is the latest of the row."""
+    if not notifications:
+        return
+    with transaction.atomic():
+        unread = {}
+        rows = (
+            Notification.objects.select_for_update()
+            .filter(
+                Q(post_id__in={n.post_id for n in notifications})
+                | Q(post__isnull=True),
+                recipient_id__in={n.recipient_id for n in notifications},
+                verb__in={n.verb for n in notifications},
+                read=False,
+            )
+            .order_by("created_at", "id")
+        )
+        for row in rows:
+            # The latest, should several be left from before merging
+            unread[(row.recipient_id, row.verb, row.post_id)] = row
+
+        merged, new = [], []
+        for notification in notifications:
+            row = unread.get(
+                (
+                    notification.recipient_id,
+                    notification.verb,
+                    notification.post_id,
+                )
+            )
+            if row is None:
+                new.append(notification)
+                continue
+            row.actor_count += notification.actor_count - (
+                row.actor_id in notification.actor_ids
+            )
+            row.actor_id = notification.actor_id
+            row.created_at = max(row.created_at, notification.created_at)
+            merged.append(row)
+
+        Notification.objects.bulk_update(
+            merged, ["actor", "actor_count", "created_at"]
+        )
+        Notification.objects.bulk_create(new)
+
+
+class NotificationBuffer:
+    """Pending events of this process, coalesced by ``(verb, target)``"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def add(self, verb, target_id, actor_id, at) -> None:
+        config = notification_settings()
+        with self.lock:
+            actors = self.pending.setdefault((verb, target_id), {})
+            # Repeated events of an actor count once, as the latest
+            actors.pop(actor_id, None)
+            actors[actor_id] = at
+            full = len(self.pending) >= config["MAX_PENDING"]
+
+        if config["BACKGROUND"]:
+            self.start()
+            if full:
+                self.wakeup.set()
+        elif full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes the pending notifications, returns how many"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        notifications = build_notifications(pending)
+        merge_notifications(notifications)
+        return len(notifications)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.pending = {}
+
+    def start(self) -> None:
+        """Starts the flushing thread once per process. Threads do not
+        survive the fork of preloaded workers, hence the pid."""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name="notification-flush", daemon=True
+            )
+            self.thread.start()
+            self.pid = os.getpid()
+        atexit.register(self.flush)
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait(notification_settings()["FLUSH_INTERVAL"])
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Notifications could not be written")
+            finally:
+                close_old_connections()
+
+
+buffer = NotificationBuffer()
+
+
+def notify(verb, target_id, actor_id) -> None:
+    """Buffers the event once the current transaction commits"""
+    at = timezone.now()
+    transaction.on_commit(lambda: buffer.add(verb, target_id, actor_id, at))
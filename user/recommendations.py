@@ -0,0 +1,226 @@
+"""Who-to-follow recommendations, computed by a batch job.
+
+Candidates for a user are the users followed by the users they follow
+(friends of friends, one point per mutual follow) and the users who
+liked the same posts (co-likers, ``LIKE_WEIGHT`` per shared post). Posts
+with more than ``MAX_POST_LIKES`` likes say little about taste and are
+skipped. The ``TOP_K`` best candidates of every user are stored as
+``Recommendation`` rows, so reading them is one indexed lookup.
+
+The job loads the edges it needs into CSR adjacency lists held in
+``array``s, 8 bytes per edge, instead of one model instance per edge.
+A full run loads both graphs once and scores every user. Follows and
+likes mark users in ``RecommendationRefresh``; an incremental run only
+loads the edges within two hops of those users and rescores them.
+"""
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from post.models import Post
+from social_media_api.replicas import replica_reads
+from user.models import Recommendation, RecommendationRefresh
+
+DEFAULTS = {
+    "TOP_K": 20,
+    "FOLLOW_WEIGHT": 1.0,
+    "LIKE_WEIGHT": 0.5,
+    "MAX_POST_LIKES": 1000,
+    "BATCH_SIZE": 500,
+    "INTERVAL": 300,
+}
+
+CHUNK_SIZE = 10_000
+
+
+def recommendation_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "RECOMMENDATIONS", {})}
+
+
+class Adjacency:
+    """Directed edges in compressed sparse rows: the neighbours of
+    ``sources[i]`` are ``targets[offsets[i]:offsets[i + 1]]``"""
+
+    def __init__(self, edges):
+        """``edges`` are ``(source, target)`` pairs sorted by source"""
+        self.sources = array("q")
+        self.offsets = array("q", [0])
+        self.targets = array("q")
+        for source, target in edges:
+            if not self.sources or self.sources[-1] != source:
+                if self.sources:
+                    self.offsets.append(len(self.targets))
+                self.sources.append(source)
+            self.targets.append(target)
+        if self.sources:
+            self.offsets.append(len(self.targets))
+
+    def neighbours(self, source):
+        row = bisect_left(self.sources, source)
+        if row == len(self.sources) or self.sources[row] != source:
+            return ()
+        return self.targets[self.offsets[row]:self.offsets[row + 1]]
+
+
+class Graph:
+    """Follow and like edges, in full or within two hops of
+    ``user_ids``"""
+
+    def __init__(self, user_ids=None):
+        follows = get_user_model().follows.through.objects
+        likes = Post.likes.through.objects
+        if user_ids is None:
+            follows, own_likes = follows.all(), likes.all()
+        else:
+            followed = follows.filter(from_user_id__in=user_ids).values(
+                "to_user_id"
+            )
+            follows = follows.filter(
+                Q(from_user_id__in=user_ids) | Q(from_user_id__in=followed)
+            )
+            own_likes = likes.filter(user_id__in=user_ids)
+            likes = likes.filter(post_id__in=own_likes.values("post_id"))
+        max_likes = recommendation_settings()["MAX_POST_LIKES"]
+
+        self.follows = self.load(follows, "from_user_id", "to_user_id")
+        self.likes = self.load(own_likes, "user_id", "post_id")
+        self.likers = self.load(
+            likes.filter(post__likes_count__lte=max_likes),
+            "post_id",
+            "user_id",
+        )
+
+    @staticmethod
+    def load(queryset, source, target) -> Adjacency:
+        return Adjacency(
+            queryset.order_by(source, target)
+            .values_list(source, target)
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+
+    def recommend(self, user_id, excluded, config) -> list[Recommendation]:
+        followed = set(self.follows.neighbours(user_id))
+        mutual = Counter()
+        for followee in followed:
+            mutual.update(self.follows.neighbours(followee))
+        shared = Counter()
+        for post_id in self.likes.neighbours(user_id):
+            shared.update(self.likers.neighbours(post_id))
+
+        scores = {
+            candidate: config["FOLLOW_WEIGHT"] * mutual[candidate]
+            + config["LIKE_WEIGHT"] * shared[candidate]
+            for candidate in mutual.keys() | shared.keys()
+            if candidate != user_id
+            and candidate not in followed
+            and candidate not in excluded
+        }
+        best = heapq.nlargest(
+            config["TOP_K"],
+            scores,
+            key=lambda candidate: (scores[candidate], -candidate),
+        )
+        return [
+            Recommendation(
+                user_id=user_id,
+                candidate_id=candidate,
+                rank=rank,
+                score=scores[candidate],
+                mutual_follows=mutual[candidate],
+                shared_likes=shared[candidate],
+            )
+            for rank, candidate in enumerate(best)
+        ]
+
+
+def store(graph, user_ids, excluded, config) -> None:
+    recommendations = [
+        recommendation
+        for user_id in user_ids
+        for recommendation in graph.recommend(user_id, excluded, config)
+    ]
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=user_ids).delete()
+        Recommendation.objects.bulk_create(recommendations)
+
+
+def inactive_user_ids() -> set:
+    return set(
+        get_user_model()
+        .objects.filter(is_active=False)
+        .order_by()
+        .values_list("id", flat=True)
+    )
+
+
+def refresh_all(batch_size=None) -> int:
+    """Recomputes the recommendations of every active user, returns how
+    many users were scored"""
+    config = recommendation_settings()
+    batch_size = batch_size or config["BATCH_SIZE"]
+    started = timezone.now()
+    with replica_reads():
+        graph = Graph()
+        excluded = inactive_user_ids()
+        user_ids = list(
+            get_user_model()
+            .objects.filter(is_active=True)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    for start in range(0, len(user_ids), batch_size):
+        store(graph, user_ids[start:start + batch_size], excluded, config)
+    RecommendationRefresh.objects.filter(changed_at__lte=started).delete()
+    return len(user_ids)
+
+
+def refresh_changed(batch_size=None) -> int:
+    """Recomputes the recommendations of users whose follows or likes
+    changed, returns how many users were scored"""
+    config = recommendation_settings()
+    batch_size = batch_size or config["BATCH_SIZE"]
+    refreshed = 0
+    last_user_id = 0
+    while True:
+        changes = list(
+            RecommendationRefresh.objects.filter(user_id__gt=last_user_id)
+            .order_by("user_id")
+            .values_list("user_id", "changed_at")[:batch_size]
+        )
+        if not changes:
+            return refreshed
+
+        user_ids = [user_id for user_id, _ in changes]
+        last_user_id = user_ids[-1]
+        with replica_reads():
+            graph = Graph(user_ids)
+            excluded = inactive_user_ids()
+        store(graph, user_ids, excluded, config)
+        # Users that changed again in the meantime stay marked for the
+        # next run
+        done = Q()
+        for user_id, changed_at in changes:
+            done |= Q(user_id=user_id, changed_at=changed_at)
+        RecommendationRefresh.objects.filter(done).delete()
+        refreshed += len(user_ids)
+
+
+def mark_changed(user_ids) -> None:
+    now = timezone.now()
+    RecommendationRefresh.objects.bulk_create(
+        [
+            RecommendationRefresh(user_id=user_id, changed_at=now)
+            for user_id in user_ids
+        ],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["changed_at"],
+    )
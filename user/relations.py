@@ -0,0 +1,108 @@
+"""Relationship status of the viewer with users and posts.
+
+``followed_by_me``, ``follows_me`` and ``liked_by_me`` are resolved for a
+whole page at once, with one query per relation on the unique indexes
+of the through tables, never one query per row. Serializers add them
+with ``?relations=true``.
+
+They differ per viewer, while the representation cache is shared by
+all viewers: cached endpoints add them to the cached data on the way
+out (see ``CachedResponseMixin.cached_response``) and never store them.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Manager
+from rest_framework import serializers
+
+from post.models import Post
+
+RELATIONS_PARAM = "relations"
+
+
+def wants_relations(request) -> bool:
+    value = request.query_params.get(RELATIONS_PARAM, "")
+    return value.lower() in ("1", "true", "yes")
+
+
+class Relations:
+    """Relations of ``viewer`` with a page of users and posts"""
+
+    def __init__(self, viewer, user_ids=(), post_ids=()):
+        self.followed = self.follows_viewer = self.liked = set()
+        if not viewer.is_authenticated:
+            return
+
+        follows = get_user_model().follows.through.objects
+        user_ids, post_ids = set(user_ids), set(post_ids)
+        if user_ids:
+            self.followed = set(
+                follows.filter(
+                    from_user_id=viewer.pk, to_user_id__in=user_ids
+                ).values_list("to_user_id", flat=True)
+            )
+            self.follows_viewer = set(
+                follows.filter(
+                    from_user_id__in=user_ids, to_user_id=viewer.pk
+                ).values_list("from_user_id", flat=True)
+            )
+        if post_ids:
+            self.liked = set(
+                Post.likes.through.objects.filter(
+                    user_id=viewer.pk, post_id__in=post_ids
+                ).values_list("post_id", flat=True)
+            )
+
+    def user(self, user_id) -> dict:
+        return {
+            "followed_by_me": user_id in self.followed,
+            "follows_me": user_id in self.follows_viewer,
+        }
+
+    def post(self, post_id, author_id) -> dict:
+        """``followed_by_me`` and ``follows_me`` are about the author"""
+        return {"liked_by_me": post_id in self.liked, **self.user(author_id)}
+
+
+def personalize_post(viewer):
+    """``personalize`` of cached post representations, which only link
+    to their author"""
+
+    def personalize(data):
+        author_id = (
+            Post.objects.filter(pk=data["id"])
+            .values_list("author_id", flat=True)
+            .first()
+        )
+        relations = Relations(viewer, [author_id], [data["id"]])
+        return {**data, **relations.post(data["id"], author_id)}
+
+    return personalize
+
+
+class RelationsListSerializer(serializers.ListSerializer):
+    """Resolves the relations of the whole page before its rows"""
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, Manager) else data)
+        if self.child.context.get("relations"):
+            self.child.relations = self.child.load_relations(rows)
+        return super().to_representation(rows)
+
+
+class ViewerRelationsMixin:
+    """Adds the viewer's relations with each row when the serializer
+    context has ``relations``"""
+
+    relations = None
+
+    def load_relations(self, rows) -> Relations:
+        raise NotImplementedError
+
+    def relations_of(self, instance, relations) -> dict:
+        raise NotImplementedError
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get("relations"):
+            relations = self.relations or self.load_relations([instance])
+            data.update(self.relations_of(instance, relations))
+        return data
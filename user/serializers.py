@@ -2,6 +2,16 @@ from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers, exceptions
 from django.utils.translation import gettext as _
 
+from media.serializers import SrcsetField
+from social_media_api.bulk import BulkOperationsSerializer
+from user.bulk import FOLLOW, UNFOLLOW
+from user.models import Notification, Recommendation
+from user.relations import (
+    Relations,
+    RelationsListSerializer,
+    ViewerRelationsMixin,
+)
+
 
 class AuthTokenSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -30,6 +40,8 @@ class AuthTokenSerializer(serializers.Serializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    avatar_srcset = SrcsetField(source="avatar_renditions")
+
     class Meta:
         model = get_user_model()
         fields = (
@@ -37,12 +49,14 @@ class UserSerializer(serializers.ModelSerializer):
             "email",
             "username",
             "avatar",
+            "avatar_status",
+            "avatar_srcset",
             "user_info",
             "birthday",
             "password",
             "is_staff",
         )
-        read_only_fields = ("is_staff",)
+        read_only_fields = ("is_staff", "avatar_status")
         extra_kwargs = {"password": {"write_only": True, "min_length": 5}}
 
     def create(self, validated_data):
@@ -60,18 +74,46 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserRelationsMixin(ViewerRelationsMixin):
+    def load_relations(self, rows):
+        return Relations(
+            self.context["request"].user, user_ids=[user.pk for user in rows]
+        )
+
+    def relations_of(self, user, relations):
+        return relations.user(user.pk)
+
+
+class UserSummarySerializer(UserRelationsMixin, serializers.ModelSerializer):
+    """A row of the followers, follows and likes sub-resources"""
+
+    url = serializers.HyperlinkedIdentityField(view_name="user:manage")
+
+    class Meta:
+        model = get_user_model()
+        fields = ("id", "url", "username")
+        list_serializer_class = RelationsListSerializer
+
+
+class UserListSerializer(UserRelationsMixin, serializers.ModelSerializer):
+    """``follows`` and ``followers`` are the first few of them, see
+    ``users_with_relations``, with their totals in the counts"""
+
     follows = serializers.HyperlinkedRelatedField(
+        source="preview_follows",
         view_name="user:manage",
         read_only=True,
         many=True,
     )
     followers = serializers.HyperlinkedRelatedField(
+        source="preview_followers",
         view_name="user:manage",
         read_only=True,
         many=True,
     )
     followers_count = serializers.IntegerField(read_only=True)
+    follows_count = serializers.IntegerField(read_only=True)
+    avatar_srcset = SrcsetField(source="avatar_renditions")
 
     class Meta:
         model = get_user_model()
@@ -80,9 +122,64 @@ class UserListSerializer(serializers.ModelSerializer):
             "email",
             "username",
             "avatar",
+            "avatar_status",
+            "avatar_srcset",
             "user_info",
             "birthday",
             "follows",
             "followers",
             "followers_count",
+            "follows_count",
+        )
+        list_serializer_class = RelationsListSerializer
+
+
+class FollowOperationSerializer(serializers.Serializer):
+    target_field = "user"
+
+    user = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=(FOLLOW, UNFOLLOW))
+
+    class Meta:
+        list_serializer_class = BulkOperationsSerializer
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    verb = serializers.CharField(source="get_verb_display", read_only=True)
+    actor = serializers.HyperlinkedRelatedField(
+        view_name="user:manage",
+        read_only=True,
+    )
+
+    class Meta:
+        model = Notification
+        fields = (
+            "id",
+            "verb",
+            "actor",
+            "actor_count",
+            "post",
+            "read",
+            "created_at",
+        )
+        read_only_fields = fields
+
+
+class RecommendationSerializer(serializers.ModelSerializer):
+    user = serializers.HyperlinkedRelatedField(
+        source="candidate",
+        view_name="user:manage",
+        read_only=True,
+    )
+    username = serializers.CharField(source="candidate.username")
+
+    class Meta:
+        model = Recommendation
+        fields = (
+            "user",
+            "username",
+            "score",
+            "mutual_follows",
+            "shared_likes",
         )
+        read_only_fields = fields
@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from media.pipeline import image_processed, register_image_field
+from social_media_api.cache import invalidate
+from user.authentication import evict_token
+from user.models import Notification
+from user.notifications import notify
+from user.recommendations import mark_changed
+
+register_image_field(get_user_model(), "avatar")
+
+# Fields of the user copy held by cached tokens that authorization uses
+TOKEN_AUTH_FIELDS = ("is_active", "is_staff", "is_superuser", "password")
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user(sender, instance, **kwargs):
+    invalidate(f"user:{instance.pk}")
+
+
+@receiver(m2m_changed, sender=get_user_model().follows.through)
+def invalidate_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if pk_set is None:
+        pk_set = set(
+            instance.followers.values_list("id", flat=True)
+            if reverse
+            else instance.follows.values_list("id", flat=True)
+        )
+    invalidate(
+        f"user:{instance.pk}", *(f"user:{user_id}" for user_id in pk_set)
+    )
+
+
+@receiver(m2m_changed, sender=get_user_model().follows.through)
+def notify_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add":
+        return
+    for user_id in pk_set:
+        if reverse:
+            notify(Notification.Verb.FOLLOW, instance.pk, user_id)
+        else:
+            notify(Notification.Verb.FOLLOW, user_id, instance.pk)
+
+
+@receiver(m2m_changed, sender=get_user_model().follows.through)
+def mark_follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Followers' recommendations depend on whom they follow"""
+    if action in ("post_add", "post_remove"):
+        mark_changed(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    evict_token(instance.key)
+
+
+@receiver(pre_save, sender=get_user_model())
+def detect_auth_change(
+    sender, instance, using, update_fields=None, **kwargs
+):
+    """Flags saves that change ``TOKEN_AUTH_FIELDS``, comparing them to
+    the stored row on the primary"""
+    instance._auth_changed = False
+    if instance._state.adding or instance.pk is None:
+        return
+    # Logins and profile updates often name fields none of which matter
+    if update_fields and not set(TOKEN_AUTH_FIELDS).intersection(
+        update_fields
+    ):
+        return
+    stored = (
+        sender._default_manager.using(using)
+        .filter(pk=instance.pk)
+        .values_list(*TOKEN_AUTH_FIELDS)
+        .first()
+    )
+    instance._auth_changed = stored is not None and stored != tuple(
+        getattr(instance, field) for field in TOKEN_AUTH_FIELDS
+    )
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_tokens(sender, instance, created, **kwargs):
+    """Cached tokens hold a copy of the user, which is stale once it was
+    e.g. deactivated, lost staff status or changed its password"""
+    if created or not getattr(instance, "_auth_changed", False):
+        return
+    for key in Token.objects.filter(user_id=instance.pk).values_list(
+        "key", flat=True
+    ):
+        evict_token(key)
+
+
+@receiver(image_processed, sender=get_user_model())
+def invalidate_processed_avatar(sender, object_id, **kwargs):
+    invalidate(f"user:{object_id}")
@@ -1,3 +1,634 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from post.bulk import bulk_comment, bulk_like
+from post.models import Post
+from social_media_api.testing import QueryBudgetMixin
+from user.authentication import TokenLRU
+from user.models import Notification, Recommendation, RecommendationRefresh
+from user.notifications import buffer
+from user.recommendations import Adjacency, refresh_all, refresh_changed
+
+USER_LIST_URL = reverse("user:list")
+ME_URL = reverse("user:user-me")
+LOGIN_URL = reverse("user:login")
+LOGOUT_URL = reverse("user:logout")
+BULK_FOLLOW_URL = reverse("user:follow-bulk")
+NOTIFICATIONS_URL = reverse("user:notifications")
+NOTIFICATIONS_READ_URL = reverse("user:notifications-read")
+RECOMMENDATIONS_URL = reverse("user:recommendations")
+RELATIONS_URL = reverse("user:relations")
+
+
+def manage_url(user_id):
+    return reverse("user:manage", args=[user_id])
+
+
+def followers_url(user_id):
+    return reverse("user:followers", args=[user_id])
+
+
+def follows_url(user_id):
+    return reverse("user:follows", args=[user_id])
+
+
+def sample_user(email, **params):
+    return get_user_model().objects.create_user(
+        email, "password123", username=email.split("@")[0], **params
+    )
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_users(self, number):
+        for i in range(number):
+            other = sample_user(f"user{i}@test.com")
+            other.follows.add(self.user)
+            self.user.follows.add(other)
+
+    def test_user_list_query_count_is_constant(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(USER_LIST_URL),
+            lambda: self.add_users(5),
+            budget=4,
+        )
+
+    def test_manage_user_query_count_is_constant(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(manage_url(self.user.id)),
+            lambda: self.add_users(5),
+            budget=3,
+        )
+
+
+class ManageUserCacheTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.other = sample_user("other@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_follow_invalidates_both_profiles(self):
+        self.client.get(manage_url(self.user.id))
+        self.client.get(manage_url(self.other.id))
+
+        self.client.post(reverse("user:follow", args=[self.other.id]))
+
+        me = self.client.get(manage_url(self.user.id))
+        other = self.client.get(manage_url(self.other.id))
+        self.assertEqual(me.data["follows_count"], 1)
+        self.assertEqual(other.data["followers_count"], 1)
+
+    def test_profile_update_invalidates_cache(self):
+        self.client.get(manage_url(self.user.id))
+
+        self.client.patch(manage_url(self.user.id), {"username": "renamed"})
+
+        res = self.client.get(manage_url(self.user.id))
+        self.assertEqual(res.data["username"], "renamed")
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_token_lookup_is_cached(self):
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get(ME_URL)
+
+        self.client.delete(LOGOUT_URL)
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_deactivation_invalidates_cached_token(self):
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_password_change_evicts_cached_token(self):
+        self.user.set_password("changed123")
+        with mock.patch("user.signals.evict_token") as evict_token:
+            self.user.save()
+
+        evict_token.assert_called_once_with(self.token.key)
+
+    def test_profile_save_keeps_cached_token(self):
+        self.user.user_info = "Changed"
+        with mock.patch("user.signals.evict_token") as evict_token:
+            self.user.save()
+            self.user.save(update_fields=["last_login"])
+
+        evict_token.assert_not_called()
+
+    def test_revocation_reaches_other_workers(self):
+        workers = [TokenLRU(), TokenLRU()]
+        for worker in workers:
+            with mock.patch("user.authentication.token_lru", worker):
+                self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        with mock.patch("user.authentication.token_lru", workers[0]):
+            self.client.delete(LOGOUT_URL)
+        with mock.patch("user.authentication.token_lru", workers[1]):
+            self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    @override_settings(TOKEN_AUTH={"EXPIRE_AFTER": 60})
+    def test_expired_token_is_rejected_and_rotated_on_login(self):
+        Token.objects.filter(pk=self.token.pk).update(
+            created=self.token.created - timedelta(minutes=5)
+        )
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        self.assertFalse(Token.objects.filter(pk=self.token.pk).exists())
+
+        res = APIClient().post(
+            LOGIN_URL,
+            {"email": "viewer@test.com", "password": "password123"},
+        )
+        self.assertNotEqual(res.data["token"], self.token.key)
+
+
+class IdempotentFollowTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.other = sample_user("other@test.com")
+        self.url = reverse("user:follow", args=[self.other.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_profile_update_keeps_concurrent_follows(self):
+        follower = sample_user("follower@test.com")
+        loaded = get_user_model().objects.get(pk=self.user.pk)
+        follower.follow(self.user)
+
+        loaded.user_info = "edited"
+        loaded.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.user_info, "edited")
+        self.assertEqual(self.user.followers_count, 1)
+
+    def test_repeated_put_follows_once(self):
+        for _ in range(3):
+            res = self.client.put(self.url)
+            self.assertEqual(res.status_code, 200)
+
+        self.other.refresh_from_db()
+        self.assertEqual(self.user.follows.count(), 1)
+        self.assertEqual(self.other.followers_count, 1)
+
+    def test_repeated_delete_unfollows_once(self):
+        self.client.put(self.url)
+        for _ in range(3):
+            res = self.client.delete(self.url)
+            self.assertEqual(res.status_code, 204)
+
+        self.other.refresh_from_db()
+        self.assertFalse(self.user.follows.exists())
+        self.assertEqual(self.other.followers_count, 0)
+
+    def test_post_rejects_second_follow(self):
+        self.assertEqual(self.client.post(self.url).status_code, 201)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+
+    def test_cannot_follow_self(self):
+        url = reverse("user:follow", args=[self.user.id])
+        self.assertEqual(self.client.put(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+
+
+class AsyncFollowTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.other = sample_user("other@test.com")
+        self.url = reverse("user:async-follow", args=[self.other.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        for _ in range(2):
+            self.assertEqual(self.client.put(self.url).status_code, 200)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.followers_count, 1)
+
+        for _ in range(2):
+            self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.followers_count, 0)
+
+    def test_cannot_follow_self_or_missing_user(self):
+        url = reverse("user:async-follow", args=[self.user.id])
+        self.assertEqual(self.client.put(url).status_code, 400)
+        url = reverse("user:async-follow", args=[999])
+        self.assertEqual(self.client.put(url).status_code, 404)
+
+
+class BulkFollowTests(TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.others = [sample_user(f"other{i}@test.com") for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_follow_reports_each_operation(self):
+        first, second, third = self.others
+        self.user.follow(third)
+
+        res = self.client.post(
+            BULK_FOLLOW_URL,
+            [
+                {"user": first.id, "action": "follow"},
+                {"user": second.id, "action": "unfollow"},
+                {"user": third.id, "action": "unfollow"},
+                {"user": self.user.id, "action": "follow"},
+                {"user": 999, "action": "follow"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in res.data["results"]],
+            ["created", "unchanged", "deleted", "invalid", "not_found"],
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.follows_count, 1)
+        counts = dict(
+            get_user_model().objects.values_list("id", "followers_count")
+        )
+        self.assertEqual(
+            [counts[other.id] for other in self.others], [1, 0, 0]
+        )
+        self.assertEqual(
+            list(self.user.follows.values_list("id", flat=True)), [first.id]
+        )
+
+    def test_bulk_follow_invalidates_profiles(self):
+        other = self.others[0]
+        self.client.get(manage_url(other.id))
+
+        self.client.post(
+            BULK_FOLLOW_URL,
+            [{"user": other.id, "action": "follow"}],
+            format="json",
+        )
+
+        res = self.client.get(manage_url(other.id))
+        self.assertEqual(res.data["followers_count"], 1)
+
+
+class NotificationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        buffer.clear()
+        self.author = sample_user("author@test.com")
+        self.post = Post.objects.create(
+            title="Post", content="content", author=self.author
+        )
+        self.fans = [sample_user(f"fan{i}@test.com") for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def flush(self):
+        # Recipients, users, unread rows, update, insert and the
+        # transaction's two statements
+        with self.assertQueryBudget(7):
+            return buffer.flush()
+
+    def test_likes_are_coalesced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                self.post.add_like(fan)
+            self.post.add_like(self.author)
+
+        self.assertEqual(self.flush(), 1)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.recipient, self.author)
+        self.assertEqual(notification.verb, Notification.Verb.LIKE)
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.actor, self.fans[-1])
+        self.assertEqual(notification.post, self.post)
+
+    def test_flushes_merge_into_the_unread_notification(self):
+        for fan in self.fans[:2]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post.add_like(fan)
+            self.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_comment(
+                self.fans[1], [{"post": self.post.pk, "content": "hi"}]
+            )
+            self.fans[0].follow(self.author)
+        self.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_comment(
+                self.fans[1], [{"post": self.post.pk, "content": "again"}]
+            )
+            self.fans[1].follow(self.author)
+        self.flush()
+
+        like, comment, follow = Notification.objects.order_by("verb")
+        self.assertEqual(like.actor_count, 2)
+        self.assertEqual(like.actor, self.fans[1])
+        self.assertEqual(comment.actor_count, 1)
+        self.assertEqual(follow.actor_count, 2)
+        self.assertEqual(follow.actor, self.fans[1])
+
+        Notification.objects.update(read=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.fans[2])
+        self.flush()
+        self.assertEqual(
+            Notification.objects.filter(read=False).get().actor_count, 1
+        )
+
+    def test_nothing_is_buffered_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.post.add_like(self.fans[0])
+
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_comments_and_follows(self):
+        fan = self.fans[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_like(fan, [{"post": self.post.pk, "action": "like"}])
+            bulk_comment(fan, [{"post": self.post.pk, "content": "hi"}] * 2)
+            fan.follow(self.author)
+
+        self.assertEqual(self.flush(), 3)
+        notifications = {
+            notification.get_verb_display(): notification
+            for notification in Notification.objects.filter(
+                recipient=self.author
+            )
+        }
+        self.assertEqual(set(notifications), {"like", "comment", "follow"})
+        self.assertEqual(notifications["comment"].actor_count, 1)
+        self.assertIsNone(notifications["follow"].post)
+
+    def test_events_of_deleted_posts_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.fans[0])
+        self.post.delete()
+
+        self.assertEqual(self.flush(), 0)
+
+    def test_list_with_unread_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_like(self.fans[0])
+        buffer.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                fan.follow(self.author)
+        buffer.flush()
+        sample_user("other@test.com").follow(self.fans[0])
+
+        res = self.client.get(NOTIFICATIONS_URL, {"page_size": 1})
+
+        self.assertEqual(res.data["unread"], 2)
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(res.data["results"][0]["verb"], "follow")
+        self.assertEqual(res.data["results"][0]["actor_count"], 5)
+        res = self.client.get(res.data["next"])
+        self.assertEqual(res.data["results"][0]["verb"], "like")
+
+        res = self.client.post(NOTIFICATIONS_READ_URL)
+        self.assertEqual(res.status_code, 204)
+        res = self.client.get(NOTIFICATIONS_URL)
+        self.assertEqual(res.data["unread"], 0)
+        self.assertTrue(all(item["read"] for item in res.data["results"]))
+
+
+class RecommendationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        users = {
+            name: sample_user(f"{name}@test.com")
+            for name in ("me", "a", "b", "c", "d", "e", "f")
+        }
+        self.users = users
+        self.me = users["me"]
+        self.me.follow(users["a"])
+        self.me.follow(users["b"])
+        users["a"].follow(users["c"])
+        users["a"].follow(users["d"])
+        users["a"].follow(self.me)
+        users["b"].follow(users["c"])
+        post = Post.objects.create(
+            title="Post", content="content", author=users["d"]
+        )
+        for name in ("me", "e", "f"):
+            post.add_like(users[name])
+        users["f"].is_active = False
+        users["f"].save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def recommended(self, user):
+        return list(
+            Recommendation.objects.filter(user=user)
+            .order_by("rank")
+            .values_list("candidate__username", "score")
+        )
+
+    def test_adjacency(self):
+        adjacency = Adjacency([(1, 2), (1, 3), (4, 1)])
+
+        self.assertEqual(list(adjacency.neighbours(1)), [2, 3])
+        self.assertEqual(list(adjacency.neighbours(4)), [1])
+        self.assertEqual(list(adjacency.neighbours(2)), [])
+        self.assertEqual(list(adjacency.offsets), [0, 2, 3])
+
+    def test_friends_of_friends_and_co_likers_are_ranked(self):
+        self.assertEqual(refresh_all(), 6)
+
+        self.assertEqual(
+            self.recommended(self.me), [("c", 2.0), ("d", 1.0), ("e", 0.5)]
+        )
+        self.assertFalse(RecommendationRefresh.objects.exists())
+
+    @override_settings(RECOMMENDATIONS={"TOP_K": 1, "MAX_POST_LIKES": 1})
+    def test_top_k_and_popular_posts(self):
+        refresh_all()
+
+        self.assertEqual(self.recommended(self.me), [("c", 2.0)])
+        self.assertEqual(self.recommended(self.users["e"]), [])
+
+    def test_incremental_refresh_rescores_changed_users(self):
+        refresh_all()
+        self.me.follow(self.users["c"])
+        self.users["e"].follow(self.users["b"])
+
+        # One batch, however many users changed
+        with self.assertQueryBudget(11):
+            self.assertEqual(refresh_changed(), 2)
+
+        self.assertEqual(self.recommended(self.me), [("d", 1.0), ("e", 0.5)])
+        self.assertEqual(
+            self.recommended(self.users["e"]), [("c", 1.0), ("me", 0.5)]
+        )
+        self.assertFalse(RecommendationRefresh.objects.exists())
+
+    def test_endpoint_is_one_indexed_lookup(self):
+        refresh_all()
+        self.me.follow(self.users["d"])
+
+        with self.assertQueryBudget(1):
+            res = self.client.get(RECOMMENDATIONS_URL)
+
+        self.assertEqual([item["username"] for item in res.data], ["c", "e"])
+        self.assertEqual(res.data[0]["mutual_follows"], 2)
+        self.assertEqual(
+            res.data[0]["user"],
+            "http://testserver" + manage_url(self.users["c"].id),
+        )
+
+
+class RelationsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.mutual = sample_user("mutual@test.com")
+        self.followed = sample_user("followed@test.com")
+        self.stranger = sample_user("stranger@test.com")
+        self.user.follow(self.mutual)
+        self.mutual.follow(self.user)
+        self.user.follow(self.followed)
+        self.post = Post.objects.create(
+            title="Post", content="content", author=self.mutual
+        )
+        self.post.add_like(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_lookup_is_one_query_per_relation(self):
+        users = [self.mutual.id, self.followed.id, self.stranger.id]
+        with self.assertQueryBudget(3):
+            res = self.client.get(
+                RELATIONS_URL,
+                {
+                    "users": ",".join(map(str, users)),
+                    "posts": f"{self.post.id},999",
+                },
+            )
+
+        self.assertEqual(
+            res.data["users"],
+            [
+                {"id": self.mutual.id, "followed_by_me": True,
+                 "follows_me": True},
+                {"id": self.followed.id, "followed_by_me": True,
+                 "follows_me": False},
+                {"id": self.stranger.id, "followed_by_me": False,
+                 "follows_me": False},
+            ],
+        )
+        self.assertEqual(
+            res.data["posts"],
+            [
+                {"id": self.post.id, "liked_by_me": True},
+                {"id": 999, "liked_by_me": False},
+            ],
+        )
+
+    def test_invalid_and_too_many_ids(self):
+        res = self.client.get(RELATIONS_URL, {"users": "1,x"})
+        self.assertEqual(res.status_code, 400)
+
+        many = ",".join(str(i) for i in range(1, 102))
+        res = self.client.get(RELATIONS_URL, {"posts": many})
+        self.assertEqual(res.status_code, 400)
+
+    def test_user_list_relations(self):
+        res = self.client.get(USER_LIST_URL, {"relations": "true"})
+
+        relations = {
+            item["username"]: (item["followed_by_me"], item["follows_me"])
+            for item in res.data["results"]
+        }
+        self.assertEqual(
+            relations,
+            {
+                "viewer": (False, False),
+                "mutual": (True, True),
+                "followed": (True, False),
+                "stranger": (False, False),
+            },
+        )
+
+
+class FollowListTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = sample_user("viewer@test.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.others = [sample_user(f"user{i}@test.com") for i in range(5)]
+        for other in self.others:
+            other.follow(self.user)
+        self.user.follow(self.others[0])
+
+    def test_profiles_inline_only_the_first_followers(self):
+        for url in (manage_url(self.user.id), ME_URL):
+            res = self.client.get(url)
+
+            self.assertEqual(res.data["followers_count"], 5)
+            self.assertEqual(len(res.data["followers"]), 3)
+            self.assertEqual(res.data["follows_count"], 1)
+            self.assertEqual(len(res.data["follows"]), 1)
+
+    def test_followers_are_paginated(self):
+        usernames = []
+        url = followers_url(self.user.id) + "?page_size=2&relations=true"
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.data["count"], 5)
+            usernames += [
+                (user["username"], user["followed_by_me"])
+                for user in res.data["results"]
+            ]
+            url = res.data["next"]
+
+        self.assertEqual(
+            usernames,
+            [("user0", True)] + [(f"user{i}", False) for i in range(1, 5)],
+        )
+
+    def test_follows(self):
+        res = self.client.get(follows_url(self.others[1].id))
+
+        self.assertEqual(
+            [user["username"] for user in res.data["results"]], ["viewer"]
+        )
+
+    def test_followers_query_count_is_constant(self):
+        def grow():
+            for i in range(5):
+                sample_user(f"more{i}@test.com").follow(self.user)
+
+        self.assertConstantQueries(
+            lambda: self.client.get(followers_url(self.user.id)),
+            grow,
+            budget=3,
+        )
+
+    def test_missing_user(self):
+        self.assertEqual(self.client.get(followers_url(999)).status_code, 404)
@@ -1,5 +1,6 @@
 from django.urls import path
 
+from user.async_views import AsyncFollowView
 from user.views import (
     CreateTokenView,
     CreateUserView,
@@ -7,7 +8,13 @@ from user.views import (
     UserListView,
     LogoutUserView,
     FollowUserView,
+    BulkFollowView,
     CurrentUserView,
+    FollowListView,
+    NotificationListView,
+    NotificationReadView,
+    RecommendationListView,
+    RelationsView,
 )
 
 urlpatterns = [
@@ -16,8 +23,40 @@ urlpatterns = [
     path("logout/", LogoutUserView.as_view(), name="logout"),
     path("me/", CurrentUserView.as_view(), name="user-me"),
     path("<int:pk>/", ManageUserView.as_view(), name="manage"),
+    path(
+        "<int:pk>/followers/",
+        FollowListView.as_view(relation="followers"),
+        name="followers",
+    ),
+    path(
+        "<int:pk>/follows/",
+        FollowListView.as_view(relation="follows"),
+        name="follows",
+    ),
     path("list/", UserListView.as_view(), name="list"),
     path("follow/<int:pk>/", FollowUserView.as_view(), name="follow"),
+    path("follow/bulk/", BulkFollowView.as_view(), name="follow-bulk"),
+    path(
+        "notifications/",
+        NotificationListView.as_view(),
+        name="notifications",
+    ),
+    path(
+        "notifications/read/",
+        NotificationReadView.as_view(),
+        name="notifications-read",
+    ),
+    path("relations/", RelationsView.as_view(), name="relations"),
+    path(
+        "recommendations/",
+        RecommendationListView.as_view(),
+        name="recommendations",
+    ),
+    path(
+        "async/follow/<int:pk>/",
+        AsyncFollowView.as_view(),
+        name="async-follow",
+    ),
 ]
 
 app_name = "user"
@@ -4,23 +4,63 @@ from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import generics, status
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
+from post.timeline import follow_author, unfollow_author
+from social_media_api.bulk import max_items
+from social_media_api.cache import CachedResponseMixin
+from social_media_api.metrics import TimedListMixin, serializer_data
+from social_media_api.pagination import KeysetPagination
+from user.authentication import is_token_expired
+from user.bulk import bulk_follow
+from user.models import Notification, Recommendation
 from user.permissions import IsOwnerOrReadOnly
+from user.relations import Relations, wants_relations
 from user.serializers import (
     AuthTokenSerializer,
+    FollowOperationSerializer,
+    NotificationSerializer,
+    RecommendationSerializer,
     UserSerializer,
     UserListSerializer,
+    UserSummarySerializer,
 )
 
 
-class UserListPagination(PageNumberPagination):
+class UserListPagination(KeysetPagination):
     page_size = 10
     max_page_size = 100
+    ordering = ("email", "id")
+
+
+class FollowPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
+    ordering = ("id",)
+
+
+class NotificationPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
+def users_with_relations():
+    """Users with the first page of ``follows`` and ``followers``
+    prefetched as bare ids, which is all the hyperlinks in
+    ``UserListSerializer`` need. ``FollowListView`` serves the rest."""
+    user_ids = get_user_model().objects.only("id")
+
+    return get_user_model().objects.prefetch_related(
+        FollowPagination.preview("follows", user_ids, "preview_follows"),
+        FollowPagination.preview(
+            "followers", user_ids, "preview_followers"
+        ),
+    )
 
 
 class FollowUserView(APIView):
@@ -37,42 +77,96 @@ class FollowUserView(APIView):
     def post(self, request, pk=None):
         """The user follows another user"""
         user_to_follow = get_object_or_404(get_user_model(), pk=pk)
-        if (
-                request.user == user_to_follow
-                or user_to_follow in request.user.follows.all()
+        if request.user == user_to_follow or not request.user.follow(
+            user_to_follow
         ):
             return Response(
                 {"error": "You cannot follow this user."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        request.user.follows.add(user_to_follow)
+        follow_author(request.user, user_to_follow)
         return Response(
             {"message": "User followed successfully."},
             status=status.HTTP_201_CREATED
         )
 
+    @extend_schema(
+        request=None,
+        responses={
+            status.HTTP_200_OK: {"type": "message"},
+            status.HTTP_400_BAD_REQUEST: {"type": "error"},
+        },
+        methods=["PUT"],
+    )
+    def put(self, request, pk=None):
+        """The user follows another user, repeating it has no effect"""
+        user_to_follow = get_object_or_404(get_user_model(), pk=pk)
+        if request.user == user_to_follow:
+            return Response(
+                {"error": "You cannot follow this user."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if request.user.follow(user_to_follow):
+            follow_author(request.user, user_to_follow)
+        return Response(
+            {"message": "User followed successfully."},
+            status=status.HTTP_200_OK,
+        )
+
     @extend_schema(
         request=None, responses={status.HTTP_204_NO_CONTENT: None},
         methods=["DELETE"]
     )
     def delete(self, request, pk=None):
-        """The user unfollows another user"""
+        """The user unfollows another user, repeating it has no effect"""
         user_to_unfollow = get_object_or_404(get_user_model(), pk=pk)
-        if (
-                request.user == user_to_unfollow
-                or user_to_unfollow not in request.user.follows.all()
-        ):
+        if request.user == user_to_unfollow:
             return Response(
                 {"error": "You cannot unfollow this user."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        request.user.follows.remove(user_to_unfollow)
-        return Response(
-            {"message": "User unfollowed successfully."},
-            status=status.HTTP_204_NO_CONTENT,
+        if request.user.unfollow(user_to_unfollow):
+            unfollow_author(request.user, user_to_unfollow)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkFollowView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(
+        request=FollowOperationSerializer(many=True),
+        responses={
+            status.HTTP_200_OK: {
+                "type": "object",
+                "properties": {
+                    "results": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {"status": {"type": "string"}},
+                        },
+                    }
+                },
+            }
+        },
+    )
+    def post(self, request):
+        """The user follows and unfollows many users in one transaction,
+        with a result per operation: created, deleted, unchanged,
+        not_found or invalid (the user him/herself)"""
+        serializer = FollowOperationSerializer(
+            data=request.data,
+            many=True,
+            max_length=max_items(),
+            allow_empty=False,
         )
+        serializer.is_valid(raise_exception=True)
+        results = bulk_follow(request.user, serializer.validated_data)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -83,14 +177,26 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
     serializer_class = AuthTokenSerializer
 
+    def post(self, request, *args, **kwargs):
+        """Returns the user's token, replacing it if it has expired"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data["user"]
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and is_token_expired(token):
+            token.delete()
+            token = Token.objects.create(user=user)
+
+        return Response({"token": token.key})
+
 
-class UserListView(generics.ListAPIView):
+class UserListView(TimedListMixin, generics.ListAPIView):
     serializer_class = UserListSerializer
     pagination_class = UserListPagination
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        queryset = get_user_model().objects.all()
+        queryset = users_with_relations()
         username = self.request.query_params.get("username")
 
         if username:
@@ -98,6 +204,11 @@ class UserListView(generics.ListAPIView):
 
         return queryset
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["relations"] = wants_relations(self.request)
+        return context
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -113,18 +224,56 @@ class UserListView(generics.ListAPIView):
         return self.list(request, *args, **kwargs)
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
-    queryset = get_user_model().objects.all()
+class ManageUserView(CachedResponseMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserListSerializer
     permission_classes = (
         IsAuthenticated,
         IsOwnerOrReadOnly,
     )
 
+    def get_queryset(self):
+        return users_with_relations()
+
+    def get_cache_scope(self):
+        return f"user:{self.kwargs['pk']}"
+
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            instance = self.get_object()
+            return serializer_data(self.get_serializer(instance)), None
+
+        return self.cached_response(
+            request, "user-detail", [self.get_cache_scope()], build
+        )
+
 
 class CurrentUserView(ManageUserView):
     def get_object(self):
-        return self.request.user
+        return self.get_queryset().get(pk=self.request.user.pk)
+
+    def get_cache_scope(self):
+        return f"user:{self.request.user.pk}"
+
+
+class FollowListView(TimedListMixin, generics.ListAPIView):
+    """Users following the user, or followed by them, a page at a time"""
+
+    serializer_class = UserSummarySerializer
+    pagination_class = FollowPagination
+    permission_classes = (IsAuthenticated,)
+    # "followers" or "follows"
+    relation = None
+
+    def get_queryset(self):
+        user = get_object_or_404(
+            get_user_model().objects.only("id"), pk=self.kwargs["pk"]
+        )
+        return getattr(user, self.relation).only("id", "username")
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["relations"] = wants_relations(self.request)
+        return context
 
 
 class LogoutUserView(APIView):
@@ -139,3 +288,115 @@ class LogoutUserView(APIView):
         token = Token.objects.get(user_id=request.user.id)
         token.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class NotificationListView(TimedListMixin, generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    pagination_class = NotificationPagination
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """The user's notifications, newest first, with the number of
+        unread ones"""
+        response = super().list(request, *args, **kwargs)
+        response.data["unread"] = Notification.objects.filter(
+            recipient=request.user, read=False
+        ).count()
+        return response
+
+
+class NotificationReadView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(request=None, responses={status.HTTP_204_NO_CONTENT: None})
+    def post(self, request):
+        """Marks all of the user's notifications as read"""
+        Notification.objects.filter(
+            recipient=request.user, read=False
+        ).update(read=True)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RecommendationListView(TimedListMixin, generics.ListAPIView):
+    serializer_class = RecommendationSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+
+    def get_queryset(self):
+        user = self.request.user
+        followed = get_user_model().follows.through.objects.filter(
+            from_user_id=user.pk
+        ).values("to_user_id")
+
+        return (
+            Recommendation.objects.filter(user=user)
+            .exclude(candidate__in=followed)
+            .select_related("candidate")
+            .order_by("rank")
+        )
+
+    def get(self, request, *args, **kwargs):
+        """Users to follow, best first, from the last recommendations
+        run. Users followed since are left out."""
+        return self.list(request, *args, **kwargs)
+
+
+class RelationsView(APIView):
+    permission_classes = (IsAuthenticated,)
+    # The largest page of users or posts
+    max_ids = 100
+
+    def parse_ids(self, name) -> set[int]:
+        value = self.request.query_params.get(name)
+        if not value:
+            return set()
+        try:
+            ids = {int(id_) for id_ in value.split(",")}
+        except ValueError:
+            raise ValidationError(
+                {name: "Must be a comma separated list of ids."}
+            )
+        if len(ids) > self.max_ids:
+            raise ValidationError(
+                {name: f"No more than {self.max_ids} ids allowed."}
+            )
+        return ids
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "users",
+                type={"type": "list", "items": {"type": "number"}},
+                description="User ids (ex. ?users=4,7)",
+                required=False,
+            ),
+            OpenApiParameter(
+                "posts",
+                type={"type": "list", "items": {"type": "number"}},
+                description="Post ids (ex. ?posts=4,7)",
+                required=False,
+            ),
+        ]
+    )
+    def get(self, request):
+        """Whether the user follows and is followed by each of ?users=,
+        and liked each of ?posts=, with one query per relation"""
+        user_ids = self.parse_ids("users")
+        post_ids = self.parse_ids("posts")
+        relations = Relations(request.user, user_ids, post_ids)
+
+        return Response(
+            {
+                "users": [
+                    {"id": user_id, **relations.user(user_id)}
+                    for user_id in sorted(user_ids)
+                ],
+                "posts": [
+                    {"id": post_id, "liked_by_me": post_id in relations.liked}
+                    for post_id in sorted(post_ids)
+                ],
+            }
+        )